@@ -0,0 +1,90 @@
+# admission.py
+import asyncio
+import logging
+import math
+import time
+from typing import Dict
+
+from algorithm import CostEstimate
+from exceptions import ServiceBusyError, ValidationError
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionController:
+    """
+    Admits generations by their estimated cost before anything is planned.
+
+    A request larger than the per-request caps is refused outright. The others share
+    a budget of output samples rendering at once, of which one client may hold at most
+    `per_client_samples`; a request that does not fit waits up to `timeout` seconds
+    for budget to free up, then gets a ServiceBusyError. A request alone in its budget
+    always fits, so nothing under the per-request caps waits forever.
+    Only used from the event loop.
+    """
+
+    def __init__(self, max_request_samples: int, max_request_hits: int, budget_samples: int,
+                 per_client_samples: int, timeout: float):
+        self.max_request_samples = max_request_samples
+        self.max_request_hits = max_request_hits
+        self.budget_samples = budget_samples
+        self.per_client_samples = per_client_samples
+        self.timeout = timeout
+        self.in_flight = 0
+        self._clients: Dict[str, int] = {}  # client -> samples admitted
+        self._changed = asyncio.Event()
+
+    def check(self, cost: CostEstimate):
+        """Refuse requests that could never be admitted"""
+        if cost.samples > self.max_request_samples:
+            metrics.ADMISSIONS.inc(result="too_large")
+            raise ValidationError(
+                f"Request would render about {cost.samples} samples, the limit is {self.max_request_samples}: "
+                f"lower numOfCycles or raise tempo"
+            )
+        if cost.hits > self.max_request_hits:
+            metrics.ADMISSIONS.inc(result="too_large")
+            raise ValidationError(
+                f"Request would play about {cost.hits} hits, the limit is {self.max_request_hits}: "
+                f"lower numOfCycles or maxSubd"
+            )
+
+    def _fits(self, cost: CostEstimate, client: str) -> bool:
+        held = self._clients.get(client, 0)
+        if held and held + cost.samples > self.per_client_samples:
+            return False
+        return self.in_flight == 0 or self.in_flight + cost.samples <= self.budget_samples
+
+    async def acquire(self, cost: CostEstimate, client: str):
+        """Wait for room for `cost`; every acquire must be followed by one release"""
+        self.check(cost)
+        if not self._fits(cost, client):
+            metrics.ADMISSIONS.inc(result="queued")
+            deadline = time.monotonic() + self.timeout
+            while not self._fits(cost, client):
+                remaining = deadline - time.monotonic()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), max(0.0, remaining))
+                except asyncio.TimeoutError:
+                    metrics.ADMISSIONS.inc(result="rejected")
+                    raise ServiceBusyError(
+                        "Too much audio is being generated, try again shortly",
+                        retry_after=max(1, math.ceil(self.timeout)),
+                    ) from None
+        self.in_flight += cost.samples
+        self._clients[client] = self._clients.get(client, 0) + cost.samples
+        metrics.ADMITTED_SAMPLES.set(self.in_flight)
+        metrics.ADMISSIONS.inc(result="admitted")
+
+    def release(self, cost: CostEstimate, client: str):
+        self.in_flight -= cost.samples
+        held = self._clients.get(client, 0) - cost.samples
+        if held > 0:
+            self._clients[client] = held
+        else:
+            self._clients.pop(client, None)
+        metrics.ADMITTED_SAMPLES.set(self.in_flight)
+        # wake every waiter, each checks whether it fits now
+        self._changed.set()
+        self._changed = asyncio.Event()
@@ -3,13 +3,17 @@ import numpy as np
 import numpy.typing as npt
 import soundfile as sf
 import math
+import functools
 import logging
-import random
 import time
 from typing import List, Tuple, Dict, Optional
-from dataclasses import dataclass
-from sample_manager import sample_manager
+from dataclasses import dataclass, field, replace
+from sample_manager import sample_manager, cross_fade
 from exceptions import AudioGenerationError, ValidationError
+from renderer import EVENT_DTYPE, TiledRenderer, make_events
+from intervals import IntervalIndex
+from metrics import timed_iter
+import derbake
 import threading
 from settings import settings
 
@@ -22,6 +26,26 @@ class GenerationResult:
     tokens: str
     generation_time: float
     num_hits: int
+    stage_times: Dict[str, float] = field(default_factory=dict)
+    events: Optional[npt.NDArray] = None  # the plan that was rendered
+
+@dataclass
+class GenerationPlan:
+    """Every hit of a generation, decided but not rendered yet"""
+    total_length: int
+    events: npt.NDArray
+    tokens: str
+    num_hits: int
+    planning_time: float
+    # seconds per stage, "render" is added once the plan has been rendered
+    stage_times: Dict[str, float] = field(default_factory=dict)
+    sample_rate: int = 48000  # of the event positions and the output
+
+@dataclass
+class CostEstimate:
+    """Size of a generation known before anything is planned"""
+    samples: int  # output length
+    hits: int  # skeleton hits plus every subdivision step, an upper estimate
 
 class ThreadSafeCounter:
     """Thread-safe counter for statistics"""
@@ -39,32 +63,61 @@ class ThreadSafeCounter:
         with self._lock:
             return self._value
 
+class UniformStream:
+    """
+    Uniform [0, 1) floats from a numpy Generator, drawn in blocks: a scalar Generator
+    call costs ~10x a `random` call, too slow for the per-beat and per-hit loops.
+    """
+    def __init__(self, rng: np.random.Generator, block: int = 1024):
+        self._rng = rng
+        self._block = max(1, block)
+        self._values: List[float] = []
+        self._index = 0
+
+    def __call__(self) -> float:
+        if self._index == len(self._values):
+            self._values = self._rng.random(self._block).tolist()
+            self._index = 0
+        value = self._values[self._index]
+        self._index += 1
+        return value
+
+    def uniform(self, low: float, high: float) -> float:
+        return low + (high - low) * self()
+
+    def choice(self, seq):
+        return seq[min(int(self() * len(seq)), len(seq) - 1)]
+
+def weighted_index(weights: npt.NDArray, draws: npt.NDArray) -> npt.NDArray:
+    """Index picked by each uniform [0, 1) draw among non-negative weights"""
+    cdf = np.cumsum(weights) / weights.sum()
+    return np.minimum(np.searchsorted(cdf, draws, side="right"), len(weights) - 1)
+
 class DerboukaGenerator:
     """
     Main generator class with thread-safe operations and improved performance.
     """
     
     SUPPORTED_NOTES = ["D", "OTA", "OTI", "PA2", "S"]
+    AMPLITUDE_BINS = [0.1015, 0.5, 1.0]
     
     def __init__(self):
         self.generation_stats = {
             "total_generations": ThreadSafeCounter(),
             "total_hits": ThreadSafeCounter(),
-            "total_time": 0,
+            "total_time": ThreadSafeCounter(),
             "errors": ThreadSafeCounter()
         }
         self._lock = threading.Lock()
         self.SIZE_OF_CHUNK = 300_000 # around 1.1MB
+        self.renderer = TiledRenderer(self.event_audio, tile_size=self.SIZE_OF_CHUNK)
+
+    def get_amplitudes(self) -> list[float]:
+        """Amplitude bins scaled by the configured volume, the sample bank is built for these"""
+        return [amplitude * settings.AUDIO_VOLUME for amplitude in self.AMPLITUDE_BINS]
 
     def apply_cross_fade(self, hit_y: npt.NDArray, fade_samples:int=500):
-        if len(hit_y) <= fade_samples * 2:
-            fade_samples = max(8, len(hit_y) // 4)
-        fade_in = 0.5 * (1 - np.cos(np.linspace(0, np.pi, fade_samples)))
-        fade_out = 0.5 * (1 + np.cos(np.linspace(0, np.pi, fade_samples)))
-        hit_audio = hit_y.copy()
-        hit_audio[:fade_samples] *= fade_in
-        hit_audio[-fade_samples:] *= fade_out
-        return hit_audio
+        return cross_fade(hit_y, fade_samples)
 
     def get_available_choices(self, current_tempo: float, initial_tempo: float, allowed_tempo_deviation: float) -> list[int]:
         lower = initial_tempo - allowed_tempo_deviation
@@ -78,26 +131,27 @@ class DerboukaGenerator:
             choices.extend([2, 3])
         return choices
 
-    def get_tempos(self, number_of_beats: int, initial_tempo: float, allowed_tempo_deviation: float) -> list[float]:
+    def get_tempos(self, number_of_beats: int, initial_tempo: float, allowed_tempo_deviation: float,
+                   rng: Optional[np.random.Generator] = None, start_tempo: Optional[float] = None) -> list[float]:
         tempos = []
-        current_tempo = initial_tempo
+        # start_tempo continues a drift from an earlier call, deviation stays relative to initial_tempo
+        current_tempo = initial_tempo if start_tempo is None else start_tempo
         i = 0
+        # two draws per beat: the choice and the deviation
+        draws = UniformStream(rng or np.random.default_rng(), block=2 * (math.floor(number_of_beats) + 1))
 
         # for each beat, decide whether to increase, decrease or keep the same tempo as the beat before
         while i <= number_of_beats:
             choices = self.get_available_choices(
                 current_tempo, initial_tempo, allowed_tempo_deviation
             )
-            choice = random.choice(choices)
+            choice = draws.choice(choices)
+            deviation = draws.uniform(
+                0, initial_tempo + allowed_tempo_deviation - current_tempo
+            )
             if choice == 2:  # Increase
-                deviation = random.uniform(
-                    0, initial_tempo + allowed_tempo_deviation - current_tempo
-                )
                 tempos.append(current_tempo + deviation)
             elif choice == 3:  # Decrease
-                deviation = random.uniform(
-                    0, initial_tempo + allowed_tempo_deviation - current_tempo
-                )
                 tempos.append(max(1, current_tempo - deviation))
             else:  # Keep
                 tempos.append(current_tempo)
@@ -105,19 +159,20 @@ class DerboukaGenerator:
 
         return tempos, " ".join([str(i) for i in tempos])
 
-    def get_random_proba_list(self, weights: List):
+    def get_random_proba_list(self, weights: List, draws: UniformStream):
         output = []
         for weight in weights:
-            choice = random.uniform(0, weight)
+            choice = draws.uniform(0, weight)
             output.append(choice)
         return output
 
     def get_deviated_sample(
-    self, start_of_window: int, end_of_window: int, expected_hit_timestamp: int, shift_proba: float
+    self, start_of_window: int, end_of_window: int, expected_hit_timestamp: int, shift_proba: float,
+    draws: UniformStream
         ):
-        if random.random() >= shift_proba:
+        if draws() >= shift_proba:
             return expected_hit_timestamp
-        return int(random.uniform(start_of_window, end_of_window))
+        return int(draws.uniform(start_of_window, end_of_window))
 
     def get_window_by_beat(self, expected_hit_timestamp: int, beat_len: int) -> tuple[int, int]:
         half = int(0.05 * beat_len)
@@ -126,23 +181,86 @@ class DerboukaGenerator:
         return (start_of_window, end_of_window)
 
 
-    def get_audio_metadata(self, hit_type: str) -> Optional[npt.NDArray]:
+    def get_audio_metadata(self, hit_type: str, draws: UniformStream) -> Optional[npt.NDArray]:
         """
         Get audio for a hit type with error handling.
         """
         try:
-            return sample_manager.get_random_sample(hit_type)
+            return sample_manager.get_random_sample(hit_type, draws())
         except Exception as e:
             logger.error(f"Failed to get sample for {hit_type}: {e}")
             return None
 
-    def get_audio_data(self, hit_type:str, sample_number:int, length:int):
-        try:
-            return sample_manager.get_y(hit_type, sample_number, length)
-        except Exception as e:
-            logger.error(f"Mismatched size for {hit_type}:{sample_number}, got length = {length}")
+    def estimate_cost(self, num_cycles: int, bpm: float, maxsubd: int, allowed_tempo_deviation: float,
+                      skeleton: list[tuple[float, str]], matrix: List, sr: int = 48000) -> CostEstimate:
+        """
+        Predict the size of a generation in O(len(skeleton)), without drawing anything.
+        get_tempos wanders within about bpm +/- deviation, so beats are taken to last
+        the mean beat length of a tempo uniform over that range, which matches the
+        slow end of what the walk actually produces.
+        """
+        num_of_beats = num_cycles * sum(float(x[0]) for x in skeleton)
+        deviation = abs(allowed_tempo_deviation)
+        slowest, fastest = max(1.0, bpm - deviation), bpm + deviation
+        if fastest - slowest > 1e-9:
+            beat_length_in_samples = 60 * sr * math.log(fastest / slowest) / (fastest - slowest)
+        else:
+            beat_length_in_samples = 60 * sr / bpm
+        longest_hit = max((length for _, length in sample_manager.BANK_SLOTS.values()), default=sr)
+        # the last hit may be shifted by up to 5% of a beat and rings for its whole sample
+        samples = math.ceil((num_of_beats + 0.05) * beat_length_in_samples) + longest_hit
+
+        # every beat of the output gets one subdivision of maxsubd - index steps, drawn by matrix[0]
+        weights = [max(0.0, float(w)) for w in matrix[0]] if matrix else []
+        mean_divisions = (
+            sum(w * (maxsubd - i) for i, w in enumerate(weights)) / sum(weights) if sum(weights) else 0
+        )
+        subdivision_beats = math.ceil(samples / beat_length_in_samples)
+        hits = num_cycles * len(skeleton) + math.ceil(subdivision_beats * mean_divisions)
+        return CostEstimate(samples=samples, hits=hits)
+
+    def estimate_replay_cost(self, record: derbake.Derbake, sr: int = 48000) -> CostEstimate:
+        """
+        Bound the size of replaying a .derbake from its tempos and row counts, in
+        O(len(record)) and before anything is placed: every skeleton beat is taken at
+        the slowest recorded tempo, plus the latest deviation and the longest sample.
+        """
+        tempos = np.asarray(record.tempos, dtype=np.float64)
+        if len(tempos) == 0 or not np.all(np.isfinite(tempos) & (tempos > 0)):
+            raise ValidationError("Cannot replay: tempos must be positive")
+        delays = np.asarray(record.skeleton["delay"], dtype=np.float64)
+        if not np.all(np.isfinite(delays)):
+            raise ValidationError("Cannot replay: delays must be finite")
+        beats = float(np.abs(delays).sum())
+        latest = max(0, int(record.skeleton["dev"].max())) if len(record.skeleton) else 0
+        longest_hit = max((length for _, length in sample_manager.BANK_SLOTS.values()), default=sr)
+        samples = math.ceil(beats * 60 * sr / float(tempos.min())) + latest + longest_hit
+        return CostEstimate(samples=samples, hits=len(record.skeleton) + len(record.variations))
+
+    def grid_length(self, skeleton: list[tuple[float, str]], num_cycles: int, tempos: list[float], sr: int = 48000) -> int:
+        """
+        Samples from the start to the last expected skeleton hit, the beat grid of
+        get_exact_length without deviations: where the next cycle's grid would start.
+        """
+        current_tempo = tempos[0]
+        beat_length_in_samples = int((60/current_tempo) * sr)
+        num_of_beats_in_audio = num_cycles * sum(x[0] for x in skeleton)
+        expected_hit_timestamp = 0
+        curr_beat = i = 0
+        tempo_index = 0
+        while curr_beat < num_of_beats_in_audio:
+            beat_duration = skeleton[i % len(skeleton)][0]
+            curr_beat += beat_duration
+            if int(curr_beat) > tempo_index and int(curr_beat) < len(tempos):
+                tempo_index = int(curr_beat)
+                current_tempo = tempos[tempo_index]
+                beat_length_in_samples = int(60 / current_tempo * sr)
+            expected_hit_timestamp += int(beat_duration * beat_length_in_samples)
+            i += 1
+        return expected_hit_timestamp
 
-    def get_exact_length(self, skeleton: list[tuple[float, str]], num_cycles: int, tempos: list[float], shift_proba: float, sr:int=48000) -> tuple[int, list[tuple[int, str, int]], list[tuple[int, int]], list[str]]:
+    def get_exact_length(self, skeleton: list[tuple[float, str]], num_cycles: int, tempos: list[float], shift_proba: float, sr:int=48000,
+                         rng: Optional[np.random.Generator] = None) -> tuple[int, list[tuple[int, str, int]], list[tuple[int, int]], list[str]]:
         # we simulate the entire process here
         # we return:
         # length
@@ -162,6 +280,8 @@ class DerboukaGenerator:
         expected_hit_timestamp = 0
         curr_beat = i = 0
         tempo_index = 0
+        # up to three draws per hit: the sample, whether it is shifted and by how much
+        draws = UniformStream(rng or np.random.default_rng(), block=3 * num_cycles * skeleton_length + 3)
 
         while curr_beat < num_of_beats_in_audio:
             beat_duration = skeleton[i % skeleton_length][0]
@@ -169,15 +289,13 @@ class DerboukaGenerator:
 
             if int(curr_beat) > tempo_index and int(curr_beat) < len(tempos):
                 tempo_index = int(curr_beat)
-                new_tempo = tempos[tempo_index]
-                tempo_diff = new_tempo - current_tempo
-                current_tempo = new_tempo
+                current_tempo = tempos[tempo_index]
                 beat_length_in_samples = int(60 / current_tempo * sr)
 
             tokens.append(f"DELAY_{beat_duration}")
             curr_hit = skeleton[i%skeleton_length][1]
 
-            _, sample_num, hit_length = self.get_audio_metadata(curr_hit)
+            _, sample_num, hit_length = self.get_audio_metadata(curr_hit, draws)
             tokens.append(f"HIT_{curr_hit}")
 
             expected_hit_timestamp += int(beat_duration * beat_length_in_samples)
@@ -187,7 +305,7 @@ class DerboukaGenerator:
             )
 
             adjusted_hit_timestamp = self.get_deviated_sample(
-                start_of_window, end_of_window, expected_hit_timestamp, shift_proba
+                start_of_window, end_of_window, expected_hit_timestamp, shift_proba, draws
             )
             
             deviation_samples = adjusted_hit_timestamp - expected_hit_timestamp
@@ -202,52 +320,109 @@ class DerboukaGenerator:
 
         return total_length_in_samples, final_list, skeleton_hits_intervals, " ".join(tokens)
 
-    def skeleton_generator(self, uuid:str, amplitude: float, skeleton: list[tuple[float, str]], num_cycles: int, tempos: list[float], shift_proba: float, sr:int=48000) -> tuple[npt.NDArray,int,list[tuple[int, int]], list[str]]:
-        total_length_in_samples, final_list, skeleton_hits_intervals, tokens = self.get_exact_length(
-                skeleton=skeleton,
-                num_cycles = num_cycles,
-                tempos = tempos,
-                shift_proba = shift_proba,
-                sr = sr
-        )
-
-        y = np.memmap(filename=f"./tmp/{uuid}.dat",dtype=np.float32, mode="w+", shape=(total_length_in_samples,))
-
-        # write ~1MB = 300k samples
-        nb_chunks = math.floor(total_length_in_samples / self.SIZE_OF_CHUNK)
-        remainder = total_length_in_samples % self.SIZE_OF_CHUNK
-        window = (0, self.SIZE_OF_CHUNK)
-        for chunk in range(nb_chunks):
-            inter_chunk_hits = []
-            y_chunk = np.zeros(self.SIZE_OF_CHUNK)
-            for start,end,sym,sample in final_list:
-                if window[0] <= start and end <= window[1]:
-                    newstart = start - window[0]
-                    newend = end - window[0]
-                    y_chunk[newstart:newend] = amplitude*self.get_audio_data(sym,sample,newend-newstart)
-                elif start <= window[1] and end >= window[1]:
-                    inter_chunk_hits.append((start,end,sym,sample))
-                else:
-                    continue
-            y[window[0]:window[1]] = y_chunk
-            for start,end,sym,sample in inter_chunk_hits:
-                y[start:end] += amplitude*self.get_audio_data(sym,sample,end-start)
-
-            if chunk != nb_chunks - 1:
-                window = (window[1], window[1] + self.SIZE_OF_CHUNK)
-
-        window = (window[1], total_length_in_samples)
-        y_chunk = np.zeros(window[1] - window[0])
-        for start,end,sym,sample in final_list:
-                if window[0] <= start and end <= window[1]:
-                    newstart = start - window[0]
-                    newend = end - window[0]
-                    y_chunk[newstart:newend] = amplitude*self.get_audio_data(sym,sample,newend-newstart)
-                else:
-                    continue
-        
-        y[window[0]:window[1]] = y_chunk
-        return y, skeleton_hits_intervals, tokens
+    def beat_grid(self, total_length: int, tempos: List[float], sr: int = 48000) -> Tuple[npt.NDArray, npt.NDArray]:
+        """
+        Start and length of every beat that starts before total_length. Beat b plays at
+        tempos[b], beats past the tempo list keep the last tempo.
+        """
+        beat_lengths = (60 * sr / np.asarray(tempos, dtype=np.float64)).astype(np.int64)
+        missing = total_length - int(beat_lengths.sum())
+        if missing > 0:
+            extra_beats = -(-missing // int(beat_lengths[-1]))
+            beat_lengths = np.concatenate([beat_lengths, np.full(extra_beats, beat_lengths[-1])])
+        beat_starts = np.concatenate([[0], np.cumsum(beat_lengths)[:-1]])
+        num_beats = int(np.searchsorted(beat_starts, total_length, side="left"))
+        return beat_starts[:num_beats], beat_lengths[:num_beats]
+
+    def plan_subdivisions(self, total_length: int, maxsubd: int,
+                          added_hits_intervals: List[Tuple[int, int]],
+                          hit_probabilities: List[Dict[str, float]],
+                          subdiv_proba: List[float],
+                          amplitudes: List[float],
+                          amplitudes_proba_list: List[float],
+                          tempos: List[float], sr: int = 48000,
+                          rng: Optional[np.random.Generator] = None) -> Tuple[npt.NDArray, List[Tuple[int, int]], str]:
+        """
+        Build the whole subdivision grid at once and decide every hit without touching audio.
+        Returns the subdivision events, the hit intervals and the tokens.
+        """
+        if sum(subdiv_proba) == 0:
+            return make_events([]), [], ""
+        if rng is None:
+            rng = np.random.default_rng()
+
+        beat_starts, beat_lengths = self.beat_grid(total_length, tempos, sr)
+        num_beats = len(beat_starts)
+
+        # every draw of a beat comes from its own row of the stream, a row as wide as the
+        # largest subdivision: the draws of beat b do not depend on what earlier beats chose,
+        # so changing one weight or the number of cycles only changes the beats it affects
+        hits = list(hit_probabilities[0].keys())
+        slot_width = len(hits) + 3  # hit weights, hit pick, amplitude, sample
+        draws = rng.random((num_beats, 1 + maxsubd * slot_width))
+        slot_draws = draws[:, 1:].reshape(num_beats, maxsubd, slot_width)
+
+        subd_weights = np.asarray(subdiv_proba, dtype=np.float64)
+        subd_index = weighted_index(subd_weights, draws[:, 0])
+        chosen_divs = maxsubd - subd_index
+
+        # subdivision k of a beat starts at k * (beat length // div), the last one absorbs the remainder
+        step_beat = np.repeat(np.arange(num_beats), chosen_divs)
+        first_step = np.cumsum(chosen_divs) - chosen_divs
+        step_in_beat = np.arange(len(step_beat)) - first_step[step_beat]
+        step_starts = beat_starts[step_beat] + step_in_beat * (beat_lengths // chosen_divs)[step_beat]
+        in_audio = step_starts < total_length
+        step_beat = step_beat[in_audio]
+        step_in_beat = step_in_beat[in_audio]
+        step_starts = step_starts[in_audio]
+        num_steps = len(step_starts)
+        step_draws = slot_draws[step_beat, step_in_beat]
+
+        # hit draw: every hit weight is first scaled by uniform(0, 1), as get_random_proba_list does
+        hit_weights = np.array([list(column.values()) for column in hit_probabilities], dtype=np.float64)
+        random_weights = step_draws[:, :len(hits)] * hit_weights[subd_index[step_beat]]
+        cumulative = np.cumsum(random_weights, axis=1)
+        picks = step_draws[:, len(hits)] * cumulative[:, -1]
+        hit_index = np.minimum((cumulative <= picks[:, None]).sum(axis=1), len(hits) - 1)
+
+        amplitude_index = weighted_index(np.asarray(amplitudes_proba_list, dtype=np.float64), step_draws[:, len(hits) + 1])
+
+        # non-silent hits that land on a skeleton hit are played as silence
+        hit_names = np.array(hits)
+        played = hit_names[hit_index] != "S"
+        candidates = np.flatnonzero(played)
+        skeleton_index = IntervalIndex(added_hits_intervals)
+        played[candidates[skeleton_index.contains(step_starts[candidates])]] = False
+
+        played_steps = np.flatnonzero(played)
+        events = np.empty(len(played_steps), dtype=EVENT_DTYPE)
+        events["start"] = step_starts[played_steps]
+        events["amplitude"] = np.asarray(amplitudes, dtype=np.float64)[amplitude_index[played_steps]]
+        events["variant"] = amplitude_index[played_steps]
+        played_hits = hit_names[hit_index[played_steps]]
+        sample_draws = step_draws[played_steps, len(hits) + 2]
+        for hit in np.unique(played_hits):
+            of_hit = played_hits == hit
+            sample_nums, lengths = sample_manager.get_samples_by_draw(hit, sample_draws[of_hit])
+            events["note"][of_hit] = self.SUPPORTED_NOTES.index(hit)
+            events["sample"][of_hit] = sample_nums
+            events["length"][of_hit] = lengths
+
+        ends = np.minimum(events["start"] + events["length"], total_length)
+        new_added_hits_intervals = list(zip(events["start"].tolist(), ends.tolist()))
+        new_added_hits_intervals.extend(sorted(added_hits_intervals, key=lambda x: x[0]))
+
+        # token stream: SUBD_x at every beat, then HIT_x AMP_y for every subdivision
+        hit_tokens = np.array([f"HIT_{hit}" for hit in hits], dtype=object)[hit_index]
+        hit_tokens[~played & (hit_names[hit_index] != "S")] = "HIT_S"
+        amplitude_tokens = np.array([f"AMP_{amplitude}" for amplitude in amplitudes], dtype=object)[amplitude_index]
+        tokens = np.empty(num_beats + 2 * num_steps, dtype=object)
+        tokens[2 * first_step + np.arange(num_beats)] = [f"SUBD_{div}" for div in chosen_divs.tolist()]
+        step_token = step_beat + 2 * np.arange(num_steps) + 1
+        tokens[step_token] = hit_tokens
+        tokens[step_token + 1] = amplitude_tokens
+
+        return events, new_added_hits_intervals, " ".join(tokens.tolist())
 
     def subdivisions_generator(self, y: npt.NDArray, maxsubd: int, 
                           added_hits_intervals: List[Tuple[int, int]], 
@@ -256,110 +431,43 @@ class DerboukaGenerator:
                           amplitudes: List[float], 
                           amplitudes_proba_list: List[float],
                           tempos: List[float], sr: int = 48000) -> Tuple[npt.NDArray, List[Tuple[int, int]], str]:
-        subdiv_array = []
-        tokens = []
-        
-        # Initialize tempo tracking
-        current_tempo = tempos[0]
-        
-        for i in range(len(subdiv_proba)):
-            subdiv_array.append(i)
-            
-        if sum(subdiv_proba) == 0:
-            return y, [], ""
-            
-        maxsubdi = random.choices(population=subdiv_array, weights=subdiv_proba, k=1)[0]
-        added_hits_intervals = sorted(added_hits_intervals, key=lambda x: x[0])
+        """
+        Two-pass path: plan the subdivisions, then add them on top of an already rendered skeleton.
+        """
+        events, new_added_hits_intervals, tokens = self.plan_subdivisions(
+            total_length=len(y),
+            maxsubd=maxsubd,
+            added_hits_intervals=added_hits_intervals,
+            hit_probabilities=hit_probabilities,
+            subdiv_proba=subdiv_proba,
+            amplitudes=amplitudes,
+            amplitudes_proba_list=amplitudes_proba_list,
+            tempos=tempos,
+            sr=sr,
+        )
+        for start, length, note, sample, _, variant in events.tolist():
+            add_len = min(length, len(y) - start)
+            y[start:start + add_len] += self.event_audio(note, sample, length, variant)[:add_len]
 
-        curr_sample = 0
-        tempo_index = 0
-        beat_index = 0
+        return y, new_added_hits_intervals, tokens
 
-        chosen_div = maxsubd - maxsubdi
-        tokens.append(f"SUBD_{chosen_div}")
-        
-        # Calculate beat length for current tempo
-        beat_length_in_samples = int(60 * sr / current_tempo)
-        maxsubd_length_arr = [int(beat_length_in_samples / chosen_div) for _ in range(chosen_div - 1)]
-        maxsubd_length_arr.append(beat_length_in_samples - sum(maxsubd_length_arr))
-        
-        hits = list(hit_probabilities[maxsubdi].keys())
-        weights = list(hit_probabilities[maxsubdi].values())
-        new_added_hits_intervals = []
-        
-        j = 0
-        index_of_curr_subd_in_beat = 0
-        sample_of_last_beat = 0
-        
-        while curr_sample < len(y):
-            # Check if we need to update tempo (new beat)
-            if curr_sample >= sample_of_last_beat + beat_length_in_samples:
-                beat_index += 1
-                index_of_curr_subd_in_beat = 0
-                sample_of_last_beat = curr_sample
-                
-                # Update tempo if available
-                if beat_index < len(tempos):
-                    new_tempo = tempos[beat_index]
-                    if new_tempo != current_tempo:
-                        current_tempo = new_tempo
-                    
-                    beat_length_in_samples = int(60 * sr / current_tempo)
-                
-                # Get new random subdivision for the new beat
-                maxsubdi = random.choices(population=subdiv_array, weights=subdiv_proba, k=1)[0]
-                chosen_div = maxsubd - maxsubdi
-                tokens.append(f"SUBD_{chosen_div}")
-                maxsubd_length_arr = [int(beat_length_in_samples / chosen_div) for _ in range(chosen_div - 1)]
-                maxsubd_length_arr.append(beat_length_in_samples - sum(maxsubd_length_arr))
-
-                hits = list(hit_probabilities[maxsubdi].keys())
-                weights = list(hit_probabilities[maxsubdi].values())
-            
-            remaining = len(y) - curr_sample
-            random_proba_list = self.get_random_proba_list(weights)
-            chosen_hit = random.choices(hits, weights=random_proba_list, k=1)[0]
-            chosen_amplitude = random.choices(
-                population=amplitudes, weights=amplitudes_proba_list, k=1
-            )[0]
-            
-            if chosen_hit == "S":
-                tokens.append(f"HIT_{chosen_hit}")
-                tokens.append(f"AMP_{chosen_amplitude}")
-                curr_sample += maxsubd_length_arr[index_of_curr_subd_in_beat]
-            else:
-                hit_metadata = self.get_audio_metadata(chosen_hit)
-                hit_y_raw = self.get_audio_data(hit_metadata[0], hit_metadata[1], hit_metadata[2])
-                
-                add_len = min(hit_metadata[2], remaining)
-                
-                hit_y = self.apply_cross_fade(hit_y_raw)
-                
-                no_overlap = True
-                for start, end in added_hits_intervals:
-                    if start <= curr_sample < end:
-                        curr_sample += maxsubd_length_arr[index_of_curr_subd_in_beat]
-                        no_overlap = False
-                        break
-                        
-                if no_overlap:
-                    y[curr_sample:curr_sample + add_len] += (
-                        chosen_amplitude * hit_y[:add_len]
-                    )
-                    new_added_hits_intervals.append(
-                        (curr_sample, curr_sample + add_len)
-                    )
-                    curr_sample += maxsubd_length_arr[index_of_curr_subd_in_beat]
-                    tokens.append(f"HIT_{chosen_hit}")
-                    tokens.append(f"AMP_{chosen_amplitude}")
-                else:
-                    tokens.append(f"HIT_S")
-                    tokens.append(f"AMP_{chosen_amplitude}")
-
-            index_of_curr_subd_in_beat += 1
-
-        new_added_hits_intervals.extend(added_hits_intervals)
-        return y, new_added_hits_intervals, " ".join(tokens)
+    def skeleton_events(self, final_list: list[tuple[int, int, str, int]], amplitude: float) -> npt.NDArray:
+        """
+        Turn the skeleton plan from get_exact_length into renderer events.
+        Skeleton hits use the bank's skeleton variant (raw sample at the loudest amplitude).
+        """
+        return make_events([
+            (start, end - start, self.SUPPORTED_NOTES.index(sym), sample, amplitude, sample_manager.skeleton_variant)
+            for start, end, sym, sample in final_list
+        ])
+
+    def event_audio(self, note: int, sample: int, length: int, variant: int,
+                    sample_rate: Optional[int] = None) -> npt.NDArray:
+        """Read-only, already faded and scaled audio for one event"""
+        hit_y = sample_manager.get_hit(self.SUPPORTED_NOTES[note], sample, variant, sample_rate)
+        if len(hit_y) != length:
+            logger.error(f"Mismatched size for {self.SUPPORTED_NOTES[note]}:{sample}, got length = {length}")
+        return hit_y
 
     def get_subdivision_hit_probabilities(self, maxsubd: int, number_of_hits: int, hits_list: list[str], probabilities_dict: dict[str, list]) -> list[dict[str, float]]:
         out = []
@@ -382,9 +490,8 @@ class DerboukaGenerator:
 
         return out
 
-    def merge_skeleton_with_variations(
+    def plan_skeleton_with_variations(
                                         self,
-                                        uuid:str,
                                         maxsubd: int,
                                         probabilities_dict: dict[str, list],
                                         bpm: float,
@@ -396,15 +503,29 @@ class DerboukaGenerator:
                                         cycle_length: float,
                                         shift_proba: float,
                                         allowed_tempo_deviation: float,
-                                        sr:int = 48000 
-                                    ) -> npt.NDArray:
+                                        sr:int = 48000,
+                                        seed: Optional[int] = None
+                                    ) -> GenerationPlan:
+        """
+        Every draw comes from `seed`: the same seed and arguments give the same plan.
+        Tempos, skeleton and subdivisions get independent streams so a change in one
+        stage's number of draws does not shift the others.
+        """
+        start_time = time.time()
+        stage_times = {}
+        tempo_rng, skeleton_rng, subdivision_rng = (
+            np.random.default_rng(child) for child in np.random.SeedSequence(seed).spawn(3)
+        )
         # calculating the total number of beats in the audio
         num_of_beats = num_cycles * sum(float(x[0]) for x in skeleton)
 
         # get the list of tempos for every beat
+        stage_start = time.perf_counter()
         tempos, tempo_tokens = self.get_tempos(
-            number_of_beats=num_of_beats, initial_tempo=bpm, allowed_tempo_deviation=allowed_tempo_deviation
+            number_of_beats=num_of_beats, initial_tempo=bpm, allowed_tempo_deviation=allowed_tempo_deviation,
+            rng=tempo_rng,
         )
+        stage_times["tempo_planning"] = time.perf_counter() - stage_start
 
         # getting the notes
         hits_list = list(probabilities_dict.keys())
@@ -418,17 +539,21 @@ class DerboukaGenerator:
         )
 
 
-        y, added_hits_intervals, skeleton_tokens = self.skeleton_generator(
-            uuid=uuid,
-            shift_proba=shift_proba,
-            amplitude=amplitudes[-1], # always play at highest amplitude
+        # plan every skeleton and subdivision hit first, then mix them in one sweep
+        stage_start = time.perf_counter()
+        total_length_in_samples, final_list, added_hits_intervals, skeleton_tokens = self.get_exact_length(
             skeleton=skeleton,
             num_cycles=num_cycles,
-            sr=sr,
             tempos=tempos,
+            shift_proba=shift_proba,
+            sr=sr,
+            rng=skeleton_rng,
         )
-        y, added_hits_intervals, var_tokens = self.subdivisions_generator(
-            y=y,
+        stage_times["exact_length"] = time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        subdivision_events, added_hits_intervals, var_tokens = self.plan_subdivisions(
+            total_length=total_length_in_samples,
             maxsubd=maxsubd,
             amplitudes=amplitudes,
             amplitudes_proba_list=amplitudes_proba_list,
@@ -436,27 +561,208 @@ class DerboukaGenerator:
             hit_probabilities=subdivision_hit_probabilities,
             subdiv_proba=subdiv_proba,
             tempos=tempos,
+            sr=sr,
+            rng=subdivision_rng,
+        )
+        stage_times["subdivision_planning"] = time.perf_counter() - stage_start
+        events = np.concatenate([
+            self.skeleton_events(final_list, amplitude=amplitudes[-1]), # always play at highest amplitude
+            subdivision_events,
+        ])
+        tokens = str(tempos[0]) + "\n" + tempo_tokens + "\n" + skeleton_tokens + "\n" + var_tokens
+
+        return GenerationPlan(
+            total_length=total_length_in_samples,
+            events=events,
+            tokens=tokens,
+            # Count hits (approximate)
+            num_hits=tokens.count("HIT_"),
+            planning_time=time.time() - start_time,
+            stage_times=stage_times,
+            sample_rate=sr,
         )
 
-        return y, str(tempos[0]) + "\n" + tempo_tokens + "\n" + skeleton_tokens + "\n" + var_tokens
-    
-    def generate(self, uuid: str, num_cycles: int, cycle_length: float, 
+    def replay_plan(self, record: derbake.Derbake, sample_rate: Optional[int] = None) -> GenerationPlan:
+        """
+        The plan a .derbake was generated from, placed as get_exact_length and plan_subdivisions
+        placed it. Needs the sample numbers recorded with the tokens; rendering the plan gives
+        back the original audio exactly.
+        """
+        start_time = time.time()
+        sr = sample_manager.SAMPLE_RATE  # the rate BANK_SLOTS lengths are in
+        try:
+            skeleton_samples, variation_samples = record.hit_samples()
+        except ValueError as e:
+            raise ValidationError(f"Cannot replay exactly: {e}") from e
+        tempos = record.tempos.tolist()
+        if not tempos:
+            raise ValidationError("Cannot replay exactly: no tempos")
+        amplitudes = self.get_amplitudes()
+
+        def length_of(symbol: str, sample: int) -> int:
+            try:
+                return sample_manager.BANK_SLOTS[(symbol, sample)][1]
+            except KeyError:
+                raise ValidationError(f"Unknown sample {symbol}:{sample}") from None
+
+        # skeleton, the beat walk of get_exact_length with the recorded deviations
+        current_tempo = tempos[0]
+        beat_length_in_samples = int((60/current_tempo) * sr)
+        expected_hit_timestamp = 0
+        curr_beat = 0
+        tempo_index = 0
+        total_length_in_samples = 0
+        final_list = []
+        for (beat_duration, hit, deviation), sample in zip(record.skeleton.tolist(), skeleton_samples.tolist()):
+            curr_beat += beat_duration
+            if int(curr_beat) > tempo_index and int(curr_beat) < len(tempos):
+                tempo_index = int(curr_beat)
+                current_tempo = tempos[tempo_index]
+                beat_length_in_samples = int(60 / current_tempo * sr)
+            expected_hit_timestamp += int(beat_duration * beat_length_in_samples)
+            symbol = record.symbols[hit]
+            adjusted_hit_timestamp = expected_hit_timestamp + deviation
+            total_length_in_samples = adjusted_hit_timestamp + length_of(symbol, sample)
+            final_list.append((adjusted_hit_timestamp, total_length_in_samples, symbol, sample))
+
+        # subdivisions, every row is the next step of the grid, a SUBD row starts a beat
+        beat_starts, beat_lengths = self.beat_grid(total_length_in_samples, tempos, sr)
+        divs = record.variations["subd"].astype(np.int64)
+        step_beat = np.empty(len(divs), dtype=np.int64)
+        step_in_beat = np.empty(len(divs), dtype=np.int64)
+        row = beat = 0
+        while row < len(divs):
+            steps = min(int(divs[row]), len(divs) - row)
+            if steps < 1 or beat >= len(beat_starts):
+                raise ValidationError("Cannot replay exactly: subdivisions do not fit the beats")
+            step_beat[row:row + steps] = beat
+            step_in_beat[row:row + steps] = np.arange(steps)
+            row += steps
+            beat += 1
+        step_starts = beat_starts[step_beat] + step_in_beat * (beat_lengths[step_beat] // divs)
+
+        played = np.flatnonzero(variation_samples >= 0)
+        events = np.empty(len(played), dtype=EVENT_DTYPE)
+        events["start"] = step_starts[played]
+        events["sample"] = variation_samples[played]
+        amplitude_values = record.amplitudes[record.variations["amp"][played]]
+        events["amplitude"] = amplitude_values
+        for value in np.unique(amplitude_values).tolist():
+            if value not in amplitudes:
+                raise ValidationError(f"Cannot replay exactly: unknown amplitude {value}")
+            events["variant"][amplitude_values == value] = amplitudes.index(value)
+        symbols = [record.symbols[hit] for hit in record.variations["hit"][played].tolist()]
+        for i, (symbol, sample) in enumerate(zip(symbols, events["sample"].tolist())):
+            events["length"][i] = length_of(symbol, sample)
+            events["note"][i] = self.SUPPORTED_NOTES.index(symbol)
+
+        tokens = record.to_text()
+        plan = GenerationPlan(
+            total_length=total_length_in_samples,
+            events=np.concatenate([self.skeleton_events(final_list, amplitude=amplitudes[-1]), events]),
+            tokens=tokens,
+            num_hits=tokens.count("HIT_"),
+            planning_time=time.time() - start_time,
+            sample_rate=sr,
+        )
+        if sample_rate is not None:
+            plan = self.resample_plan(plan, sample_rate)
+        return plan
+
+    def merge_skeleton_with_variations(self, uuid: str, **kwargs) -> npt.NDArray:
+        """
+        Plan and render into ./tmp/{uuid}.dat, takes the arguments of plan_skeleton_with_variations.
+        """
+        plan = self.plan_skeleton_with_variations(**kwargs)
+        return self.render(uuid, plan), plan.tokens
+
+    def resample_plan(self, plan: GenerationPlan, sample_rate: int) -> GenerationPlan:
+        """
+        The same hits placed at `sample_rate`, to render from the preview bank. Every
+        position is scaled from the full-rate plan, so tokens and hit choices are unchanged.
+        """
+        if sample_rate == plan.sample_rate:
+            return plan
+        # (note, sample number) -> length of the hit at sample_rate
+        max_num = max((num for _, num in sample_manager.BANK_SLOTS), default=0)
+        lengths = np.zeros((len(self.SUPPORTED_NOTES), max_num + 1), dtype=np.int64)
+        for (symbol, num), (_, length) in sample_manager.bank_slots(sample_rate).items():
+            if symbol in self.SUPPORTED_NOTES:
+                lengths[self.SUPPORTED_NOTES.index(symbol), num] = length
+
+        events = plan.events.copy()
+        events["start"] = events["start"] * sample_rate // plan.sample_rate
+        events["length"] = lengths[events["note"], events["sample"]]
+        return replace(
+            plan,
+            total_length=-(-plan.total_length * sample_rate // plan.sample_rate),
+            events=events,
+            sample_rate=sample_rate,
+        )
+
+    def _renderer_for(self, plan: GenerationPlan) -> TiledRenderer:
+        if plan.sample_rate == sample_manager.SAMPLE_RATE:
+            return self.renderer
+        return TiledRenderer(
+            functools.partial(self.event_audio, sample_rate=plan.sample_rate), tile_size=self.SIZE_OF_CHUNK
+        )
+
+    def _output(self, uuid: str, length: int) -> npt.NDArray:
+        # ./tmp/{uuid}.dat, numpy cannot map an empty file so nothing is written for no audio
+        if length == 0:
+            return np.zeros(0, dtype=np.float32)
+        return np.memmap(filename=f"./tmp/{uuid}.dat", dtype=np.float32, mode="w+", shape=(length,))
+
+    def render(self, uuid: str, plan: GenerationPlan) -> npt.NDArray:
+        start_time = time.perf_counter()
+        y = self._output(uuid, plan.total_length)
+        y = self._renderer_for(plan).render(y, plan.events)
+        self._record_render(plan, time.perf_counter() - start_time)
+        return y
+
+    def render_patch(self, uuid: str, plan: GenerationPlan, base: npt.NDArray,
+                     ranges: List[Tuple[int, int]]) -> npt.NDArray:
+        """
+        Render a plan that differs from the one `base` was rendered from only inside `ranges`:
+        the rest of the audio is copied from `base`, only those ranges are mixed again.
+        """
+        start_time = time.perf_counter()
+        y = self._output(uuid, plan.total_length)
+        kept = min(len(base), plan.total_length)
+        for offset in range(0, kept, self.SIZE_OF_CHUNK):
+            end = min(offset + self.SIZE_OF_CHUNK, kept)
+            y[offset:end] = base[offset:end]
+        renderer = self._renderer_for(plan)
+        for start, end in ranges:
+            renderer.render_range(y, plan.events, start, end)
+        self._record_render(plan, time.perf_counter() - start_time)
+        return y
+
+    def iter_tiles(self, plan: GenerationPlan):
+        """Render a plan tile by tile, in order, without an output buffer"""
+        tiles = self._renderer_for(plan).iter_tiles(plan.events, plan.total_length)
+        # only the time spent rendering counts, not the time waiting for the consumer
+        return timed_iter(tiles, lambda seconds: self._record_render(plan, seconds))
+
+    def _record_render(self, plan: GenerationPlan, seconds: float):
+        plan.stage_times["render"] = seconds
+        self.generation_stats["total_time"].increment(seconds)
+
+    def plan_generation(self, uuid: str, num_cycles: int, cycle_length: float, 
                 bpm: float, maxsubd: int, shift_proba: float, 
                 allowed_tempo_deviation: float, skeleton: List[Tuple[float, str]], 
-                matrix: List, amplitude_variation: float) -> GenerationResult:
+                matrix: List, amplitude_variation: float, seed: Optional[int] = None,
+                sample_rate: Optional[int] = None) -> GenerationPlan:
         """
-        Main generation method with comprehensive error handling and statistics.
+        Decide every hit of a generation (tempos, skeleton, subdivisions, tokens) without rendering.
+        The exact output length is known from here on. A preview `sample_rate` places the
+        hits of the full-rate plan at that rate, the tokens are those of the full render.
         """
-        start_time = time.time()
         self.generation_stats["total_generations"].increment()
         
         try:
             # Amplitude bins
-            amplitudes = [
-                0.1015 * settings.AUDIO_VOLUME,
-                0.5 * settings.AUDIO_VOLUME,
-                1.0 * settings.AUDIO_VOLUME
-            ]
+            amplitudes = self.get_amplitudes()
             
             # Amplitude probabilities
             amplitudes_proba = [(1 - amplitude_variation) / 2, 
@@ -469,8 +775,7 @@ class DerboukaGenerator:
             
             # Create probability dict
             probabilities_dict = dict(zip(self.SUPPORTED_NOTES, matrix_data))
-            y, tokens = self.merge_skeleton_with_variations(
-                    uuid=uuid,
+            plan = self.plan_skeleton_with_variations(
                     amplitudes=amplitudes,
                     amplitudes_proba_list=amplitudes_proba,
                     shift_proba=shift_proba,
@@ -481,23 +786,51 @@ class DerboukaGenerator:
                     num_cycles=num_cycles,
                     subdiv_proba=subdiv_proba,
                     cycle_length=cycle_length,
-                    allowed_tempo_deviation=allowed_tempo_deviation
+                    allowed_tempo_deviation=allowed_tempo_deviation,
+                    sr=sample_manager.SAMPLE_RATE,
+                    seed=seed
                 )
+            if sample_rate is not None:
+                plan = self.resample_plan(plan, sample_rate)
+            self.generation_stats["total_hits"].increment(plan.num_hits)
+            self.generation_stats["total_time"].increment(plan.planning_time)
+            return plan
+            
+        except Exception as e:
+            self.generation_stats["errors"].increment()
+            logger.error(f"Generation failed for {uuid}: {e}", exc_info=True)
+            raise AudioGenerationError(f"Failed to generate audio: {e}") from e
+    
+    def generate(self, uuid: str, num_cycles: int, cycle_length: float, 
+                bpm: float, maxsubd: int, shift_proba: float, 
+                allowed_tempo_deviation: float, skeleton: List[Tuple[float, str]], 
+                matrix: List, amplitude_variation: float, seed: Optional[int] = None,
+                sample_rate: Optional[int] = None) -> GenerationResult:
+        """
+        Main generation method with comprehensive error handling and statistics.
+        """
+        start_time = time.time()
+        plan = self.plan_generation(
+            uuid, num_cycles, cycle_length, bpm, maxsubd, shift_proba,
+            allowed_tempo_deviation, skeleton, matrix, amplitude_variation, seed, sample_rate
+        )
+        
+        try:
+            y = self.render(uuid, plan)
             # Normalize to prevent clipping
             # max_val = np.max(np.abs(y))
             # if max_val > 1.0:
             #     y = y / max_val * 0.95
             
             generation_time = time.time() - start_time
-            # Count hits (approximate)
-            num_hits = tokens.count("HIT_")
-            self.generation_stats["total_hits"].increment(num_hits)
             
             return GenerationResult(
                 audio=y,
-                tokens=tokens,
+                tokens=plan.tokens,
                 generation_time=generation_time,
-                num_hits=num_hits
+                num_hits=plan.num_hits,
+                stage_times=plan.stage_times,
+                events=plan.events,
             )
             
         except Exception as e:
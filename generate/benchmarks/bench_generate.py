@@ -0,0 +1,193 @@
+# bench_generate.py
+"""
+End-to-end benchmark of DerboukaGenerator.generate over a grid of request parameters,
+on a synthetic sample bank (no WAV assets, .env or database needed).
+
+Every case runs in a fresh process so its peak RSS is its own. Results can be saved
+as a JSON baseline and later runs compared against it:
+
+Run from generate/:
+    python -m benchmarks.bench_generate --save benchmarks/baselines/main.json
+    python -m benchmarks.bench_generate --compare benchmarks/baselines/main.json
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.synthetic import configure_env, load_synthetic_samples
+
+configure_env()
+
+# beats per hit: sparse = 2 beats, medium = mixed, dense = a hit every quarter beat
+SKELETONS = {
+    "sparse": [[2, "D"], [2, "OTA"]],
+    "medium": [[1, "D"], [0.5, "OTA"], [0.5, "OTA"], [1, "D"], [1, "OTA"]],
+    "dense": [[0.25, "D"], [0.25, "OTA"], [0.25, "OTI"], [0.25, "OTA"]] * 4,
+}
+GRID_KEYS = ["numOfCycles", "maxSubd", "tempo", "tempoVariation", "skeleton"]
+DEFAULT_GRID = {
+    "numOfCycles": [20, 200],
+    "maxSubd": [2, 4, 8],
+    "tempo": [90, 180],
+    "tempoVariation": [0, 10],
+    "skeleton": ["sparse", "dense"],
+}
+
+
+def make_matrix(maxsubd: int) -> list:
+    """Uniform subdivision choice, 10% per note per column, silence for the rest"""
+    return [[1] * maxsubd] + [[10] * maxsubd] * 4 + [[0] * maxsubd]
+
+
+def run_case(case: dict, repeats: int, seed: int) -> dict:
+    """Runs in a worker process: generate `repeats` times and report the best wall time"""
+    from sample_manager import sample_manager
+    from algorithm import generator
+
+    load_synthetic_samples(sample_manager, generator.get_amplitudes())
+    skeleton = SKELETONS[case["skeleton"]]
+    # generate renders into ./tmp/{uuid}.dat
+    workdir = tempfile.mkdtemp(prefix="derbouka-bench-")
+    os.makedirs(os.path.join(workdir, "tmp"))
+    os.chdir(workdir)
+
+    wall_times = []
+    for _ in range(repeats):
+        audio_id = str(uuid.uuid4())
+        start = time.perf_counter()
+        result = generator.generate(
+            audio_id,
+            case["numOfCycles"],
+            sum(x[0] for x in skeleton),
+            case["tempo"],
+            case["maxSubd"],
+            0.5,
+            case["tempoVariation"],
+            skeleton,
+            make_matrix(case["maxSubd"]),
+            0.5,
+            seed,
+        )
+        wall_times.append(time.perf_counter() - start)
+        num_samples, num_hits = len(result.audio), result.num_hits
+        del result
+        os.remove(os.path.join("tmp", f"{audio_id}.dat"))
+    os.rmdir("tmp")
+    os.chdir("/")
+    os.rmdir(workdir)
+
+    wall_time = min(wall_times)
+    return {
+        **case,
+        "wall_time": wall_time,
+        "wall_time_median": statistics.median(wall_times),
+        "samples": num_samples,
+        "hits": num_hits,
+        "samples_per_sec": num_samples / wall_time,
+        "hits_per_sec": num_hits / wall_time,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def case_key(case: dict) -> tuple:
+    return tuple(case[key] for key in GRID_KEYS)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: list, baseline: dict, threshold: float) -> int:
+    """Print the change in wall time per case, return how many cases regressed past `threshold`"""
+    previous = {case_key(case): case for case in baseline["results"]}
+    regressions = 0
+    print(f"\nCompared to {baseline.get('commit', 'unknown')}:")
+    print(f"{'case':<40} {'before':>9} {'after':>9} {'change':>8}")
+    for case in results:
+        before = previous.get(case_key(case))
+        if before is None:
+            continue
+        change = case["wall_time"] / before["wall_time"] - 1
+        flag = ""
+        if change > threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        name = " ".join(str(v) for v in case_key(case))
+        print(f"{name:<40} {before['wall_time']:>9.4f} {case['wall_time']:>9.4f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cycles", type=int, nargs="+", default=DEFAULT_GRID["numOfCycles"])
+    parser.add_argument("--maxsubd", type=int, nargs="+", default=DEFAULT_GRID["maxSubd"])
+    parser.add_argument("--tempo", type=float, nargs="+", default=DEFAULT_GRID["tempo"])
+    parser.add_argument("--tempo-variation", type=float, nargs="+", default=DEFAULT_GRID["tempoVariation"])
+    parser.add_argument("--skeleton", nargs="+", choices=list(SKELETONS), default=DEFAULT_GRID["skeleton"])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON baseline to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="wall time increase counted as a regression (default 10%%)")
+    args = parser.parse_args()
+
+    grid = [
+        dict(zip(GRID_KEYS, values))
+        for values in itertools.product(args.cycles, args.maxsubd, args.tempo, args.tempo_variation, args.skeleton)
+    ]
+
+    results = []
+    print(f"{'cycles':>6} {'subd':>4} {'tempo':>6} {'var':>5} {'skeleton':>8} "
+          f"{'seconds':>9} {'Msamples/s':>10} {'hits/s':>10} {'RSS MB':>7}")
+    for case in grid:
+        # a fresh process per case, so peak RSS is not carried over from bigger cases
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            result = pool.submit(run_case, case, args.repeats, args.seed).result()
+        results.append(result)
+        print(f"{case['numOfCycles']:>6} {case['maxSubd']:>4} {case['tempo']:>6g} {case['tempoVariation']:>5g} "
+              f"{case['skeleton']:>8} {result['wall_time']:>9.4f} {result['samples_per_sec'] / 1e6:>10.1f} "
+              f"{result['hits_per_sec']:>10.0f} {result['peak_rss_mb']:>7.1f}")
+
+    report = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "repeats": args.repeats,
+        "seed": args.seed,
+        "results": results,
+    }
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved {len(results)} cases to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
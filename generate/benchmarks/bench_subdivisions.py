@@ -0,0 +1,80 @@
+# bench_subdivisions.py
+"""
+Times the subdivision planning stage (grid, draws, skeleton-overlap checks, tokens)
+for a growing number of cycles. Time per cycle should stay flat.
+
+Run from generate/:  python -m benchmarks.bench_subdivisions
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import configure_env, load_synthetic_samples
+
+configure_env()
+
+from sample_manager import sample_manager  # noqa: E402
+from algorithm import generator  # noqa: E402
+
+SKELETON = [[1, "D"], [0.5, "OTA"], [0.5, "OTA"], [1, "D"], [1, "OTA"]]
+MATRIX = [
+    [1, 1, 1, 1],
+    [10, 10, 10, 10],
+    [10, 10, 10, 10],
+    [10, 10, 10, 10],
+    [10, 10, 10, 10],
+    [0, 0, 0, 0],
+]
+
+
+def time_stage(num_cycles: int, repeats: int, bpm: float = 120, maxsubd: int = 4) -> float:
+    rng = np.random.default_rng(num_cycles)
+    num_of_beats = num_cycles * sum(x[0] for x in SKELETON)
+    tempos, _ = generator.get_tempos(
+        number_of_beats=num_of_beats, initial_tempo=bpm, allowed_tempo_deviation=5, rng=rng
+    )
+    total_length, _, intervals, _ = generator.get_exact_length(
+        skeleton=SKELETON, num_cycles=num_cycles, tempos=tempos, shift_proba=0.5, rng=rng
+    )
+    hit_probabilities = generator.get_subdivision_hit_probabilities(
+        maxsubd=maxsubd,
+        number_of_hits=len(generator.SUPPORTED_NOTES),
+        hits_list=generator.SUPPORTED_NOTES,
+        probabilities_dict=dict(zip(generator.SUPPORTED_NOTES, MATRIX[1:])),
+    )
+    amplitudes = generator.get_amplitudes()
+
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        generator.plan_subdivisions(
+            total_length=total_length,
+            maxsubd=maxsubd,
+            added_hits_intervals=intervals,
+            hit_probabilities=hit_probabilities,
+            subdiv_proba=MATRIX[0],
+            amplitudes=amplitudes,
+            amplitudes_proba_list=[0.25, 0.5, 0.25],
+            tempos=tempos,
+            rng=rng,
+        )
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cycles", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    load_synthetic_samples(sample_manager, generator.get_amplitudes())
+    print(f"{'cycles':>8} {'seconds':>10} {'us/cycle':>10}")
+    for num_cycles in args.cycles:
+        seconds = time_stage(num_cycles, args.repeats)
+        print(f"{num_cycles:>8} {seconds:>10.4f} {seconds / num_cycles * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
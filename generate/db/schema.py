@@ -1,8 +1,7 @@
 from typing import Optional
-import os
-from sqlalchemy import String, ForeignKey
+from sqlalchemy import JSON, String, ForeignKey
 from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.ext.asyncio import AsyncAttrs, create_async_engine, async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncAttrs, AsyncEngine
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -37,19 +36,13 @@ class Sound(Base):
     # s3 url
     url: Mapped[str] = mapped_column(String, nullable=False)
 
-    # JSONB column for storing settings
-    settings: Mapped[dict] = mapped_column(JSONB, nullable=False, default=lambda: {})
+    # JSONB column for storing settings (plain JSON on SQLite)
+    settings: Mapped[dict] = mapped_column(JSON().with_variant(JSONB(), "postgresql"), nullable=False, default=lambda: {})
 
 
-postgres_user = os.getenv("POSTGRES_USER")
-postgres_password = os.getenv("POSTGRES_PASSWORD")
-postgres_db_name = os.getenv("POSTGRES_DB")
-postgres_host = os.getenv("POSTGRES_HOST")
-
-DATABASE_URL = f"postgresql+asyncpg://{postgres_user}:{postgres_password}@{postgres_host}:5432/{postgres_db_name}"
-
-engine = create_async_engine(DATABASE_URL, echo=True)
-AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
-async def init_models():
+# ---------------------------------------------------------------------
+# Engines are built by the metadata store from settings (see storage.py)
+# ---------------------------------------------------------------------
+async def init_models(engine: AsyncEngine):
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await conn.run_sync(Base.metadata.create_all)
@@ -0,0 +1,216 @@
+# encoding.py
+import struct
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+import soundfile as sf
+
+from exceptions import ValidationError
+
+
+@dataclass(frozen=True)
+class Encoding:
+    """An output format streamed audio can be sent in"""
+    name: str
+    media_type: str
+    # WAV is written by hand, the rest through soundfile
+    sf_format: Optional[str] = None
+    sf_subtype: Optional[str] = None
+    sample_rates: Optional[Tuple[int, ...]] = None  # None for any
+
+
+ENCODINGS: Dict[str, Encoding] = {
+    "wav": Encoding("wav", "audio/wav"),  # 32-bit float, what the frontend plays
+    "pcm16": Encoding("pcm16", "audio/wav"),
+    "flac": Encoding("flac", "audio/flac", "FLAC", "PCM_16"),
+    "opus": Encoding("opus", "audio/ogg", "OGG", "OPUS", (8000, 12000, 16000, 24000, 48000)),
+}
+DEFAULT_ENCODING = ENCODINGS["wav"]
+
+# Accept media types, codecs=1 is integer PCM in a WAV (RFC 2361)
+ACCEPTED_MEDIA_TYPES = {
+    "audio/wav": "wav", "audio/wave": "wav", "audio/x-wav": "wav", "audio/vnd.wave": "wav",
+    "audio/wav;codecs=3": "wav", "audio/wav;codecs=1": "pcm16", "audio/l16": "pcm16",
+    "audio/flac": "flac", "audio/x-flac": "flac",
+    "audio/ogg": "opus", "audio/opus": "opus", "audio/ogg;codecs=opus": "opus",
+}
+
+
+def parse_accept(accept: str) -> List[Tuple[float, str]]:
+    """(q, media type) pairs of an Accept header, parameters other than codecs dropped"""
+    accepted = []
+    for entry in accept.split(","):
+        parts = [part.strip().lower() for part in entry.split(";") if part.strip()]
+        if not parts:
+            continue
+        media_type, q = parts[0], 1.0
+        for param in parts[1:]:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+            elif key.strip() == "codecs":
+                media_type += f";codecs={value.strip().strip(chr(34))}"
+        accepted.append((q, media_type))
+    return accepted
+
+
+def supports(encoding: Encoding, sample_rate: int) -> bool:
+    return encoding.sample_rates is None or sample_rate in encoding.sample_rates
+
+
+def negotiate(format_param: Optional[str], accept: Optional[str], sample_rate: int) -> Encoding:
+    """
+    Pick the encoding of a streamed response: `?format=` wins, then the preferred
+    known type of the Accept header that can carry `sample_rate`, then 32-bit float WAV.
+    """
+    if format_param:
+        encoding = ENCODINGS.get(format_param.lower())
+        if encoding is None:
+            raise ValidationError(f"Unknown format {format_param}, expected one of {', '.join(ENCODINGS)}")
+        if not supports(encoding, sample_rate):
+            raise ValidationError(f"{encoding.name} cannot carry {sample_rate} Hz audio")
+        return encoding
+    if accept:
+        best = None
+        for q, media_type in parse_accept(accept):
+            name = ACCEPTED_MEDIA_TYPES.get(media_type)
+            if name is None or not supports(ENCODINGS[name], sample_rate):
+                continue
+            if q > 0 and (best is None or q > best[0]):
+                best = (q, name)
+        if best is not None:
+            return ENCODINGS[best[1]]
+    return DEFAULT_ENCODING
+
+
+def wav_header(sample_rate: int, num_samples: Optional[int], bits_per_sample: int = 32, audio_format: int = 3) -> bytes:
+    """Mono WAV header, audio_format 3 is IEEE float, 1 is integer PCM. No num_samples for an endless stream."""
+    num_channels = 1
+    block_align = num_channels * bits_per_sample // 8
+    byte_rate = sample_rate * block_align
+    if num_samples is None:
+        # the largest size the header can hold, players read until the stream ends
+        data_size = (0xFFFFFFFF - 36) // block_align * block_align
+    else:
+        data_size = num_samples * block_align
+    chunk_size = 36 + data_size
+
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF",
+        chunk_size,
+        b"WAVE",
+        b"fmt ",
+        16,
+        audio_format,
+        num_channels,
+        sample_rate,
+        byte_rate,
+        block_align,
+        bits_per_sample,
+        b"data",
+        data_size,
+    )
+
+
+class _Sink:
+    """
+    Write-only file for soundfile that hands out what it got since the last drain.
+    Seeking back (libsndfile patching headers on close) is refused, those writes are dropped.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self._patching = False
+
+    def write(self, data) -> int:
+        if not self._patching:
+            self._chunks.append(bytes(data))
+            self._position += len(data)
+        return len(data)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if whence == 2 or (whence == 0 and offset == self._position) or (whence == 1 and offset == 0):
+            self._patching = False
+            return self._position
+        self._patching = True
+        return offset
+
+    def tell(self) -> int:
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        return b""
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class StreamEncoder:
+    """
+    Encodes one mono float32 stream tile by tile: `header()`, `encode()` for every
+    chunk of samples in order, then `finish()`. Nothing but the current chunk is held.
+    `num_samples` is None when the length is not known up front.
+    """
+
+    def __init__(self, encoding: Encoding, sample_rate: int, num_samples: Optional[int]):
+        self.encoding = encoding
+        self.sample_rate = sample_rate
+        self.num_samples = num_samples
+        self._sink = None
+        self._file = None
+        self._first = True
+        if encoding.sf_format is not None:
+            self._sink = _Sink()
+            self._file = sf.SoundFile(
+                self._sink, mode="w", samplerate=sample_rate, channels=1,
+                format=encoding.sf_format, subtype=encoding.sf_subtype,
+            )
+
+    @property
+    def compressed(self) -> bool:
+        """Whether encoding costs enough CPU to keep it off the event loop"""
+        return self._file is not None
+
+    def header(self) -> bytes:
+        if self.encoding.name == "wav":
+            return wav_header(self.sample_rate, self.num_samples)
+        if self.encoding.name == "pcm16":
+            return wav_header(self.sample_rate, self.num_samples, bits_per_sample=16, audio_format=1)
+        return b""  # soundfile writes its own with the first samples
+
+    def encode(self, samples: npt.NDArray) -> bytes:
+        if self.encoding.name == "wav":
+            return np.asarray(samples, dtype=np.float32).tobytes()
+        # integer formats would wrap around past full scale
+        clipped = np.clip(samples, -1.0, 1.0)
+        if self.encoding.name == "pcm16":
+            return (clipped * 32767).astype("<i2").tobytes()
+        self._file.write(clipped.astype(np.float32))
+        return self._drain()
+
+    def finish(self) -> bytes:
+        if self._file is None:
+            return b""
+        self._file.close()
+        return self._drain()
+
+    def _drain(self) -> bytes:
+        data = self._sink.drain()
+        if self._first and data and self.encoding.sf_format == "FLAC" and self.num_samples is not None:
+            self._first = False
+            # the sample count is patched in on close, which a stream cannot do: set it up front
+            # (STREAMINFO starts at byte 8, its 36-bit total samples at bit 108)
+            data = bytearray(data)
+            data[21] = (data[21] & 0xF0) | ((self.num_samples >> 32) & 0x0F)
+            data[22:26] = (self.num_samples & 0xFFFFFFFF).to_bytes(4, "big")
+            data = bytes(data)
+        return data
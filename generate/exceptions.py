@@ -25,4 +25,10 @@ class StorageError(DerboukaError):
 
 class ValidationError(DerboukaError):
     """Input validation error"""
-    pass
\ No newline at end of file
+    pass
+
+class ServiceBusyError(DerboukaError):
+    """The service is at capacity, the client should retry after `retry_after` seconds"""
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
@@ -0,0 +1,37 @@
+# intervals.py
+import bisect
+import numpy as np
+import numpy.typing as npt
+from typing import Iterable, Tuple
+
+
+class IntervalIndex:
+    """
+    Sorted index over [start, end) sample intervals, built once and queried in O(log n).
+
+    Intervals are sorted by start and paired with the running maximum of their
+    ends, so a position is covered iff the furthest-reaching interval starting
+    at or before it ends after it. Overlapping intervals are handled for free.
+    """
+
+    def __init__(self, intervals: Iterable[Tuple[int, int]]):
+        bounds = np.asarray(list(intervals), dtype=np.int64).reshape(-1, 2)
+        order = np.argsort(bounds[:, 0], kind="stable")
+        self.starts = bounds[order, 0]
+        self.max_ends = np.maximum.accumulate(bounds[order, 1]) if len(bounds) else bounds[:, 1]
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __contains__(self, position: int) -> bool:
+        i = bisect.bisect_right(self.starts, position) - 1
+        return i >= 0 and self.max_ends[i] > position
+
+    def contains(self, positions: npt.NDArray) -> npt.NDArray[np.bool_]:
+        """Vectorized membership test for an array of sample positions"""
+        positions = np.asarray(positions, dtype=np.int64)
+        i = np.searchsorted(self.starts, positions, side="right") - 1
+        covered = np.zeros(len(positions), dtype=bool)
+        found = i >= 0
+        covered[found] = self.max_ends[i[found]] > positions[found]
+        return covered
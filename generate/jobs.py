@@ -0,0 +1,160 @@
+# jobs.py
+import asyncio
+import itertools
+import logging
+import math
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from exceptions import ServiceBusyError
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    """A queued generation, kept until its result expires"""
+    id: str
+    request: Any  # what the runner needs, e.g. the parsed generate body
+    sequence: int
+    status: str = "queued"  # queued, running, done, failed
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    error: Optional[str] = None
+    result: Any = None  # whatever the runner produced
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class JobManager:
+    """
+    Bounded FIFO of generation jobs served by a fixed set of workers.
+
+    At most `max_queued` jobs wait; past that `submit` raises ServiceBusyError with a
+    Retry-After estimated from recent job durations, instead of accepting more work
+    than the workers can get through. Finished jobs are kept `result_ttl` seconds,
+    then handed to `on_expire` so their files can be removed.
+
+    Runners render through run_blocking(), on a thread per worker of their own, so
+    jobs neither wait for nor hold the threads requests stream from.
+    """
+
+    def __init__(self, run: Callable[[Job], Awaitable[Any]], workers: int, max_queued: int,
+                 result_ttl: float, on_expire: Optional[Callable[[Job], None]] = None):
+        self.run = run
+        self.num_workers = workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.on_expire = on_expire
+        self.jobs: Dict[str, Job] = {}
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="job")
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._sequence = itertools.count()
+        self._dequeued = 0
+        self._running = 0
+        self._average_seconds = 5.0  # moving average of job durations, seeded with a guess
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+        self._tasks.append(asyncio.create_task(self._sweeper()))
+        logger.info(f"Started {self.num_workers} job workers, queue of {self.max_queued}")
+
+    async def close(self):
+        """Stop the workers; jobs not finished yet fail, their waiters are woken"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        metrics.GENERATION_QUEUE_DEPTH.set(0, queue="jobs")
+        for job in list(self.jobs.values()):
+            if job.status in ("queued", "running"):
+                self._fail(job, "Service shut down before the job finished")
+            self._expire(job)
+
+    async def run_blocking(self, func: Callable[..., Any], *args) -> Any:
+        """Run a blocking step of a job on the job threads"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def retry_after(self) -> int:
+        """Seconds until a queue slot is likely to free up, i.e. until the next job finishes"""
+        return max(1, math.ceil(self._average_seconds / max(1, self.num_workers)))
+
+    def submit(self, request: Any) -> Job:
+        if self.queued >= self.max_queued:
+            metrics.GENERATION_JOBS.inc(status="rejected")
+            raise ServiceBusyError("Generation queue is full", retry_after=self.retry_after())
+        job = Job(id=str(uuid.uuid4()), request=request, sequence=next(self._sequence))
+        self.jobs[job.id] = job
+        self._queue.put_nowait(job)
+        metrics.GENERATION_QUEUE_DEPTH.set(self.queued, queue="jobs")
+        metrics.GENERATION_JOBS.inc(status="submitted")
+        return job
+
+    def position(self, job: Job) -> Optional[int]:
+        """1 for the next job to start, None once it has started"""
+        if job.status != "queued":
+            return None
+        return job.sequence - self._dequeued + 1
+
+    def estimated_wait(self, job: Job) -> Optional[float]:
+        position = self.position(job)
+        if position is None:
+            return None
+        return self._average_seconds * math.ceil(position / max(1, self.num_workers))
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self._dequeued += 1
+            metrics.GENERATION_QUEUE_DEPTH.set(self.queued, queue="jobs")
+            self._running += 1
+            job.status = "running"
+            job.started = time.time()
+            try:
+                job.result = await self.run(job)
+                job.status = "done"
+                metrics.GENERATION_JOBS.inc(status="done")
+            except asyncio.CancelledError:
+                self._fail(job, "Service shut down before the job finished")
+                raise
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}", exc_info=True)
+                self._fail(job, str(e))
+            finally:
+                self._running -= 1
+                job.finished = time.time()
+                self._average_seconds = 0.8 * self._average_seconds + 0.2 * (job.finished - job.started)
+                job.done.set()
+
+    def _fail(self, job: Job, error: str):
+        job.status = "failed"
+        job.error = error
+        job.finished = job.finished or time.time()
+        job.done.set()
+        metrics.GENERATION_JOBS.inc(status="failed")
+
+    async def _sweeper(self):
+        while True:
+            await asyncio.sleep(min(60, self.result_ttl))
+            now = time.time()
+            for job in list(self.jobs.values()):
+                if job.finished is not None and now - job.finished > self.result_ttl:
+                    self._expire(job)
+
+    def _expire(self, job: Job):
+        self.jobs.pop(job.id, None)
+        if self.on_expire is not None and job.status == "done":
+            try:
+                self.on_expire(job)
+            except Exception as e:
+                logger.warning(f"Could not clean up job {job.id}: {e}")
@@ -0,0 +1,135 @@
+# live.py
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+from algorithm import GenerationPlan, generator
+import metrics
+from sample_manager import sample_manager
+
+logger = logging.getLogger(__name__)
+
+
+class LiveGroove:
+    """
+    Endless generation: the skeleton and matrix of one request played block after
+    block of `block_cycles` cycles, for as long as someone listens.
+
+    Tempo drift, the draw streams and the hits still ringing at the end of a block
+    carry over to the next, so blocks join seamlessly. Only the current block, that
+    ringing tail and the tokens of the last `history` blocks are held, whatever the
+    length of the session.
+    """
+
+    def __init__(self, bpm: float, maxsubd: int, shift_proba: float,
+                 allowed_tempo_deviation: float, skeleton: List, matrix: List, amplitude_variation: float,
+                 seed: int, block_cycles: int, sample_rate: Optional[int] = None, history: int = 16):
+        self.id = str(uuid.uuid4())
+        self.bpm = bpm
+        self.maxsubd = maxsubd
+        self.shift_proba = shift_proba
+        self.allowed_tempo_deviation = allowed_tempo_deviation
+        self.skeleton = skeleton
+        self.block_cycles = block_cycles
+        self.sample_rate = sample_rate
+        self.seed = seed
+
+        # as in plan_generation
+        self.amplitudes = generator.get_amplitudes()
+        self.amplitudes_proba = [(1 - amplitude_variation) / 2,
+                                 amplitude_variation,
+                                 (1 - amplitude_variation) / 2]
+        self.subdiv_proba = matrix[0]
+        probabilities_dict = dict(zip(generator.SUPPORTED_NOTES, matrix[1:]))
+        self.subdivision_hit_probabilities = generator.get_subdivision_hit_probabilities(
+            maxsubd=maxsubd,
+            number_of_hits=len(probabilities_dict),
+            hits_list=list(probabilities_dict),
+            probabilities_dict=probabilities_dict,
+        )
+        self.tempo_rng, self.skeleton_rng, self.subdivision_rng = (
+            np.random.default_rng(child) for child in np.random.SeedSequence(seed).spawn(3)
+        )
+
+        self.current_tempo = bpm
+        self.blocks = 0
+        self.samples = 0  # output samples produced so far
+        self.started = time.time()
+        self.tokens: Deque[dict] = deque(maxlen=history)
+        self._tail = np.zeros(0, dtype=np.float32)  # hits ringing past the last block's grid
+
+    @property
+    def seconds(self) -> float:
+        """Audio produced so far"""
+        return self.samples / (self.sample_rate or sample_manager.SAMPLE_RATE)
+
+    def plan_block(self) -> Tuple[GenerationPlan, int]:
+        """Plan the next block, returns it and the length of its beat grid"""
+        start_time = time.time()
+        sr = sample_manager.SAMPLE_RATE  # plans are made at the full rate, previews are placed afterwards
+        num_of_beats = self.block_cycles * sum(float(x[0]) for x in self.skeleton)
+        tempos, tempo_tokens = generator.get_tempos(
+            number_of_beats=num_of_beats, initial_tempo=self.bpm,
+            allowed_tempo_deviation=self.allowed_tempo_deviation,
+            rng=self.tempo_rng, start_tempo=self.current_tempo,
+        )
+        self.current_tempo = tempos[-1]
+        _, final_list, added_hits_intervals, skeleton_tokens = generator.get_exact_length(
+            skeleton=self.skeleton,
+            num_cycles=self.block_cycles,
+            tempos=tempos,
+            shift_proba=self.shift_proba,
+            sr=sr,
+            rng=self.skeleton_rng,
+        )
+        grid = generator.grid_length(self.skeleton, self.block_cycles, tempos, sr)
+        # subdivisions fill this block's grid only, the next block fills its own
+        subdivision_events, _, var_tokens = generator.plan_subdivisions(
+            total_length=grid,
+            maxsubd=self.maxsubd,
+            amplitudes=self.amplitudes,
+            amplitudes_proba_list=self.amplitudes_proba,
+            added_hits_intervals=added_hits_intervals,
+            hit_probabilities=self.subdivision_hit_probabilities,
+            subdiv_proba=self.subdiv_proba,
+            tempos=tempos,
+            sr=sr,
+            rng=self.subdivision_rng,
+        )
+        events = np.concatenate([
+            generator.skeleton_events(final_list, amplitude=self.amplitudes[-1]),
+            subdivision_events,
+        ])
+        tokens = str(tempos[0]) + "\n" + tempo_tokens + "\n" + skeleton_tokens + "\n" + var_tokens
+        plan = GenerationPlan(
+            total_length=max(grid, int((events["start"] + events["length"]).max(initial=0))),
+            events=events,
+            tokens=tokens,
+            num_hits=tokens.count("HIT_"),
+            planning_time=time.time() - start_time,
+            sample_rate=sr,
+        )
+        if self.sample_rate is not None:
+            plan = generator.resample_plan(plan, self.sample_rate)
+            grid = grid * self.sample_rate // sr
+        return plan, grid
+
+    def next_block(self) -> npt.NDArray[np.float32]:
+        """Render the next block: every sample up to its grid, final, in order"""
+        plan, grid = self.plan_block()
+        audio = np.zeros(max(plan.total_length, len(self._tail)), dtype=np.float32)
+        for offset, tile in generator.iter_tiles(plan):
+            audio[offset:offset + len(tile)] = tile
+        audio[:len(self._tail)] += self._tail
+        self._tail = audio[grid:].copy()
+
+        self.tokens.append({"block": self.blocks, "offset": self.samples, "tokens": plan.tokens})
+        self.blocks += 1
+        self.samples += grid
+        metrics.observe_generation(plan.stage_times, grid)
+        return audio[:grid]
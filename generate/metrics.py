@@ -0,0 +1,336 @@
+# metrics.py
+import asyncio
+import bisect
+import threading
+import time
+from concurrent.futures import Executor
+from typing import (
+    AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+)
+
+import anyio
+
+T = TypeVar("T")
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    """Base class: a named, optionally labelled, thread-safe metric"""
+    TYPE = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.TYPE}",
+            *self.samples(),
+        ]
+
+
+class Counter(Metric):
+    """Monotonic counter; `function` makes it read its value from elsewhere"""
+    TYPE = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function = function
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        if self._function is not None:
+            yield f"{self.name} {_format_value(self._function())}"
+            return
+        with self._lock:
+            values = dict(self._values)
+        if not values and not self.labelnames:
+            values[()] = 0
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+    TYPE = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram, in seconds by default"""
+    TYPE = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # key -> (per-bucket counts, sum)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def time(self, **labels) -> "_Timer":
+        return _Timer(self, labels)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+    """Collects metrics and renders them in the Prometheus text exposition format"""
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def timed_iter(iterable: Iterable[T], on_done: Callable[[float], None]) -> Iterator[T]:
+    """Yield from `iterable`, then report the time spent producing items (not consuming them)"""
+    iterator = iter(iterable)
+    elapsed = 0.0
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            break
+        finally:
+            elapsed += time.perf_counter() - start
+        yield item
+    on_done(elapsed)
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "derbouka_generation_stage_seconds",
+    "Time spent in each generation stage",
+    labelnames=("stage",),
+))
+GENERATIONS_IN_FLIGHT = registry.register(Gauge(
+    "derbouka_generations_in_flight",
+    "Generations currently planning, rendering or streaming",
+))
+LIVE_SESSIONS = registry.register(Gauge(
+    "derbouka_live_sessions",
+    "Live grooves currently streaming",
+))
+GENERATION_QUEUE_DEPTH = registry.register(Gauge(
+    "derbouka_generation_queue_depth",
+    "Generations waiting for a free worker, by queue: thread (planning and rendering threads), "
+    "process (worker processes), jobs (job queue)",
+    labelnames=("queue",),
+))
+BYTES_STREAMED = registry.register(Counter(
+    "derbouka_bytes_streamed_total",
+    "Audio bytes sent to clients",
+))
+STREAMS = registry.register(Counter(
+    "derbouka_audio_streams_total",
+    "Audio responses started, by encoding",
+    labelnames=("encoding",),
+))
+RENDERED_SAMPLES = registry.register(Counter(
+    "derbouka_rendered_samples_total",
+    "Audio samples rendered",
+))
+RENDER_SAMPLES_PER_SECOND = registry.register(Gauge(
+    "derbouka_render_samples_per_second",
+    "Render throughput of the last completed generation",
+))
+RENDER_CACHE_LOOKUPS = registry.register(Counter(
+    "derbouka_render_cache_lookups_total",
+    "Seeded generations looked up in the render cache, by result (hit/miss)",
+    labelnames=("result",),
+))
+ADMISSIONS = registry.register(Counter(
+    "derbouka_generation_admissions_total",
+    "Admission decisions by estimated cost: admitted, queued (waited for budget), rejected (timed out), too_large",
+    labelnames=("result",),
+))
+ADMITTED_SAMPLES = registry.register(Gauge(
+    "derbouka_generation_admitted_samples",
+    "Estimated output samples of the generations currently admitted",
+))
+GENERATION_JOBS = registry.register(Counter(
+    "derbouka_generation_jobs_total",
+    "Generation jobs by outcome: submitted, rejected (queue full), done, failed",
+    labelnames=("status",),
+))
+PUBLISHES = registry.register(Counter(
+    "derbouka_publishes_total",
+    "Publish outcomes: queued, retried, done, failed (dead-lettered)",
+    labelnames=("result",),
+))
+PUBLISH_PENDING = registry.register(Gauge(
+    "derbouka_publishes_pending",
+    "Publishes queued or in progress",
+))
+PUBLISH_OBJECTS = registry.register(Counter(
+    "derbouka_publish_objects_total",
+    "Published .derbake objects: uploaded, or skipped as already stored per the local index (indexed) or the store (exists)",
+    labelnames=("result",),
+))
+PUBLISH_BATCH_ROWS = registry.register(Histogram(
+    "derbouka_publish_batch_rows",
+    "Sound rows inserted per batch",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200),
+))
+STAGED_GENERATIONS = registry.register(Gauge(
+    "derbouka_staged_generations",
+    "Unpublished generations kept for publish, by location (memory/disk)",
+    labelnames=("location",),
+))
+STAGING_MEMORY_BYTES = registry.register(Gauge(
+    "derbouka_staging_memory_bytes",
+    "Bytes of unpublished generations held in memory",
+))
+STAGING_SPILLS = registry.register(Counter(
+    "derbouka_staging_spills_total",
+    "Unpublished generations moved from memory to disk to stay under the memory cap",
+))
+EDITED_SAMPLES = registry.register(Counter(
+    "derbouka_edited_samples_total",
+    "Output samples of edits, by source: copied from the original render or rendered again",
+    labelnames=("source",),
+))
+SOUND_CACHE_LOOKUPS = registry.register(Counter(
+    "derbouka_sound_cache_lookups_total",
+    "Published sounds looked up in the sound cache, by result (hit/miss)",
+    labelnames=("result",),
+))
+DB_CONNECTION_WAIT_SECONDS = registry.register(Histogram(
+    "derbouka_db_connection_wait_seconds",
+    "Time to get a database connection from the pool, pre-ping included",
+))
+GENERATION_FLIGHTS = registry.register(Counter(
+    "derbouka_generation_flights_total",
+    "Seeded generations by role: leader renders, follower joins an identical render in progress",
+    labelnames=("role",),
+))
+
+
+def observe_generation(stage_times: Dict[str, float], num_samples: int):
+    """Record the stage times of a finished generation and its render throughput"""
+    for stage, seconds in stage_times.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+    if "render" in stage_times:
+        RENDERED_SAMPLES.inc(num_samples)
+        if stage_times["render"] > 0:
+            RENDER_SAMPLES_PER_SECOND.set(num_samples / stage_times["render"])
+
+
+async def to_thread_queued(func: Callable[..., T], *args, executor: Optional[Executor] = None) -> T:
+    """Run `func` on `executor`, asyncio's default if None, counting the wait for a free thread as queue depth"""
+    left_queue = threading.Lock()
+
+    def leave_queue():
+        # runs from the worker when it starts, or here if it never does
+        if left_queue.acquire(blocking=False):
+            GENERATION_QUEUE_DEPTH.dec(queue="thread")
+
+    def run():
+        leave_queue()
+        return func(*args)
+
+    GENERATION_QUEUE_DEPTH.inc(queue="thread")
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, run)
+    finally:
+        leave_queue()
+
+
+async def instrument_stream(chunks: AsyncIterator[bytes], on_close: Callable[[], None]) -> AsyncIterator[bytes]:
+    """Count streamed bytes and time the stream, `on_close` runs however the stream ends"""
+    start = time.perf_counter()
+    try:
+        async for chunk in chunks:
+            BYTES_STREAMED.inc(len(chunk))
+            yield chunk
+    finally:
+        # the stream cleans up (stops its renders) before on_close lets its resources go,
+        # even when the server cancels it because the client hung up
+        if hasattr(chunks, "aclose"):
+            with anyio.CancelScope(shield=True):
+                await chunks.aclose()
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage="stream")
+        on_close()
@@ -0,0 +1,45 @@
+# pipeline.py
+import asyncio
+from typing import AsyncIterator, Iterator, Tuple
+
+import numpy.typing as npt
+
+_DONE = object()
+
+
+async def stream_tiles(tiles: Iterator[Tuple[int, npt.NDArray]], max_pending: int = 4) -> AsyncIterator[npt.NDArray]:
+    """
+    Render tiles on worker threads and yield each tile as soon as it is final.
+
+    Tiles are pulled one at a time, each on a worker thread that is released as soon
+    as the tile is rendered: no thread ever waits for the client, so slow clients
+    cannot hold the executor. At most `max_pending` tiles are rendered ahead of the
+    client. Closing the iterator (client went away) stops the rendering.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+
+    async def produce():
+        try:
+            while True:
+                item = await asyncio.to_thread(next, tiles, _DONE)
+                if item is _DONE:
+                    break
+                await queue.put(item[1])
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(_DONE)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # a tile being rendered finishes on its thread, no further tile is started
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
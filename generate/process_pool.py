@@ -0,0 +1,92 @@
+# process_pool.py
+import asyncio
+import dataclasses
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+import numpy as np
+
+from algorithm import GenerationResult, generator
+from metrics import GENERATION_QUEUE_DEPTH
+from sample_manager import sample_manager
+
+logger = logging.getLogger(__name__)
+
+
+def _attach_worker(bank_spec: dict):
+    """Worker initializer: map the parent's sample bank instead of loading samples again"""
+    sample_manager.attach_shared_bank(bank_spec)
+
+
+def _generate_in_worker(uuid: str, *args) -> Tuple[GenerationResult, int]:
+    result = generator.generate(uuid, *args)
+    # the audio already lives in ./tmp/{uuid}.dat, only send back its length
+    num_samples = len(result.audio)
+    if num_samples:
+        result.audio.flush()
+    return dataclasses.replace(result, audio=None), num_samples
+
+
+def open_audio(uuid: str, num_samples: int) -> np.ndarray:
+    """The audio a worker rendered into ./tmp/{uuid}.dat, an empty render has no file to map"""
+    if num_samples == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.memmap(filename=f"./tmp/{uuid}.dat", dtype=np.float32, mode="r", shape=(num_samples,))
+
+
+class ProcessGenerationBackend:
+    """
+    Runs DerboukaGenerator.generate in a pool of worker processes so concurrent
+    generations are not serialized on the GIL.
+
+    Workers attach to the sample bank through shared memory, and the rendered
+    audio comes back through its memmap file rather than being pickled.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # submitted and not finished, only touched from the event loop
+        self._pending = 0
+
+    def start(self):
+        bank_spec = sample_manager.share_bank()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_attach_worker,
+            initargs=(bank_spec,),
+        )
+        logger.info(f"Started {self.max_workers} generation worker processes")
+
+    async def generate(self, uuid: str, *args) -> GenerationResult:
+        """Same arguments as DerboukaGenerator.generate"""
+        loop = asyncio.get_running_loop()
+        # stats are kept here since the workers' counters are not visible to this process
+        generator.generation_stats["total_generations"].increment()
+        self._set_pending(self._pending + 1)
+        try:
+            result, num_samples = await loop.run_in_executor(
+                self._executor, _generate_in_worker, uuid, *args
+            )
+        except Exception:
+            generator.generation_stats["errors"].increment()
+            raise
+        finally:
+            self._set_pending(self._pending - 1)
+        generator.generation_stats["total_hits"].increment(result.num_hits)
+        generator.generation_stats["total_time"].increment(result.generation_time)
+
+        return dataclasses.replace(result, audio=open_audio(uuid, num_samples))
+
+    def _set_pending(self, pending: int):
+        self._pending = pending
+        GENERATION_QUEUE_DEPTH.set(max(0, pending - self.max_workers), queue="process")
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        sample_manager.release_shared_bank(unlink=True)
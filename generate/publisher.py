@@ -0,0 +1,356 @@
+# publisher.py
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field, replace
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PublishTask:
+    """One sound being published, mirrored on disk until it is done"""
+    id: str
+    user_id: str
+    metadata: dict
+    status: str = "queued"  # queued, uploading, saving, done, failed
+    attempts: int = 0  # failed attempts so far
+    error: Optional[str] = None
+    url: Optional[str] = None
+    queued: float = field(default_factory=time.time)
+    finished: Optional[float] = None
+
+
+class ContentIndex:
+    """
+    Keys of objects known to be in the object store, the `max_entries` most recently
+    added, appended to `path` so they are known across restarts. A hint: an object
+    deleted from the store behind our back stays indexed until it ages out.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._keys: "OrderedDict[str, None]" = OrderedDict()  # oldest first
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                lines = f.read().split()
+        except FileNotFoundError:
+            lines = []
+        self._keys = OrderedDict.fromkeys(lines[-self.max_entries:])
+        if len(lines) > len(self._keys):
+            # compact: duplicates and aged out keys
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                f.write("".join(key + "\n" for key in self._keys))
+            os.replace(self.path + ".tmp", self.path)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._keys
+
+    def add(self, key: str):
+        with self._lock:
+            if key in self._keys:
+                return
+            self._keys[key] = None
+            while len(self._keys) > self.max_entries:
+                self._keys.popitem(last=False)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(key + "\n")
+
+
+class Publisher:
+    """
+    Write-behind publishing. A publish is acknowledged as soon as its .derbake and
+    task are written to `directory`; the upload then runs in the background, at most
+    `max_uploads` at once, and the sound rows of finished uploads are inserted together,
+    up to `batch_size` rows waiting at most `batch_delay` seconds for a batch to fill.
+
+    Objects are content addressed: a .derbake is stored under the hash of its bytes,
+    and not uploaded again when that key is in the local index or the store has it,
+    so identical generations share one object; each sound row keeps its own URL.
+
+    A failed step is retried with exponential backoff; after `max_attempts` failures the
+    task moves to `directory`/dead with its error. Tasks still on disk are picked up
+    again at startup, so uploads and inserts must be idempotent. Finished tasks are
+    reported for `status_ttl` seconds.
+    """
+
+    def __init__(self, directory: str, upload: Callable[[bytes, str], Awaitable[str]],
+                 exists: Callable[[str], Awaitable[bool]], url: Callable[[str], str],
+                 save: Callable[[List[dict]], Awaitable[None]], max_uploads: int, batch_size: int,
+                 batch_delay: float, max_attempts: int, status_ttl: float, index_size: int):
+        self.directory = directory
+        self.dead_directory = os.path.join(directory, "dead")
+        self.upload = upload
+        self.exists = exists
+        self.url = url
+        self.save = save
+        self.index = ContentIndex(os.path.join(directory, "objects.index"), index_size)
+        self.max_uploads = max_uploads
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.max_attempts = max_attempts
+        self.status_ttl = status_ttl
+        self.tasks: Dict[str, PublishTask] = {}
+        self._writing: Dict[str, asyncio.Future] = {}  # ids whose files are being written by submit
+        self._uploads: Optional[asyncio.Queue] = None
+        self._rows: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._retries: "set[asyncio.Task]" = set()
+
+    def start(self):
+        os.makedirs(self.dead_directory, exist_ok=True)
+        self.index.load()
+        self._uploads = asyncio.Queue()
+        self._rows = asyncio.Queue()
+        for name in sorted(os.listdir(self.dead_directory)):
+            if name.endswith(".task.json"):
+                task = self._load(os.path.join(self.dead_directory, name))
+                if task is not None:
+                    self.tasks[task.id] = task
+        resumed = 0
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(".task.json"):
+                task = self._load(os.path.join(self.directory, name))
+                if task is not None:
+                    task.status = "queued"
+                    self.tasks[task.id] = task
+                    self._uploads.put_nowait(task)
+                    resumed += 1
+        metrics.PUBLISH_PENDING.set(resumed)
+        self._workers = [asyncio.create_task(self._upload_worker()) for _ in range(self.max_uploads)]
+        self._workers.append(asyncio.create_task(self._batcher()))
+        self._workers.append(asyncio.create_task(self._sweeper()))
+        logger.info(f"Publisher started, {resumed} publishes resumed, up to {self.max_uploads} uploads at once")
+
+    async def close(self):
+        """Stop; unfinished tasks stay on disk for the next start"""
+        for task in self._workers + list(self._retries):
+            task.cancel()
+        await asyncio.gather(*self._workers, *self._retries, return_exceptions=True)
+        self._workers = []
+        self._retries = set()
+
+    def get(self, audio_id: str) -> Optional[PublishTask]:
+        return self.tasks.get(audio_id)
+
+    async def submit(self, audio_id: str, user_id: str, metadata: dict, derbake: bytes) -> Tuple[PublishTask, bool]:
+        """
+        Queue a publish, returns once it is durably on disk. Also returns whether this
+        call queued it: concurrent publishes of an id all get the task of the first.
+        """
+        existing = self.tasks.get(audio_id)
+        if existing is not None and existing.status != "failed":
+            writing = self._writing.get(audio_id)
+            if writing is not None:
+                await asyncio.shield(writing)
+            return existing, False
+        task = PublishTask(id=audio_id, user_id=user_id, metadata=metadata)
+        # claimed before the first await, so the files are written once
+        self.tasks[audio_id] = task
+        writing = self._writing[audio_id] = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.to_thread(self._write_new, task, derbake)
+        except BaseException as e:
+            if existing is None:
+                self.tasks.pop(audio_id, None)
+            else:
+                self.tasks[audio_id] = existing
+            writing.set_exception(e)
+            writing.exception()  # only raised to concurrent callers, if any
+            raise
+        finally:
+            self._writing.pop(audio_id, None)
+        writing.set_result(None)
+        self._uploads.put_nowait(task)
+        metrics.PUBLISHES.inc(result="queued")
+        metrics.PUBLISH_PENDING.inc()
+        return task, True
+
+    async def resubmit(self, audio_id: str) -> Tuple[PublishTask, bool]:
+        """Publish a dead-lettered task again from its files in dead/, returns like submit"""
+        task = self.tasks[audio_id]
+        if task.status == "failed":
+            try:
+                derbake = await asyncio.to_thread(self._read_dead, audio_id)
+            except FileNotFoundError:
+                pass  # resubmitted meanwhile, its files have left dead/
+            else:
+                return await self.submit(audio_id, task.user_id, task.metadata, derbake)
+        writing = self._writing.get(audio_id)
+        if writing is not None:
+            await asyncio.shield(writing)
+        return self.tasks[audio_id], False
+
+    def _read_dead(self, audio_id: str) -> bytes:
+        with open(self._path(audio_id, ".derbake", self.dead_directory), "rb") as f:
+            return f.read()
+
+    def _path(self, audio_id: str, extension: str, directory: Optional[str] = None) -> str:
+        return os.path.join(directory or self.directory, f"{audio_id}{extension}")
+
+    def _write_new(self, task: PublishTask, derbake: bytes):
+        # publishing again after a dead letter starts over
+        for extension in (".task.json", ".derbake"):
+            try:
+                os.remove(self._path(task.id, extension, self.dead_directory))
+            except FileNotFoundError:
+                pass
+        with open(self._path(task.id, ".derbake"), "wb") as f:
+            f.write(derbake)
+            f.flush()
+            os.fsync(f.fileno())
+        self._save_task(task)
+
+    def _save_task(self, task: PublishTask, directory: Optional[str] = None):
+        # written whole then renamed, a crash leaves the old task or the new one
+        path = self._path(task.id, ".task.json", directory)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(asdict(task), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _load(self, path: str) -> Optional[PublishTask]:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return PublishTask(**json.load(f))
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Unreadable publish task {path}: {e}")
+            return None
+
+    def _read_derbake(self, audio_id: str) -> Tuple[bytes, str]:
+        """The .derbake of a task and the object key of its content"""
+        with open(self._path(audio_id, ".derbake"), "rb") as f:
+            derbake = f.read()
+        return derbake, f"derbake/{hashlib.sha256(derbake).hexdigest()}.derbake"
+
+    async def _store(self, data: bytes, key: str) -> str:
+        """Upload unless the object is already stored, returns its URL"""
+        if key in self.index:
+            metrics.PUBLISH_OBJECTS.inc(result="indexed")
+            return self.url(key)
+        if await self.exists(key):
+            metrics.PUBLISH_OBJECTS.inc(result="exists")
+            url = self.url(key)
+        else:
+            url = await self.upload(data, key)
+            metrics.PUBLISH_OBJECTS.inc(result="uploaded")
+        await asyncio.to_thread(self.index.add, key)
+        return url
+
+    async def _upload_worker(self):
+        while True:
+            task = await self._uploads.get()
+            task.status = "uploading"
+            try:
+                derbake, key = await asyncio.to_thread(self._read_derbake, task.id)
+                task.url = await self._store(derbake, key)
+            except Exception as e:
+                await self._failed(task, e, self._uploads)
+                continue
+            task.status = "saving"
+            self._rows.put_nowait(task)
+
+    async def _batcher(self):
+        while True:
+            batch = [await self._rows.get()]
+            deadline = time.monotonic() + self.batch_delay
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._rows.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self.save([self._row(task) for task in batch])
+                saved = batch
+            except Exception as e:
+                if len(batch) == 1:
+                    await self._failed(batch[0], e, self._rows)
+                    continue
+                # find the rows at fault, the others still go in
+                logger.warning(f"Batch insert of {len(batch)} sounds failed, inserting one by one: {e}")
+                saved = []
+                for task in batch:
+                    try:
+                        await self.save([self._row(task)])
+                        saved.append(task)
+                    except Exception as row_error:
+                        await self._failed(task, row_error, self._rows)
+            for task in saved:
+                await self._done(task)
+            if saved:
+                metrics.PUBLISH_BATCH_ROWS.observe(len(saved))
+
+    @staticmethod
+    def _row(task: PublishTask) -> dict:
+        return {"id": task.id, "generated_by": task.user_id, "settings": task.metadata, "url": task.url}
+
+    async def _done(self, task: PublishTask):
+        # reported done only once its files are gone, a resubmit must not race the removal
+        await asyncio.to_thread(self._remove_files, task.id)
+        task.status = "done"
+        task.error = None
+        task.finished = time.time()
+        metrics.PUBLISHES.inc(result="done")
+        metrics.PUBLISH_PENDING.dec()
+        logger.info(f"Published {task.id} for user {task.user_id}")
+
+    async def _failed(self, task: PublishTask, error: Exception, queue: asyncio.Queue):
+        task.attempts += 1
+        task.error = str(error)
+        if task.attempts >= self.max_attempts:
+            finished = time.time()
+            logger.error(f"Publish of {task.id} failed {task.attempts} times, dead-lettered: {error}")
+            # likewise reported failed, and so resubmittable, only once dead-lettered
+            await asyncio.to_thread(self._dead_letter, replace(task, status="failed", finished=finished))
+            task.status = "failed"
+            task.finished = finished
+            metrics.PUBLISHES.inc(result="failed")
+            metrics.PUBLISH_PENDING.dec()
+            return
+        delay = min(60, 2 ** task.attempts)
+        logger.warning(f"Publish of {task.id} failed ({task.attempts}/{self.max_attempts}), retrying in {delay}s: {error}")
+        metrics.PUBLISHES.inc(result="retried")
+        await asyncio.to_thread(self._save_task, task)
+        retry = asyncio.create_task(self._retry_later(task, delay, queue))
+        self._retries.add(retry)
+        retry.add_done_callback(self._retries.discard)
+
+    async def _retry_later(self, task: PublishTask, delay: float, queue: asyncio.Queue):
+        await asyncio.sleep(delay)
+        queue.put_nowait(task)
+
+    def _dead_letter(self, task: PublishTask):
+        self._save_task(task, self.dead_directory)
+        os.replace(self._path(task.id, ".derbake"), self._path(task.id, ".derbake", self.dead_directory))
+        os.remove(self._path(task.id, ".task.json"))
+
+    def _remove_files(self, audio_id: str):
+        for extension in (".task.json", ".derbake"):
+            try:
+                os.remove(self._path(audio_id, extension))
+            except FileNotFoundError:
+                pass
+
+    async def _sweeper(self):
+        while True:
+            await asyncio.sleep(min(60, self.status_ttl))
+            now = time.time()
+            for task in list(self.tasks.values()):
+                if task.status == "done" and now - task.finished > self.status_ttl:
+                    self.tasks.pop(task.id, None)
@@ -0,0 +1,188 @@
+# render_cache.py
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import numpy.typing as npt
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedRender:
+    """A rendered generation read back from the cache, audio is a read-only memmap"""
+    audio: npt.NDArray[np.float32]
+    tokens: str
+    num_hits: int
+    generation_time: float
+    events: Optional[npt.NDArray] = None  # the event plan, if it was stored with the entry
+
+
+class RenderCache:
+    """
+    Size-bounded LRU cache of rendered generations on disk, keyed by the normalized
+    request parameters and seed. An entry is `<key>.f32` (raw float32 samples) plus
+    `<key>.json` (tokens and stats), and `<key>.events.npy` (the event plan) when known. Recency survives restarts through the .f32 mtime.
+    """
+    VERSION = 2  # bump whenever the generator's output for a given seed changes
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.salt = ""
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # key -> bytes, least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def load(self, salt: str = ""):
+        """
+        Index the entries already on disk. `salt` identifies everything besides the request
+        that changes the audio (sample bank, volume, sample rate), so changing it misses.
+        """
+        self.salt = salt
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                os.remove(path)  # interrupted write
+            elif name.endswith(".f32") and os.path.exists(path[:-len(".f32")] + ".json"):
+                stat = os.stat(path)
+                found.append((stat.st_mtime, name[:-len(".f32")], stat.st_size))
+        with self._lock:
+            for _, key, size in sorted(found):
+                self._entries[key] = size
+                self._size += size
+            self._evict_locked()
+        logger.info(f"Render cache: {len(self._entries)} entries, {self._size / 1e6:.1f} MB in {self.directory}")
+
+    def make_key(self, params: dict, seed: int) -> str:
+        payload = json.dumps(
+            {"version": self.VERSION, "salt": self.salt, "params": params, "seed": seed},
+            sort_keys=True, separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{key}{extension}")
+
+    def get(self, key: str) -> Optional[CachedRender]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        try:
+            with open(self._path(key, ".json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            audio_path = self._path(key, ".f32")
+            if meta["num_samples"]:
+                audio = np.memmap(audio_path, dtype=np.float32, mode="r", shape=(meta["num_samples"],))
+            else:
+                audio = np.zeros(0, dtype=np.float32)
+            os.utime(audio_path)
+            events_path = self._path(key, ".events.npy")
+            events = np.load(events_path) if os.path.exists(events_path) else None
+        except (OSError, ValueError, KeyError) as e:
+            # evicted by another request in the meantime, or damaged
+            logger.warning(f"Render cache entry {key} unreadable: {e}")
+            with self._lock:
+                self._drop_locked(key)
+            return None
+        return CachedRender(
+            audio=audio,
+            tokens=meta["tokens"],
+            num_hits=meta["num_hits"],
+            generation_time=meta["generation_time"],
+            events=events,
+        )
+
+    def writer(self, key: str, num_samples: int, tokens: str, num_hits: int,
+               generation_time: float, events: Optional[npt.NDArray] = None) -> Optional["CacheWriter"]:
+        """A writer for a render about to stream, None if it could never fit in the cache"""
+        if not self.enabled or num_samples * 4 > self.max_bytes:
+            return None
+        meta = {
+            "num_samples": num_samples,
+            "tokens": tokens,
+            "num_hits": num_hits,
+            "generation_time": generation_time,
+        }
+        return CacheWriter(self, key, meta, events)
+
+    def _commit(self, key: str, audio_tmp: str, meta: dict, events: Optional[npt.NDArray] = None):
+        json_tmp = self._path(key, f".{uuid.uuid4().hex}.tmp")
+        with open(json_tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        if events is not None:
+            events_tmp = self._path(key, f".{uuid.uuid4().hex}.tmp")
+            with open(events_tmp, "wb") as f:
+                np.save(f, events)
+            os.replace(events_tmp, self._path(key, ".events.npy"))
+        os.replace(audio_tmp, self._path(key, ".f32"))
+        os.replace(json_tmp, self._path(key, ".json"))
+        size = meta["num_samples"] * 4
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._size += size
+            self._evict_locked()
+
+    def _drop_locked(self, key: str):
+        self._size -= self._entries.pop(key, 0)
+        for extension in (".f32", ".json", ".events.npy"):
+            try:
+                os.remove(self._path(key, extension))
+            except FileNotFoundError:
+                pass
+
+    def _evict_locked(self):
+        # files still memory-mapped by a stream stay readable until it finishes
+        while self._size > self.max_bytes and self._entries:
+            self._drop_locked(next(iter(self._entries)))
+
+
+class CacheWriter:
+    """Collects the samples of one render as they stream; the entry is only kept if complete"""
+
+    def __init__(self, cache: RenderCache, key: str, meta: dict, events: Optional[npt.NDArray] = None):
+        self.cache = cache
+        self.key = key
+        self.meta = meta
+        self.events = events
+        self.path = cache._path(key, f".{uuid.uuid4().hex}.tmp")
+        self._file = open(self.path, "wb")
+        self._written = 0
+
+    def write(self, samples: npt.NDArray):
+        samples = np.ascontiguousarray(samples, dtype=np.float32)
+        self._file.write(memoryview(samples).cast("B"))
+        self._written += len(samples)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+        if self._written == self.meta["num_samples"]:
+            try:
+                self.cache._commit(self.key, self.path, self.meta, self.events)
+                return
+            except OSError as e:
+                logger.warning(f"Could not cache render {self.key}: {e}")
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
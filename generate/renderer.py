@@ -0,0 +1,121 @@
+# renderer.py
+import numpy as np
+import numpy.typing as npt
+from collections import Counter
+from typing import Callable, Iterator, List, Tuple
+
+# One row per hit that has to be mixed into the output buffer
+EVENT_DTYPE = np.dtype([
+    ("start", np.int64),        # first sample of the hit in the output buffer
+    ("length", np.int64),       # length of the source sample
+    ("note", np.int16),         # index into DerboukaGenerator.SUPPORTED_NOTES
+    ("sample", np.int32),       # sample number inside the note's sample set
+    ("amplitude", np.float32),
+    ("variant", np.int8),       # row of the sample bank: amplitude bin, or the skeleton variant
+])
+
+# (note, sample, length, variant) -> read-only, already scaled audio for one hit
+SampleSource = Callable[[int, int, int, int], npt.NDArray]
+
+
+def make_events(rows: List[Tuple[int, int, int, int, float, int]]) -> npt.NDArray:
+    """Build an event array from (start, length, note, sample, amplitude, variant) rows"""
+    return np.array(rows, dtype=EVENT_DTYPE)
+
+
+class TiledRenderer:
+    """
+    Mixes skeleton and subdivision hits into the output in one forward sweep.
+
+    Events are sorted by start once, then every tile of the output is built
+    in memory from the hits that overlap it and written exactly once, so the
+    cost is linear in (samples + hits) instead of (chunks x hits).
+    """
+
+    def __init__(self, sample_source: SampleSource, tile_size: int = 300_000):
+        self.sample_source = sample_source
+        self.tile_size = tile_size
+
+    def iter_tiles(self, events: npt.NDArray, total_length: int,
+                   start: int = 0) -> Iterator[Tuple[int, npt.NDArray[np.float32]]]:
+        """
+        Yield (offset, tile) pairs in output order, from `start` on. A tile is final once yielded.
+        """
+        events = events[events["start"] + events["length"] > start]
+        events = events[np.argsort(events["start"], kind="stable")]
+        starts = events["start"]
+        ends = starts + events["length"]
+
+        next_event = 0
+        # (end, start, audio view) for every hit still sounding
+        active = []
+        for tile_start in range(start, total_length, self.tile_size):
+            tile_end = min(tile_start + self.tile_size, total_length)
+            tile = np.zeros(tile_end - tile_start, dtype=np.float32)
+
+            while next_event < len(events) and starts[next_event] < tile_end:
+                event = events[next_event]
+                audio = self.sample_source(
+                    int(event["note"]), int(event["sample"]), int(event["length"]), int(event["variant"])
+                )
+                active.append((int(ends[next_event]), int(starts[next_event]), audio))
+                next_event += 1
+
+            still_active = []
+            for end, hit_start, audio in active:
+                lo = max(hit_start, tile_start)
+                hi = min(end, tile_end)
+                if hi > lo:
+                    tile[lo - tile_start:hi - tile_start] += audio[lo - hit_start:hi - hit_start]
+                if end > tile_end:
+                    still_active.append((end, hit_start, audio))
+            active = still_active
+
+            yield tile_start, tile
+
+    def render(self, out: npt.NDArray, events: npt.NDArray) -> npt.NDArray:
+        """
+        Overwrite `out` with the mix of `events`. Hits running past the end are cut.
+        """
+        for offset, tile in self.iter_tiles(events, len(out)):
+            out[offset:offset + len(tile)] = tile
+        return out
+
+    def render_range(self, out: npt.NDArray, events: npt.NDArray, start: int, end: int) -> npt.NDArray:
+        """
+        Overwrite `out[start:end]` with the mix of `events`, the rest of `out` is left as is.
+        """
+        for offset, tile in self.iter_tiles(events, min(end, len(out)), start):
+            out[offset:offset + len(tile)] = tile
+        return out
+
+
+def changed_ranges(old: npt.NDArray, new: npt.NDArray, old_length: int, new_length: int) -> List[Tuple[int, int]]:
+    """
+    Sorted, disjoint [start, end) sample ranges where the mix of `new` can differ from
+    the mix of `old`: wherever a hit was removed or added, and past the old length.
+    """
+    remaining = Counter(row.tobytes() for row in old)
+    added = []
+    for row in new:
+        key = row.tobytes()
+        if remaining[key]:
+            remaining[key] -= 1
+        else:
+            added.append(row)
+    removed = [np.frombuffer(key, dtype=EVENT_DTYPE, count=1)[0]
+               for key, count in remaining.items() for _ in range(count)]
+
+    ranges = [(int(row["start"]), int(row["start"] + row["length"])) for row in added + removed]
+    if new_length > old_length:
+        ranges.append((old_length, new_length))
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        start, end = max(start, 0), min(end, new_length)
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
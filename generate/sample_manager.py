@@ -1,6 +1,21 @@
-import random
 import os
-import librosa
+import numpy as np
+import numpy.typing as npt
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple
+from samplebank import DEFAULT_PREFIX, load_packed_samples
+
+
+def cross_fade(hit_y: npt.NDArray, fade_samples: int = 500) -> npt.NDArray:
+    """Cosine fade-in/fade-out on a copy of the hit"""
+    if len(hit_y) <= fade_samples * 2:
+        fade_samples = max(8, len(hit_y) // 4)
+    fade_in = 0.5 * (1 - np.cos(np.linspace(0, np.pi, fade_samples)))
+    fade_out = 0.5 * (1 + np.cos(np.linspace(0, np.pi, fade_samples)))
+    hit_audio = hit_y.copy()
+    hit_audio[:fade_samples] *= fade_in
+    hit_audio[-fade_samples:] *= fade_out
+    return hit_audio
 
 class SampleManager():
     def __init__(self):
@@ -14,13 +29,65 @@ class SampleManager():
         }
         self.AUDIO_SOUNDS = {}
         self.SAMPLE_RATE = 48000
+        self.PACKED_SAMPLES = DEFAULT_PREFIX  # built by pack_samples.py
+        # Precomputed hits, one row per variant: the cross-faded sample at every
+        # amplitude bin, the raw sample at the loudest bin for the skeleton,
+        # then the raw sample itself
+        self.BANK: Optional[npt.NDArray[np.float32]] = None
+        self.BANK_SLOTS = {}  # (symbol, num) -> (offset, length) in BANK
+        self.AMPLITUDES: List[float] = []
+        # sample rate -> (bank, slots): the bank resampled once for preview renders
+        self.PREVIEW_BANKS: Dict[int, Tuple[npt.NDArray[np.float32], dict]] = {}
+        self._shared_bank: Optional[shared_memory.SharedMemory] = None
+
+    @property
+    def skeleton_variant(self) -> int:
+        return len(self.AMPLITUDES)
+
+    @property
+    def raw_variant(self) -> int:
+        return len(self.AMPLITUDES) + 1
+
+    def preload_samples(self, amplitudes: Optional[List[float]] = None, preview_sample_rates: Sequence[int] = ()):
+        if not self.load_packed_samples():
+            self.decode_samples()
+        if amplitudes:
+            self.build_bank(amplitudes)
+            for sample_rate in preview_sample_rates:
+                self.build_preview_bank(sample_rate)
+
+    def load_packed_samples(self) -> bool:
+        """
+        Attach to the packed .npy bank read-only. Every sample is a view into the
+        memory map, so worker processes share the pages instead of holding copies.
+        """
+        try:
+            data, index = load_packed_samples(self.PACKED_SAMPLES)
+        except FileNotFoundError:
+            print("NO PACKED SAMPLES AT ", self.PACKED_SAMPLES)
+            return False
+        if index["sample_rate"] != self.SAMPLE_RATE:
+            print("PACKED SAMPLES ARE AT ", index["sample_rate"], "HZ, EXPECTED ", self.SAMPLE_RATE)
+            return False
+
+        for note in self.NOTES:
+            curr = {}
+            for counter, entry in enumerate(index["symbols"][note], start=1):
+                start, length = entry["offset"], entry["length"]
+                curr[counter] = (length, data[start:start + length])
+            self.AUDIO_SOUNDS[note] = curr
+        print("LOADED PACKED SAMPLES FROM ", self.PACKED_SAMPLES)
+        return True
+
+    def decode_samples(self):
+        """Slow path: decode and resample every WAV with librosa"""
+        import librosa
 
-    def preload_samples(self):
         for note in self.NOTES:
             counter = 0
             print("FETCHING AUDIO FOR ", note)
             directory = self.PATHS.get(note)
-            files = os.listdir(directory)
+            files = sorted(os.listdir(directory))
             curr = {}
             for file in files:
                 counter += 1
@@ -29,14 +96,133 @@ class SampleManager():
                 curr[counter] = (len(y), y)
             self.AUDIO_SOUNDS[note] = curr
 
+    def build_bank(self, amplitudes: List[float]):
+        """
+        Fade and scale every loaded sample once so mixing only adds read-only views.
+        """
+        slots = {}
+        offset = 0
+        for note in self.NOTES:
+            for num, (length, _) in self.AUDIO_SOUNDS.get(note, {}).items():
+                slots[(note, num)] = (offset, length)
+                offset += length
+
+        bank = np.empty((len(amplitudes) + 2, offset), dtype=np.float32)
+        for (note, num), (start, length) in slots.items():
+            y = np.asarray(self.AUDIO_SOUNDS[note][num][1], dtype=np.float32)
+            faded = cross_fade(y)
+            for variant, amplitude in enumerate(amplitudes):
+                bank[variant, start:start + length] = amplitude * faded
+            bank[-2, start:start + length] = amplitudes[-1] * y
+            bank[-1, start:start + length] = y
+
+        self._use_bank(bank, slots, amplitudes)
 
-    def get_random_sample(self, symbol:str):
-        num = random.choice(list(self.AUDIO_SOUNDS[symbol].keys()))
+    def build_preview_bank(self, sample_rate: int):
+        """Resample every hit of the bank to `sample_rate`, all variants at once"""
+        import soxr
+
+        slots = {}
+        offset = 0
+        resampled = []
+        for key, (start, length) in self.BANK_SLOTS.items():
+            # (frames, variants) so soxr treats the variants as channels
+            y = soxr.resample(self.BANK[:, start:start + length].T, self.SAMPLE_RATE, sample_rate)
+            slots[key] = (offset, len(y))
+            offset += len(y)
+            resampled.append(y)
+
+        bank = np.empty((self.BANK.shape[0], offset), dtype=np.float32)
+        for (start, length), y in zip(slots.values(), resampled):
+            bank[:, start:start + length] = y.T
+        bank.flags.writeable = False
+        self.PREVIEW_BANKS[sample_rate] = (bank, slots)
+
+    def bank_slots(self, sample_rate: Optional[int] = None) -> dict:
+        """(symbol, num) -> (offset, length) in the bank at `sample_rate`, the full rate by default"""
+        if sample_rate is None or sample_rate == self.SAMPLE_RATE:
+            return self.BANK_SLOTS
+        return self.PREVIEW_BANKS[sample_rate][1]
+
+    def share_bank(self) -> dict:
+        """
+        Move the bank into shared memory. Returns the spec worker processes pass
+        to attach_shared_bank to map the same pages instead of reloading samples.
+        """
+        shm = shared_memory.SharedMemory(create=True, size=max(self.BANK.nbytes, 1))
+        shared = np.ndarray(self.BANK.shape, dtype=np.float32, buffer=shm.buf)
+        shared[:] = self.BANK
+        self._shared_bank = shm
+        self._use_bank(shared, self.BANK_SLOTS, self.AMPLITUDES)
+        return {
+            "name": shm.name,
+            "shape": shared.shape,
+            "slots": self.BANK_SLOTS,
+            "amplitudes": self.AMPLITUDES,
+            "preview_sample_rates": list(self.PREVIEW_BANKS),
+        }
+
+    def attach_shared_bank(self, spec: dict):
+        shm = shared_memory.SharedMemory(name=spec["name"])
+        self._shared_bank = shm
+        bank = np.ndarray(spec["shape"], dtype=np.float32, buffer=shm.buf)
+        self._use_bank(bank, spec["slots"], spec["amplitudes"])
+        # small next to the full bank, cheaper to rebuild than to share
+        for sample_rate in spec.get("preview_sample_rates", ()):
+            self.build_preview_bank(sample_rate)
+
+    def release_shared_bank(self, unlink: bool = False):
+        """Drop the shared bank, the owner also unlinks it"""
+        if self._shared_bank is None:
+            return
+        self.BANK = None
+        self.AUDIO_SOUNDS = {}
+        self.PREVIEW_BANKS = {}
+        shm, self._shared_bank = self._shared_bank, None
+        try:
+            shm.close()
+        except BufferError:
+            pass  # views are still alive, the mapping goes away with the process
+        if unlink:
+            shm.unlink()
+
+    def _use_bank(self, bank: npt.NDArray[np.float32], slots: dict, amplitudes: List[float]):
+        bank.flags.writeable = False
+        self.BANK = bank
+        self.BANK_SLOTS = slots
+        self.AMPLITUDES = list(amplitudes)
+        # raw samples become views into the bank so there is a single copy of the audio
+        sounds = {}
+        for (note, num), (start, length) in slots.items():
+            sounds.setdefault(note, {})[num] = (length, bank[self.raw_variant, start:start + length])
+        self.AUDIO_SOUNDS = sounds
+
+
+    def get_random_sample(self, symbol:str, draw:float):
+        """Pick a sample with a uniform [0, 1) draw"""
+        nums = list(self.AUDIO_SOUNDS[symbol].keys())
+        num = nums[min(int(draw * len(nums)), len(nums) - 1)]
         return symbol, num, self.AUDIO_SOUNDS[symbol][num][0]
 
+    def get_samples_by_draw(self, symbol:str, draws:npt.NDArray):
+        """Pick a sample of a symbol for each uniform [0, 1) draw, returns (sample numbers, lengths)"""
+        nums = np.fromiter(self.AUDIO_SOUNDS[symbol].keys(), dtype=np.int32)
+        lengths = np.fromiter((v[0] for v in self.AUDIO_SOUNDS[symbol].values()), dtype=np.int64)
+        picked = np.minimum((np.asarray(draws) * len(nums)).astype(np.int64), len(nums) - 1)
+        return nums[picked], lengths[picked]
+
     def get_y(self, symbol:str, num:int, length:int):
         y= self.AUDIO_SOUNDS[symbol][num][1]
         assert len(y)==length
         return y
 
+    def get_hit(self, symbol:str, num:int, variant:int, sample_rate: Optional[int] = None):
+        """Read-only view of a precomputed hit from the bank, or from the preview bank at `sample_rate`"""
+        if sample_rate is None or sample_rate == self.SAMPLE_RATE:
+            start, length = self.BANK_SLOTS[(symbol, num)]
+            return self.BANK[variant, start:start + length]
+        bank, slots = self.PREVIEW_BANKS[sample_rate]
+        start, length = slots[(symbol, num)]
+        return bank[variant, start:start + length]
+
 sample_manager = SampleManager()
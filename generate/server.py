@@ -1,30 +1,48 @@
 # fastapi_server.py
 from fastapi import FastAPI, HTTPException, Request, Response, Depends
 from fastapi.responses import StreamingResponse, JSONResponse
+from starlette.concurrency import iterate_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
 import jwt
 import uuid
 import os
 import asyncio
-import aiofiles
+import anyio
 import json
 import logging
 import time
+import secrets
 import soundfile as sf
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 from functools import wraps
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
 import numpy as np
 
 from settings import settings
-from algorithm import generator
-from db.schema import init_models
+from algorithm import generator, CostEstimate
 from exceptions import (
     DerboukaError, AuthenticationError, ValidationError,
-    StorageError, AudioGenerationError
+    StorageError, AudioGenerationError, ServiceBusyError
 )
-from storage import s3_manager, db_manager
+from storage import object_store, db_manager
 from sample_manager import sample_manager
+from process_pool import ProcessGenerationBackend
+from pipeline import stream_tiles
+from renderer import changed_ranges
+from render_cache import RenderCache
+from staging import StagedGeneration, StagingStore
+from sound_cache import SoundCache
+from publisher import Publisher, PublishTask
+from singleflight import Flight, SingleFlight, SpillWriter
+from jobs import Job, JobManager
+from admission import AdmissionController
+from live import LiveGroove
+from encoding import StreamEncoder, negotiate
+import derbake
+import metrics
 
 # Configure logging
 logging.basicConfig(
@@ -33,6 +51,88 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Worker processes for generation when GENERATION_BACKEND=process, threads otherwise
+process_backend = (
+    ProcessGenerationBackend(settings.MAX_WORKER_THREADS)
+    if settings.GENERATION_BACKEND == "process" else None
+)
+
+# Planning and whole renders on the thread backend, and live blocks
+render_executor = ThreadPoolExecutor(settings.MAX_WORKER_THREADS, thread_name_prefix="render")
+# FLAC/Opus encoding of streamed audio, apart from the executor rendering and planning use
+encode_executor = ThreadPoolExecutor(settings.ENCODE_WORKER_THREADS, thread_name_prefix="encode")
+
+# Rendered audio of every request: replaying a seeded preset streams from disk, edits patch it
+render_cache = RenderCache(settings.RENDER_CACHE_DIR, settings.RENDER_CACHE_MAX_BYTES)
+# Metadata and tokens of generations until they are published or expire
+staging = StagingStore(settings.AUDIO_TEMP_DIR, settings.STAGING_MAX_BYTES, settings.SAMPLE_CACHE_TTL_SECONDS)
+
+
+async def load_sound(sound_id: str) -> Optional[Dict[str, Any]]:
+    sound = await db_manager.get_sound(sound_id)
+    if sound is None:
+        return None
+    # served without authentication, so without who published it
+    return {"id": sound.id, "url": sound.url, "settings": sound.settings}
+
+
+async def save_published(rows: list):
+    await db_manager.save_sounds(rows)
+    for row in rows:
+        sound_cache.invalidate(row["id"])
+
+
+# Published sounds served by /api/generate/sounds/{id}
+sound_cache = SoundCache(
+    load_sound, settings.SOUND_CACHE_MAX_ENTRIES, settings.SOUND_CACHE_TTL_SECONDS,
+    settings.SOUND_CACHE_MISSING_TTL_SECONDS,
+)
+# Uploads and sound rows of published generations, after the publish request returns
+publisher = Publisher(
+    settings.PUBLISH_QUEUE_DIR,
+    upload=object_store.upload_bytes,
+    exists=object_store.exists,
+    url=object_store.url,
+    save=save_published,
+    max_uploads=settings.S3_MAX_CONNECTIONS,
+    batch_size=settings.PUBLISH_BATCH_SIZE,
+    batch_delay=settings.PUBLISH_BATCH_DELAY_SECONDS,
+    max_attempts=settings.PUBLISH_MAX_ATTEMPTS,
+    status_ttl=settings.PUBLISH_STATUS_TTL_SECONDS,
+    index_size=settings.PUBLISH_INDEX_MAX_ENTRIES,
+)
+# Seeded generations in progress, identical requests attach to them instead of rendering again
+flights = SingleFlight(settings.FLIGHT_IO_THREADS)
+# Bounds the audio rendering at once, by the size estimated from the request
+admission = AdmissionController(
+    max_request_samples=settings.MAX_REQUEST_SAMPLES,
+    max_request_hits=settings.MAX_REQUEST_HITS,
+    budget_samples=settings.GENERATION_SAMPLE_BUDGET,
+    per_client_samples=settings.CLIENT_SAMPLE_BUDGET,
+    timeout=settings.ADMISSION_TIMEOUT_SECONDS,
+)
+
+# Expose the generator's own counters next to the stage metrics
+for _name, _stat, _help in [
+    ("derbouka_generations_total", "total_generations", "Generations started"),
+    ("derbouka_generation_hits_total", "total_hits", "Hits planned across all generations"),
+    ("derbouka_generation_errors_total", "errors", "Generations that failed"),
+    ("derbouka_generation_seconds_total", "total_time", "Seconds spent planning and rendering"),
+]:
+    metrics.registry.register(metrics.Counter(
+        _name, _help, function=lambda counter=generator.generation_stats[_stat]: counter.value
+    ))
+
+# Database connection pool, to size DATABASE_POOL_SIZE and DATABASE_MAX_OVERFLOW against real traffic
+for _state, _help in [
+    ("checked_out", "Database connections in use"),
+    ("idle", "Database connections idle in the pool"),
+    ("overflow", "Database connections opened beyond DATABASE_POOL_SIZE"),
+]:
+    metrics.registry.register(metrics.Gauge(
+        f"derbouka_db_pool_{_state}", _help, function=lambda state=_state: db_manager.pool_status()[state]
+    ))
+
 # ============================================================================
 # FastAPI App - replaces Flask(__name__)
 # ============================================================================
@@ -72,6 +172,14 @@ async def handle_derbouka_error(request: Request, exc: DerboukaError):
         content={"error": str(exc), "type": exc.__class__.__name__}
     )
 
+@app.exception_handler(ServiceBusyError)
+async def handle_service_busy(request: Request, exc: ServiceBusyError):
+    return JSONResponse(
+        status_code=429,
+        content={"error": str(exc), "type": exc.__class__.__name__, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 @app.exception_handler(HTTPException)
 async def handle_http_error(request: Request, exc: HTTPException):
     return JSONResponse(
@@ -105,6 +213,18 @@ async def get_current_user(request: Request) -> str:
     except jwt.InvalidTokenError as e:
         raise AuthenticationError(f"Invalid token: {e}")
 
+def client_identity(request: Request) -> str:
+    """Who a request counts against for admission: the signed-in user, else the client address"""
+    token = request.cookies.get("token")
+    if token:
+        try:
+            user_id = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.JWT_ALGORITHM]).get("id")
+            if user_id:
+                return f"user:{user_id}"
+        except jwt.InvalidTokenError:
+            pass
+    return f"address:{request.client.host if request.client else 'unknown'}"
+
 # ============================================================================
 # Test endpoint - replaces @app.get("/api/generate/test/")
 # ============================================================================
@@ -112,72 +232,102 @@ async def get_current_user(request: Request) -> str:
 async def test():
     return {"status": "ok", "message": "Service is running"}  # FastAPI auto-converts to JSON with 200
 
+# ============================================================================
+# Metrics endpoint - Prometheus text format
+# ============================================================================
+@app.get("/api/generate/metrics")
+async def get_metrics():
+    return Response(content=metrics.registry.render(), media_type=metrics.Registry.CONTENT_TYPE)
+
 # ============================================================================
 # Publish endpoint - replaces @app.get("/api/generate/publish/") with @require_auth
 # ============================================================================
-@app.get("/api/generate/publish/")
-async def publish(request: Request, user_id: str = Depends(get_current_user)):
+def publish_status(task: PublishTask) -> dict:
+    status = {
+        "id": task.id,
+        "status": task.status,
+        "attempts": task.attempts,
+        "queued": task.queued,
+        "finished": task.finished,
+    }
+    if task.status == "done":
+        status["url"] = task.url
+    elif task.error is not None:
+        status["error"] = task.error
+    return status
+
+
+@app.get("/api/generate/publish/", status_code=202)
+async def publish(request: Request, response: Response, user_id: str = Depends(get_current_user)):
     # user_id comes from the dependency, replaces request.user_id
     
     audio_id = request.query_params.get("id")  # replaces request.args.get("id")
     if not audio_id:
         raise ValidationError("Missing ?id parameter")
     
-    data_dir = settings.AUDIO_TEMP_DIR
-    json_path = os.path.join(data_dir, f"{audio_id}.json")
-    derbake_path = os.path.join(data_dir, f"{audio_id}.derbake")
-    
-    # Check if files exist
-    missing_files = []
-    for path in [json_path, derbake_path]:
-        if not os.path.exists(path):
-            missing_files.append(os.path.basename(path))
-    
-    if missing_files:
-        raise ValidationError(f"Files not found: {', '.join(missing_files)}")
+    staged = await staging.get(audio_id)
+    if staged is None:
+        task = publisher.get(audio_id)
+        if task is None or task.user_id != user_id:
+            raise ValidationError(f"Generation {audio_id} not found, it may have expired")
+        if task.status == "failed":
+            # dead-lettered, its files are kept to publish it again
+            task, queued = await publisher.resubmit(audio_id)
+            if queued:
+                logger.info(f"Queued publish of {audio_id} again for user {user_id}")
+    else:
+        # acknowledged once queued on disk, the upload and the database row follow
+        task, queued = await publisher.submit(audio_id, user_id, staged.metadata, staged.derbake)
+        if queued:
+            staging.discard(audio_id)
+            logger.info(f"Queued publish of {audio_id} for user {user_id}")
     
-    try:
-        # Load metadata
-        async with aiofiles.open(json_path, "r", encoding="utf-8") as f:
-            metadata_str = await f.read()
-            metadata = json.loads(metadata_str)
-        
-        # Upload to S3 in parallel
-        upload_mappings = {
-            derbake_path: f"{audio_id}.derbake"
-        }
-        
-        urls = await s3_manager.upload_files_batch(upload_mappings)
-        uploaded_url = f"https://{settings.S3_BUCKET}.s3.{settings.S3_REGION}.amazonaws.com/{audio_id}.derbake"
-        # Save to database
-        await db_manager.save_sound(
-            sound_id=audio_id,
-            user_id=user_id,  # replaces request.user_id
-            settings_dict=metadata,
-            url=uploaded_url
-        )
-        
-        # Delete local files
-        delete_tasks = [
-            asyncio.to_thread(os.remove, json_path),
-            asyncio.to_thread(os.remove, derbake_path)
-        ]
-        await asyncio.gather(*delete_tasks, return_exceptions=True)
-        
-        logger.info(f"Published audio {audio_id} for user {user_id}")
-        return {"status": "ok", "id": audio_id, "url": uploaded_url}  # Auto 200
-        
-    except Exception as e:
-        logger.error(f"Publish failed for {audio_id}: {e}", exc_info=True)
-        raise  # FastAPI will handle through exception handlers
+    response.headers["Location"] = f"/api/generate/publish/{audio_id}"
+    return publish_status(task)
+
+
+@app.get("/api/generate/publish/{audio_id}")
+async def get_publish(audio_id: str, user_id: str = Depends(get_current_user)):
+    task = publisher.get(audio_id)
+    if task is None or task.user_id != user_id:
+        raise HTTPException(status_code=404, detail=f"No publish of {audio_id}")
+    return publish_status(task)
 
 # ============================================================================
-# Generate endpoint - replaces @app.post('/api/generate/') with streaming
+# Generation helpers - shared by /api/generate/ and /api/generate/jobs
 # ============================================================================
-@app.post('/api/generate/')
-async def generate(request: Request):
+def parse_preview(preview) -> int:
+    """Output rate of {"preview": true} or {"preview": 16000}: same hits and tokens, rendered at a lower rate"""
+    if isinstance(preview, str) and preview.lower() in ("true", "false"):
+        preview = preview.lower() == "true"  # from a query string
+    if preview is None or preview is False:
+        return settings.AUDIO_SAMPLE_RATE
+    if preview is True:
+        return settings.PREVIEW_SAMPLE_RATE
     try:
-        data = await request.json()  # replaces request.get_json()
+        sample_rate = int(preview)
+    except (TypeError, ValueError):
+        raise ValidationError("preview must be true or a sample rate")
+    if sample_rate not in settings.PREVIEW_SAMPLE_RATES:
+        raise ValidationError(f"preview sample rate must be one of {settings.PREVIEW_SAMPLE_RATES}")
+    return sample_rate
+
+
+@dataclass
+class GenerateRequest:
+    """A validated generate body"""
+    params: Dict[str, Any]
+    shift_proba: float
+    amplitude_variation: float
+    skeleton: list
+    matrix: list
+    seed: int
+    seeded: bool  # the client chose the seed, so the result is worth looking up and sharing
+    client: str = ""  # see client_identity
+    sample_rate: int = settings.AUDIO_SAMPLE_RATE  # lower for previews
+
+    @classmethod
+    def parse(cls, data: Optional[dict], client: str = "") -> "GenerateRequest":
         if not data:
             raise ValidationError("No JSON data provided")
         
@@ -192,10 +342,6 @@ async def generate(request: Request):
             "maxSubd": int(data.get("maxSubd", 4))
         }
         
-        # Parse probabilities
-        shift_proba = abs(100.0 - params["std"]) / 100.0
-        amplitude_variation = params["amplitudeVariation"] / 100.0
-        
         # Parse skeleton and matrix
         skeleton = data.get("skeleton")
         matrix = data.get("matrix")
@@ -208,133 +354,754 @@ async def generate(request: Request):
         if isinstance(matrix, str):
             matrix = json.loads(matrix)
         
-        # Generate unique ID
-        audio_id = str(uuid.uuid4())
+        sample_rate = parse_preview(data.get("preview"))
         
-        # Run generation in thread pool
-        logger.info(f"Starting generation {audio_id}")
+        if params["tempo"] <= 0:
+            raise ValidationError("tempo must be positive")
+        if params["numOfCycles"] < 1 or params["maxSubd"] < 1:
+            raise ValidationError("numOfCycles and maxSubd must be at least 1")
+        if params["maxSubd"] > derbake.MAX_SUBD:
+            raise ValidationError(f"maxSubd must be at most {derbake.MAX_SUBD}")
         
-        result = await asyncio.to_thread(
-            generator.generate,
+        # Optional seed: the same seed and parameters give the same audio and tokens
+        seed = data.get("seed")
+        seeded = seed is not None
+        if not seeded:
+            seed = secrets.randbits(63)
+        else:
+            try:
+                seed = int(seed)
+            except (TypeError, ValueError):
+                raise ValidationError("seed must be an integer")
+            if not 0 <= seed < 2 ** 63:
+                raise ValidationError("seed must be between 0 and 2^63 - 1")
+        
+        return cls(
+            params=params,
+            # Parse probabilities
+            shift_proba=abs(100.0 - params["std"]) / 100.0,
+            amplitude_variation=params["amplitudeVariation"] / 100.0,
+            skeleton=skeleton,
+            matrix=matrix,
+            seed=seed,
+            seeded=seeded,
+            client=client,
+            sample_rate=sample_rate,
+        )
+
+    @property
+    def preview(self) -> bool:
+        return self.sample_rate != settings.AUDIO_SAMPLE_RATE
+
+    def cost(self) -> CostEstimate:
+        cost = generator.estimate_cost(
+            self.params["numOfCycles"], self.params["tempo"], self.params["maxSubd"],
+            self.params["tempoVariation"], self.skeleton, self.matrix, sr=sample_manager.SAMPLE_RATE,
+        )
+        if self.preview:
+            cost.samples = -(-cost.samples * self.sample_rate // sample_manager.SAMPLE_RATE)
+        return cost
+
+    def cache_key(self) -> str:
+        """Render cache key, also the key identical in-progress generations are shared under"""
+        return render_cache.make_key(
+            {**self.params, "skeleton": self.skeleton, "matrix": self.matrix, "sampleRate": self.sample_rate},
+            self.seed,
+        )
+
+    def generate_args(self, audio_id: str) -> tuple:
+        """Positional arguments of DerboukaGenerator.generate/plan_generation"""
+        return (
             audio_id,
-            params["numOfCycles"],
-            params["cycleLength"],
-            params["tempo"],
-            params["maxSubd"],
-            shift_proba,
-            params["tempoVariation"],
-            skeleton,
-            matrix,
-            amplitude_variation
+            self.params["numOfCycles"],
+            self.params["cycleLength"],
+            self.params["tempo"],
+            self.params["maxSubd"],
+            self.shift_proba,
+            self.params["tempoVariation"],
+            self.skeleton,
+            self.matrix,
+            self.amplitude_variation,
+            self.seed,
+            self.sample_rate if self.preview else None
         )
-        
-        logger.info(f"Generation {audio_id} completed in {result.generation_time:.2f}s")
-        
-        # Save metadata
-        metadata = {
-            "uuid": audio_id,
-            "num_cycles": params["numOfCycles"],
-            "cycle_length": params["cycleLength"],
-            "bpm": params["tempo"],
-            "maxsubd": params["maxSubd"],
-            "shift_proba": shift_proba,
-            "allowed_tempo_deviation": params["tempoVariation"],
-            "skeleton": skeleton,
-            "matrix": matrix,
-            "amplitudeVariation": amplitude_variation,
-            "generation_time": result.generation_time,
-            "num_hits": result.num_hits
-        }
-        
-        # Save files
-        os.makedirs(settings.AUDIO_TEMP_DIR, exist_ok=True)
-        
-        # Save JSON metadata
-        async with aiofiles.open(f"{settings.AUDIO_TEMP_DIR}/{audio_id}.json", "w") as f:
-            await f.write(json.dumps(metadata, indent=2))
-        
-        # Save derbake tokens
-        tokens = result.tokens
-        async with aiofiles.open(f"{settings.AUDIO_TEMP_DIR}/{audio_id}.derbake", "w") as f:
-            await f.write(tokens)
-        
-        # now we need to incrementally convert our .dat to .wav to stream to frontend
 
-        chunk_size = settings.AUDIO_SAMPLE_RATE * 10 # 10 seconds chunks
-
-        def wav_header_float32(sample_rate, num_samples):
-            import struct
-
-            num_channels = 1
-            bits_per_sample = 32
-            audio_format = 3  # IEEE float
-            block_align = num_channels * bits_per_sample // 8
-            byte_rate = sample_rate * block_align
-            data_size = num_samples * block_align
-            chunk_size = 36 + data_size
-
-            return struct.pack(
-                "<4sI4s4sIHHIIHH4sI",
-                b"RIFF",
-                chunk_size,
-                b"WAVE",
-                b"fmt ",
-                16,
-                audio_format,
-                num_channels,
-                sample_rate,
-                byte_rate,
-                block_align,
-                bits_per_sample,
-                b"data",
-                data_size,
-            )
 
-        def stream_memmap_wav(memmap_audio, sample_rate=settings.AUDIO_SAMPLE_RATE):
-            """Stream a float32 memmap as WAV (int16) in chunks."""
-            import wave
-            import io
-            import numpy as np
+async def stage_generation(audio_id: str, req: GenerateRequest, generation_time: float,
+                           num_hits: int, tokens: str, events=None):
+    """Stage the metadata and .derbake tokens that publish uploads, and the event plan edits start from"""
+    metadata = {
+        "uuid": audio_id,
+        "num_cycles": req.params["numOfCycles"],
+        "cycle_length": req.params["cycleLength"],
+        "bpm": req.params["tempo"],
+        "maxsubd": req.params["maxSubd"],
+        "shift_proba": req.shift_proba,
+        "allowed_tempo_deviation": req.params["tempoVariation"],
+        "skeleton": req.skeleton,
+        "matrix": req.matrix,
+        "amplitudeVariation": req.amplitude_variation,
+        "generation_time": generation_time,
+        "num_hits": num_hits,
+        "seed": req.seed,
+        "sample_rate": req.sample_rate,
+        "params": req.params  # the body as parsed, edits apply their changes on top
+    }
+    
+    with metrics.STAGE_SECONDS.time(stage="staging"):
+        # derbake tokens, with the sample of every hit so the file replays exactly
+        samples = events["sample"] if events is not None else None
+        derbake_bytes = await asyncio.to_thread(derbake.convert, tokens, settings.DERBAKE_FORMAT_VERSION, samples)
+        # the event plan: (start, length, note, sample, amplitude, variant) per hit
+        await staging.put(audio_id, StagedGeneration(metadata=metadata, derbake=derbake_bytes, events=events))
+
+
+async def run_render(func, *args):
+    """Run planning or rendering on a render thread, waiting for one counts as queue depth"""
+    return await metrics.to_thread_queued(func, *args, executor=render_executor)
+
+
+def stream_memmap_audio(memmap_audio, encoder: StreamEncoder, remove_path=None):
+    """Stream a float32 memmap in chunks through `encoder`, then remove `remove_path` if given."""
+    chunk_size = encoder.sample_rate * 10  # 10 seconds chunks
+
+    # The header carries the full data size, the audio itself is never loaded at once
+    yield encoder.header()
 
-            chunk_size = settings.AUDIO_SAMPLE_RATE * 10  # 10 seconds chunks
+    # Now stream the audio data in chunks
+    for i in range(0, len(memmap_audio), chunk_size):
+        yield encoder.encode(memmap_audio[i:i + chunk_size])
+    yield encoder.finish()
 
-            # First, convert the entire audio to int16 to know total size
-            # But we don't want to load everything into memory, so we'll create a proper header
-            # that specifies the correct data size
+    if remove_path is not None:
+        try:
+            os.remove(remove_path)
+        except OSError:
+            pass
 
-            # Create a temporary buffer for the header with correct data size
-            header_buffer = io.BytesIO()
-            total_samples = len(memmap_audio)
 
-            # Yield the complete header first
-            yield wav_header_float32(sample_rate, total_samples)
+async def encode_chunk(encoder: StreamEncoder, samples) -> bytes:
+    # compressing a tile takes long enough to keep it off the event loop
+    if encoder.compressed:
+        return await asyncio.get_running_loop().run_in_executor(encode_executor, encoder.encode, samples)
+    return encoder.encode(samples)
 
-            # Now stream the audio data in chunks
-            for i in range(0, len(memmap_audio), chunk_size):
-                chunk = memmap_audio[i:i + chunk_size]
-                # Convert float32 [-1,1] to int16
-                chunk_bytes = (chunk).astype(np.float32).tobytes()
-                yield chunk_bytes
 
+# ============================================================================
+# Published sounds, cached; a client revalidating with If-None-Match gets a 304
+# ============================================================================
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+@app.get("/api/generate/sounds/{sound_id}")
+async def get_sound(sound_id: str, request: Request):
+    sound = await sound_cache.get(sound_id)
+    if sound is None:
+        raise HTTPException(status_code=404, detail=f"No published sound {sound_id}")
+    headers = {"ETag": sound.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), sound.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=sound.body, media_type="application/json", headers=headers)
+
+# ============================================================================
+# Generate endpoint - replaces @app.post('/api/generate/') with streaming
+# ============================================================================
+async def render_shared(flight: Flight, generate_args: tuple, cost: Optional[CostEstimate], client: str):
+    """
+    Producer of a shared generation: render once into a file every subscriber reads back.
+    Holds the admission of `cost` until the render completes, whoever is still listening.
+    """
+    try:
+        await render_flight(flight, generate_args)
+    finally:
+        if cost is not None:
+            admission.release(cost, client)
+
+
+async def render_flight(flight: Flight, generate_args: tuple):
+    audio_id = generate_args[0]
+    plan = result = None
+    if process_backend is not None:
+        result = await process_backend.generate(*generate_args)
+    elif settings.STREAM_WHILE_RENDERING:
+        plan = await run_render(generator.plan_generation, *generate_args)
+    else:
+        result = await run_render(generator.generate, *generate_args)
+
+    if plan is not None:
+        info = {"tokens": plan.tokens, "num_hits": plan.num_hits,
+                "generation_time": plan.planning_time, "num_samples": plan.total_length}
+        tiles = generator.iter_tiles(plan)
+    else:
+        info = {"tokens": result.tokens, "num_hits": result.num_hits,
+                "generation_time": result.generation_time, "num_samples": len(result.audio)}
+        tiles = (
+            (start, result.audio[start:start + generator.SIZE_OF_CHUNK])
+            for start in range(0, len(result.audio), generator.SIZE_OF_CHUNK)
+        )
+
+    # the cache entry doubles as the shared buffer, it is committed once complete
+    events = (plan or result).events
+    writer = render_cache.writer(flight.key, events=events, **info) or SpillWriter(f"./tmp/{audio_id}.flight")
+
+    def write(tile):
+        writer.write(tile)
+        writer.flush()
+
+    flight.open(writer.path, events=events, **info)
+    try:
+        async for tile in stream_tiles(tiles):
+            await flight.run_io(write, tile)
+            await flight.advance(len(tile))
+    finally:
+        # commits the cache entry: file writes, renames and the index, off the event loop
+        await flight.run_io(writer.close)
+        if result is not None:
             try:
                 os.remove(f"./tmp/{audio_id}.dat")
-            except:
+            except FileNotFoundError:
                 pass
+    metrics.observe_generation((plan or result).stage_times, info["num_samples"])
+
+@app.post('/api/generate/')
+async def generate(request: Request):
+    # counts until the response has finished streaming
+    metrics.GENERATIONS_IN_FLIGHT.inc()
+    flight = admitted = None
+    try:
+        req = GenerateRequest.parse(await request.json(), client_identity(request))  # replaces request.get_json()
+        seed = req.seed
+        encoding = negotiate(request.query_params.get("format"), request.headers.get("accept"), req.sample_rate)
+        cost = req.cost()
+        admission.check(cost)
+        cache_key = cached = None
+        if req.seeded or render_cache.enabled:
+            # a drawn seed never repeats, but its render is cached for edits to patch
+            cache_key = req.cache_key()
+            if req.seeded and render_cache.enabled:
+                cached = render_cache.get(cache_key)
+                metrics.RENDER_CACHE_LOOKUPS.inc(result="hit" if cached is not None else "miss")
+        
+        # Generate unique ID
+        audio_id = str(uuid.uuid4())
+        
+        # Run generation in the process pool, or in the thread pool
+        logger.info(f"Starting generation {audio_id}")
+        
+        generate_args = req.generate_args(audio_id)
+        if cached is None and not (cache_key is not None and cache_key in flights):
+            # held until the response has finished streaming
+            await admission.acquire(cost, req.client)
+            admitted = cost
+        
+        plan = result = None
+        if cached is not None:
+            pass
+        elif cache_key is not None:
+            # identical seeded requests in progress share a single render
+            flight, started = flights.join(
+                cache_key, lambda flight, cost=admitted: render_shared(flight, generate_args, cost, req.client)
+            )
+            if admitted is not None:
+                if not started:
+                    # an identical render started while this one waited for admission
+                    admission.release(admitted, req.client)
+                # a started render releases its admission itself once complete
+                admitted = None
+            metrics.GENERATION_FLIGHTS.inc(role="leader" if started else "follower")
+            flight_info = await flight.wait_ready()
+        elif process_backend is not None:
+            result = await process_backend.generate(*generate_args)
+        elif settings.STREAM_WHILE_RENDERING:
+            # only plan here, tiles are rendered while the response streams
+            plan = await run_render(generator.plan_generation, *generate_args)
+        else:
+            result = await run_render(generator.generate, *generate_args)
+        
+        if cached is not None:
+            generation_time, num_hits, tokens, events = (
+                cached.generation_time, cached.num_hits, cached.tokens, cached.events
+            )
+            logger.info(f"Generation {audio_id} served from the render cache")
+        elif flight is not None:
+            generation_time, num_hits, tokens, events = (
+                flight_info["generation_time"], flight_info["num_hits"], flight_info["tokens"], flight_info["events"]
+            )
+            logger.info(f"Generation {audio_id} {'started' if started else 'joined'} shared render {cache_key[:12]}")
+        elif plan is not None:
+            generation_time, num_hits, tokens, events = plan.planning_time, plan.num_hits, plan.tokens, plan.events
+            logger.info(f"Generation {audio_id} planned in {generation_time:.2f}s, rendering while streaming")
+        else:
+            generation_time, num_hits, tokens, events = (
+                result.generation_time, result.num_hits, result.tokens, result.events
+            )
+            logger.info(f"Generation {audio_id} completed in {generation_time:.2f}s")
+        
+        await stage_generation(audio_id, req, generation_time, num_hits, tokens, events)
+        
+        # now we need to incrementally convert our .dat to .wav to stream to frontend
+
+        chunk_size = req.sample_rate * 10 # 10 seconds chunks
+
+        async def stream_rendered_audio(plan, encoder):
+            """Stream a plan while it renders: header first, then every tile once final."""
+            yield encoder.header()
+            async for tile in stream_tiles(generator.iter_tiles(plan)):
+                yield await encode_chunk(encoder, tile)
+            yield encoder.finish()
+
+        async def stream_shared_audio(flight, encoder):
+            """Stream a shared render from its first sample, following it while it renders."""
+            yield encoder.header()
+            async for chunk_bytes in flight.read(chunk_size):
+                yield await encode_chunk(encoder, np.frombuffer(chunk_bytes, dtype=np.float32))
+            yield encoder.finish()
 
         headers = {
         "x-audio-id": audio_id,
-        "access-control-expose-headers": "x-audio-id"
+        "x-seed": str(seed),
+        "access-control-expose-headers": "x-audio-id, x-seed"
         }
+        # stage times of shared renders are recorded once, by their producer
+        if cached is not None:
+            num_samples, stage_times = len(cached.audio), {}
+        elif flight is not None:
+            num_samples, stage_times = flight_info["num_samples"], {}
+        elif plan is not None:
+            num_samples, stage_times = plan.total_length, plan.stage_times
+        else:
+            num_samples, stage_times = len(result.audio), result.stage_times
+        encoder = StreamEncoder(encoding, req.sample_rate, num_samples)
+        metrics.STREAMS.inc(encoding=encoding.name)
+        if cached is not None:
+            body = iterate_in_threadpool(stream_memmap_audio(cached.audio, encoder))
+        elif flight is not None:
+            body = stream_shared_audio(flight, encoder)
+        elif plan is not None:
+            body = stream_rendered_audio(plan, encoder)
+        else:
+            body = iterate_in_threadpool(
+                stream_memmap_audio(result.audio, encoder, remove_path=f"./tmp/{audio_id}.dat")
+            )
+
+        def on_stream_close():
+            # the render stage of a pipelined plan is only known once every tile went out
+            metrics.observe_generation(stage_times, num_samples)
+            metrics.GENERATIONS_IN_FLIGHT.dec()
+            if flight is not None:
+                flight.release()
+            if admitted is not None:
+                admission.release(admitted, req.client)
+
         return StreamingResponse(
-            stream_memmap_wav(result.audio, settings.AUDIO_SAMPLE_RATE),
-            media_type="audio/wav",
+            metrics.instrument_stream(body, on_stream_close),
+            media_type=encoding.media_type,
             headers=headers
         )
 
     except Exception as e:
+        metrics.GENERATIONS_IN_FLIGHT.dec()
+        if flight is not None:
+            flight.release()
+        if admitted is not None:
+            admission.release(admitted, req.client)
         logger.error(f"Generation failed: {e}", exc_info=True)
         raise
 # ============================================================================
+# Generation jobs - submit, then poll or stream the result
+# ============================================================================
+async def run_job(job: Job) -> dict:
+    """Render a job into ./tmp/{job.id}.dat and write its publish files"""
+    req = job.request
+    cached = None
+    if req.seeded and render_cache.enabled:
+        cached = render_cache.get(req.cache_key())
+        metrics.RENDER_CACHE_LOOKUPS.inc(result="hit" if cached is not None else "miss")
+    
+    if cached is not None:
+        audio, num_hits, tokens, generation_time = cached.audio, cached.num_hits, cached.tokens, cached.generation_time
+        events = cached.events
+    else:
+        generate_args = req.generate_args(job.id)
+        cost = req.cost()
+        await admission.acquire(cost, req.client)
+        try:
+            if process_backend is not None:
+                result = await process_backend.generate(*generate_args)
+            else:
+                # the job queue is the wait, the generation goes straight to a job thread
+                result = await job_manager.run_blocking(generator.generate, *generate_args)
+        finally:
+            admission.release(cost, req.client)
+        metrics.observe_generation(result.stage_times, len(result.audio))
+        audio, num_hits, tokens, generation_time = result.audio, result.num_hits, result.tokens, result.generation_time
+        events = result.events
+        if render_cache.enabled:
+            # served again to identical seeded jobs, and patched by edits
+            await asyncio.to_thread(cache_render, req.cache_key(), audio, tokens, num_hits, generation_time, events)
+    
+    await stage_generation(job.id, req, generation_time, num_hits, tokens, events)
+    logger.info(f"Job {job.id} completed in {generation_time:.2f}s")
+    return {"audio": audio, "num_hits": num_hits, "generation_time": generation_time}
+
+
+def remove_job_audio(job: Job):
+    # the staged generation stays for publish
+    try:
+        os.remove(f"./tmp/{job.id}.dat")
+    except FileNotFoundError:
+        pass
+
+
+job_manager = JobManager(
+    run_job,
+    workers=settings.JOB_WORKERS,
+    max_queued=settings.JOB_QUEUE_SIZE,
+    result_ttl=settings.JOB_RESULT_TTL_SECONDS,
+    on_expire=remove_job_audio,
+)
+
+
+def job_status(job: Job) -> dict:
+    status = {
+        "id": job.id,
+        "status": job.status,
+        "seed": job.request.seed,
+        "position": job_manager.position(job),
+        "estimated_wait": job_manager.estimated_wait(job),
+        "created": job.created,
+        "started": job.started,
+        "finished": job.finished,
+    }
+    if job.status == "done":
+        status["num_hits"] = job.result["num_hits"]
+        status["generation_time"] = job.result["generation_time"]
+        status["audio_url"] = f"/api/generate/jobs/{job.id}?stream=true"
+    elif job.status == "failed":
+        status["error"] = job.error
+    return status
+
+
+@app.post("/api/generate/jobs", status_code=202)
+async def submit_job(request: Request, response: Response):
+    req = GenerateRequest.parse(await request.json(), client_identity(request))
+    # too large a job fails now rather than once its turn comes
+    admission.check(req.cost())
+    job = job_manager.submit(req)
+    logger.info(f"Queued job {job.id} at position {job_manager.position(job)}")
+    response.headers["Location"] = f"/api/generate/jobs/{job.id}"
+    return job_status(job)
+
+
+@app.get("/api/generate/jobs/{job_id}")
+async def get_job(request: Request, job_id: str, stream: bool = False):
+    job = job_manager.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job {job_id}")
+    if not stream:
+        return job_status(job)
+    
+    # ?stream=true waits for the job, then sends the audio
+    encoding = negotiate(request.query_params.get("format"), request.headers.get("accept"), job.request.sample_rate)
+    await job.done.wait()
+    if job.status == "failed":
+        raise AudioGenerationError(f"Failed to generate audio: {job.error}")
+    audio = job.result["audio"]
+    metrics.STREAMS.inc(encoding=encoding.name)
+    body = iterate_in_threadpool(
+        stream_memmap_audio(audio, StreamEncoder(encoding, job.request.sample_rate, len(audio)))
+    )
+    return StreamingResponse(
+        metrics.instrument_stream(body, lambda: None),
+        media_type=encoding.media_type,
+        headers={
+            "x-audio-id": job.id,
+            "x-seed": str(job.request.seed),
+            "access-control-expose-headers": "x-audio-id, x-seed"
+        }
+    )
+
+# ============================================================================
+# Edit endpoint - change a generation, re-rendering only the time it affects
+# ============================================================================
+async def load_generation(audio_id: str) -> Tuple[dict, Optional[np.ndarray]]:
+    """Metadata and recorded event plan (None if not recorded) of an unpublished generation"""
+    try:
+        uuid.UUID(audio_id)
+    except ValueError:
+        raise ValidationError(f"Invalid audio id {audio_id}")
+    staged = await staging.get(audio_id)
+    if staged is None:
+        raise HTTPException(status_code=404, detail=f"Unknown, expired or published generation {audio_id}")
+    return staged.metadata, staged.events
+
+
+def cache_render(key: str, audio, tokens: str, num_hits: int, generation_time: float, events):
+    """Store a finished render in the render cache"""
+    writer = render_cache.writer(key, num_samples=len(audio), tokens=tokens, num_hits=num_hits,
+                                 generation_time=generation_time, events=events)
+    if writer is None:
+        return
+    for offset in range(0, len(audio), generator.SIZE_OF_CHUNK):
+        writer.write(audio[offset:offset + generator.SIZE_OF_CHUNK])
+    writer.close()
+
+
+@app.post("/api/generate/edit/{audio_id}")
+async def edit(request: Request, audio_id: str):
+    """
+    Generate again with some fields of the body changed, same seed unless given.
+    When the original audio is in the render cache, only the time ranges where a hit
+    was added or removed are mixed again, the rest is copied as is. Edits are cached,
+    so editing an edit is incremental too.
+    """
+    metadata, old_events = await load_generation(audio_id)
+    if "params" not in metadata:
+        raise ValidationError(f"Generation {audio_id} was made before edits were supported")
+    changes = await request.json()
+    if not isinstance(changes, dict):
+        raise ValidationError("Expected a JSON object of the fields to change")
+    original = {
+        **metadata["params"],
+        "skeleton": metadata["skeleton"],
+        "matrix": metadata["matrix"],
+        "seed": metadata["seed"],
+        "preview": metadata["sample_rate"] if metadata["sample_rate"] != settings.AUDIO_SAMPLE_RATE else None,
+    }
+    old_req = GenerateRequest.parse(original)
+    req = GenerateRequest.parse({**original, **changes}, client_identity(request))
+    encoding = negotiate(request.query_params.get("format"), request.headers.get("accept"), req.sample_rate)
+    cost = req.cost()
+    await admission.acquire(cost, req.client)
+    edit_id = str(uuid.uuid4())
+    try:
+        plan = await run_render(generator.plan_generation, *req.generate_args(edit_id))
+        base = None
+        if render_cache.enabled and req.sample_rate == old_req.sample_rate:
+            cached = render_cache.get(old_req.cache_key())
+            metrics.RENDER_CACHE_LOOKUPS.inc(result="hit" if cached is not None else "miss")
+            if cached is not None:
+                base = cached.audio
+                old_events = old_events if old_events is not None else cached.events
+        if base is not None:
+            if old_events is None:
+                # cached before plans were kept with the audio: the seed replays it
+                old_plan = await run_render(generator.plan_generation, *old_req.generate_args(audio_id))
+                old_events = old_plan.events
+            ranges = await asyncio.to_thread(changed_ranges, old_events, plan.events, len(base), plan.total_length)
+        else:
+            # nothing to patch, everything is rendered
+            base = np.zeros(0, dtype=np.float32)
+            ranges = [(0, plan.total_length)]
+        audio = await run_render(generator.render_patch, edit_id, plan, base, ranges)
+        rerendered = sum(end - start for start, end in ranges)
+        metrics.EDITED_SAMPLES.inc(len(audio) - rerendered, source="copied")
+        metrics.EDITED_SAMPLES.inc(rerendered, source="rendered")
+        await asyncio.to_thread(
+            cache_render, req.cache_key(), audio, plan.tokens, plan.num_hits, plan.planning_time, plan.events
+        )
+        await stage_generation(edit_id, req, plan.planning_time, plan.num_hits, plan.tokens, plan.events)
+    except Exception:
+        admission.release(cost, req.client)
+        raise
+    logger.info(f"Edit {edit_id} of {audio_id}: re-rendered {rerendered} of {len(audio)} samples in {len(ranges)} ranges")
+
+    def on_stream_close():
+        metrics.observe_generation(plan.stage_times, len(audio))
+        admission.release(cost, req.client)
+
+    encoder = StreamEncoder(encoding, req.sample_rate, len(audio))
+    metrics.STREAMS.inc(encoding=encoding.name)
+    body = iterate_in_threadpool(stream_memmap_audio(audio, encoder, remove_path=f"./tmp/{edit_id}.dat"))
+    return StreamingResponse(
+        metrics.instrument_stream(body, on_stream_close),
+        media_type=encoding.media_type,
+        headers={
+            "x-audio-id": edit_id,
+            "x-seed": str(req.seed),
+            "x-rerendered-samples": str(rerendered),
+            "access-control-expose-headers": "x-audio-id, x-seed, x-rerendered-samples"
+        }
+    )
+
+# ============================================================================
+# Replay endpoint - render a .derbake back into its audio
+# ============================================================================
+@app.post("/api/generate/replay")
+async def replay(request: Request):
+    """
+    Stream the audio of a .derbake sent as the body. Files saved with their sample
+    numbers come back exactly as they were first generated, previews with the same ?preview=.
+    """
+    body = await request.body()
+    if not body:
+        raise ValidationError("Expected a .derbake body")
+    try:
+        record = await asyncio.to_thread(derbake.loads, body)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValidationError(f"Not a .derbake: {e}")
+    sample_rate = parse_preview(request.query_params.get("preview"))
+    encoding = negotiate(request.query_params.get("format"), request.headers.get("accept"), sample_rate)
+    # bounded before planning, a posted file can be as long as it likes
+    cost = generator.estimate_replay_cost(record, sample_manager.SAMPLE_RATE)
+    if sample_rate != sample_manager.SAMPLE_RATE:
+        cost.samples = -(-cost.samples * sample_rate // sample_manager.SAMPLE_RATE)
+    admission.check(cost)
+    client = client_identity(request)
+    await admission.acquire(cost, client)
+    try:
+        plan = await run_render(
+            generator.replay_plan, record, sample_rate if sample_rate != settings.AUDIO_SAMPLE_RATE else None
+        )
+    except Exception:
+        admission.release(cost, client)
+        raise
+    logger.info(f"Replaying {len(plan.events)} hits, {plan.total_length} samples")
+
+    async def stream_replay(encoder):
+        yield encoder.header()
+        async for tile in stream_tiles(generator.iter_tiles(plan)):
+            yield await encode_chunk(encoder, tile)
+        yield encoder.finish()
+
+    def on_stream_close():
+        metrics.observe_generation(plan.stage_times, plan.total_length)
+        admission.release(cost, client)
+
+    metrics.STREAMS.inc(encoding=encoding.name)
+    return StreamingResponse(
+        metrics.instrument_stream(
+            stream_replay(StreamEncoder(encoding, sample_rate, plan.total_length)), on_stream_close
+        ),
+        media_type=encoding.media_type,
+    )
+
+# ============================================================================
+# Live endpoint - endless generation with the parameters of a request
+# ============================================================================
+live_sessions: Dict[str, LiveGroove] = {}
+
+
+async def stream_live(groove: LiveGroove, encoder: StreamEncoder):
+    """Render blocks ahead of the listener into a bounded queue, stream them as they come"""
+    blocks: asyncio.Queue = asyncio.Queue(maxsize=settings.LIVE_BUFFER_BLOCKS)
+
+    async def produce():
+        try:
+            while True:
+                rendering = asyncio.ensure_future(run_render(groove.next_block))
+                try:
+                    block = await asyncio.shield(rendering)
+                except asyncio.CancelledError:
+                    # the block being rendered finishes before the session is let go
+                    await asyncio.gather(rendering, return_exceptions=True)
+                    raise
+                await blocks.put(block)
+        except Exception as e:
+            logger.error(f"Live groove {groove.id} failed: {e}", exc_info=True)
+            await blocks.put(e)
+
+    producer = asyncio.create_task(produce())
+    try:
+        yield encoder.header()
+        while True:
+            block = await blocks.get()
+            if isinstance(block, Exception):
+                raise AudioGenerationError(f"Live generation stopped: {block}")
+            yield await encode_chunk(encoder, block)
+    finally:
+        producer.cancel()
+        # waited for even when the hang up cancels this stream
+        with anyio.CancelScope(shield=True):
+            await asyncio.gather(producer, return_exceptions=True)
+
+
+@app.post("/api/generate/live")
+async def live(request: Request):
+    data = await request.json()
+    req = GenerateRequest.parse(data, client_identity(request))
+    try:
+        block_cycles = int((data or {}).get("blockCycles", settings.LIVE_BLOCK_CYCLES))
+    except (TypeError, ValueError):
+        raise ValidationError("blockCycles must be an integer")
+    if block_cycles < 1:
+        raise ValidationError("blockCycles must be at least 1")
+    encoding = negotiate(request.query_params.get("format"), request.headers.get("accept"), req.sample_rate)
+    if len(live_sessions) >= settings.LIVE_MAX_SESSIONS:
+        raise ServiceBusyError("Too many live grooves are playing", retry_after=30)
+
+    groove = LiveGroove(
+        bpm=req.params["tempo"],
+        maxsubd=req.params["maxSubd"],
+        shift_proba=req.shift_proba,
+        allowed_tempo_deviation=req.params["tempoVariation"],
+        skeleton=req.skeleton,
+        matrix=req.matrix,
+        amplitude_variation=req.amplitude_variation,
+        seed=req.seed,
+        block_cycles=block_cycles,
+        sample_rate=req.sample_rate if req.preview else None,
+        history=settings.LIVE_TOKEN_HISTORY,
+    )
+    # the slot is taken before the first await, concurrent starts see it
+    live_sessions[groove.id] = groove
+    metrics.LIVE_SESSIONS.inc()
+    try:
+        # the blocks in the queue, the one being rendered and the one being sent
+        block_req = replace(req, params={**req.params, "numOfCycles": block_cycles})
+        cost = block_req.cost()
+        admission.check(cost)
+        cost = CostEstimate(samples=cost.samples * (settings.LIVE_BUFFER_BLOCKS + 2), hits=cost.hits)
+        await admission.acquire(cost, req.client)
+    except BaseException:
+        live_sessions.pop(groove.id, None)
+        metrics.LIVE_SESSIONS.dec()
+        raise
+
+    logger.info(f"Live groove {groove.id} started, {block_cycles} cycles per block")
+
+    def on_stream_close():
+        live_sessions.pop(groove.id, None)
+        metrics.LIVE_SESSIONS.dec()
+        admission.release(cost, req.client)
+        logger.info(f"Live groove {groove.id} stopped after {groove.blocks} blocks")
+
+    return StreamingResponse(
+        metrics.instrument_stream(stream_live(groove, StreamEncoder(encoding, req.sample_rate, None)), on_stream_close),
+        media_type=encoding.media_type,
+        headers={
+            "x-live-id": groove.id,
+            "x-seed": str(req.seed),
+            "access-control-expose-headers": "x-live-id, x-seed"
+        }
+    )
+
+
+@app.get("/api/generate/live/{live_id}")
+async def get_live(live_id: str):
+    groove = live_sessions.get(live_id)
+    if groove is None:
+        raise HTTPException(status_code=404, detail=f"No live groove {live_id}")
+    return {
+        "id": groove.id,
+        "seed": groove.seed,
+        "blocks": groove.blocks,
+        "seconds": groove.seconds,
+        "tempo": groove.current_tempo,
+        "tokens": list(groove.tokens),
+    }
+
+# ============================================================================
+# Published objects, when they are stored on this machine (OBJECT_STORE=filesystem)
+# ============================================================================
+if settings.OBJECT_STORE == "filesystem" and settings.OBJECT_STORE_URL.startswith("/"):
+    app.mount(settings.OBJECT_STORE_URL, StaticFiles(directory=settings.OBJECT_STORE_DIR), name="objects")
+
+# ============================================================================
 # Lifespan management - replaces create_app() and shutdown()
 # ============================================================================
 @asynccontextmanager
@@ -344,18 +1111,39 @@ async def lifespan(app: FastAPI):
     app.state.start_time = time.time()
     
     # Initialize database
-    # await init_models()
+    await db_manager.start()
     logger.info("Database initialized")
     
     # Preload common samples
-    sample_manager.preload_samples()
+    sample_manager.preload_samples(
+        amplitudes=generator.get_amplitudes(), preview_sample_rates=settings.PREVIEW_SAMPLE_RATES
+    )
     logger.info("Sample cache warmed up")
     
+    # anything that changes the audio for a given request and seed invalidates the render cache
+    render_cache.load(salt=json.dumps([
+        sample_manager.SAMPLE_RATE,
+        generator.get_amplitudes(),
+        sorted((note, num, length) for (note, num), (_, length) in sample_manager.BANK_SLOTS.items()),
+    ]))
+    
+    if process_backend is not None:
+        process_backend.start()
+    job_manager.start()
+    staging.start()
+    publisher.start()
+    
     yield
     
     # Shutdown - replaces shutdown()
     logger.info("Shutting down...")
-    await s3_manager.close()
+    await job_manager.close()
+    await staging.close()
+    await publisher.close()
+    if process_backend is not None:
+        process_backend.close()
+    await object_store.close()
+    await db_manager.close()
     logger.info("Shutdown complete")
 
 # Attach lifespan to app
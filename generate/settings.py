@@ -2,7 +2,7 @@
 import os
 from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings
-from pydantic import Field, validator
+from pydantic import Field, model_validator, validator
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,20 +13,30 @@ class Settings(BaseSettings):
     HOST: str = "0.0.0.0"
     
     # Database
-    POSTGRES_USER: str
-    POSTGRES_PASSWORD: str
-    POSTGRES_DB: str
-    POSTGRES_HOST: str
+    METADATA_STORE: str = "postgres"  # "postgres" or "sqlite" (SQLITE_PATH, no server needed)
+    SQLITE_PATH: str = "./data/sounds.db"
+    POSTGRES_USER: str = ""
+    POSTGRES_PASSWORD: str = ""
+    POSTGRES_DB: str = ""
+    POSTGRES_HOST: str = ""
     POSTGRES_PORT: int = 5432
     DATABASE_POOL_SIZE: int = 20
-    DATABASE_MAX_OVERFLOW: int = 10
-    DATABASE_ECHO: bool = False
+    DATABASE_MAX_OVERFLOW: int = 10  # connections opened beyond the pool under load, closed when returned
+    DATABASE_POOL_TIMEOUT_SECONDS: float = 30  # wait for a free connection this long, then fail
+    DATABASE_POOL_RECYCLE_SECONDS: int = 1800  # reconnect older connections before proxies drop them
+    DATABASE_STATEMENT_CACHE_SIZE: int = 500  # asyncpg prepared statements kept per connection
+    DATABASE_ECHO: bool = False  # log every SQL statement
+    
+    # Object storage of published .derbake files
+    OBJECT_STORE: str = "s3"  # "s3" or "filesystem" (OBJECT_STORE_DIR, no S3 needed)
+    OBJECT_STORE_DIR: str = "./data/objects"
+    OBJECT_STORE_URL: str = "/api/generate/objects"  # where OBJECT_STORE_DIR is served from
     
     # AWS S3
-    S3_BUCKET: str
-    S3_REGION: str
-    AWS_ACCESS_KEY_ID: str
-    AWS_SECRET_ACCESS_KEY: str
+    S3_BUCKET: str = ""
+    S3_REGION: str = ""
+    AWS_ACCESS_KEY_ID: str = ""
+    AWS_SECRET_ACCESS_KEY: str = ""
     S3_MAX_CONNECTIONS: int = 50
     
     # Security
@@ -37,6 +47,11 @@ class Settings(BaseSettings):
     AUDIO_SAMPLE_RATE: int = 48000
     AUDIO_VOLUME: float = 3.0
     AUDIO_TEMP_DIR: str = "./data"
+    DERBAKE_FORMAT_VERSION: int = 2  # 1 = space separated text, 2 = binary
+    PREVIEW_SAMPLE_RATES: List[int] = [16000, 22050]  # preview banks resampled at startup
+    PREVIEW_SAMPLE_RATE: int = 22050  # rate of {"preview": true}
+    RENDER_CACHE_DIR: str = "./cache/renders"  # rendered audio, seeded requests are served from it and edits patch it
+    RENDER_CACHE_MAX_BYTES: int = 2 * 1024 ** 3  # LRU bound on disk, 0 disables the cache
         
     # Sample paths
     SAMPLE_PATHS: Dict[str, str] = {
@@ -47,12 +62,79 @@ class Settings(BaseSettings):
         "S": "./sounds/silence",
     }
     
-    # Sample cache settings
-    SAMPLE_CACHE_TTL_SECONDS: int = 3600  # 1 hour
+    # Staging of unpublished generations (metadata, .derbake, event plan)
+    SAMPLE_CACHE_TTL_SECONDS: int = 3600  # unpublished generations are dropped after 1 hour
+    STAGING_MAX_BYTES: int = 256 * 1024 ** 2  # held in memory, older ones spill to AUDIO_TEMP_DIR
     
     # Thread pool
-    MAX_WORKER_THREADS: int = 4  # For CPU-bound generation
+    MAX_WORKER_THREADS: int = 4  # For CPU-bound generation: planning, whole renders and live blocks
+    GENERATION_BACKEND: str = "thread"  # "thread" or "process" (pool of MAX_WORKER_THREADS processes)
+    STREAM_WHILE_RENDERING: bool = True  # thread backend: send tiles as they render instead of after the full render
+    ENCODE_WORKER_THREADS: int = 4  # FLAC/Opus encoding of streams, on threads of their own
+    FLIGHT_IO_THREADS: int = 4  # file writes and reads of shared seeded renders
+    
+    # Admission control, by the output estimated before planning (48000 samples per second of audio)
+    MAX_REQUEST_SAMPLES: int = 48000 * 60 * 20  # longest generation accepted, 20 minutes
+    MAX_REQUEST_HITS: int = 1_000_000
+    GENERATION_SAMPLE_BUDGET: int = 48000 * 60 * 60  # samples of all generations rendering at once
+    CLIENT_SAMPLE_BUDGET: int = 48000 * 60 * 30  # share of the budget one user or address may hold
+    ADMISSION_TIMEOUT_SECONDS: float = 10  # wait for budget this long, then 429
+    
+    # Generation jobs (/api/generate/jobs)
+    JOB_WORKERS: int = 2  # jobs rendered at once
+    JOB_QUEUE_SIZE: int = 32  # jobs waiting beyond this get a 429
+    JOB_RESULT_TTL_SECONDS: int = 600  # finished jobs can be fetched for this long
+    
+    # Publishing, acknowledged once queued on disk then uploaded in the background
+    PUBLISH_QUEUE_DIR: str = "./data/publish"
+    PUBLISH_BATCH_SIZE: int = 50  # sound rows inserted at once
+    PUBLISH_BATCH_DELAY_SECONDS: float = 0.5  # wait this long for a batch to fill
+    PUBLISH_MAX_ATTEMPTS: int = 5  # then the publish is dead-lettered
+    PUBLISH_STATUS_TTL_SECONDS: int = 3600  # finished publishes are reported this long
+    PUBLISH_INDEX_MAX_ENTRIES: int = 100_000  # content hashes of stored objects remembered, to skip uploads
     
+    # Published sounds (/api/generate/sounds/{id}), cached in memory
+    SOUND_CACHE_MAX_ENTRIES: int = 10000
+    SOUND_CACHE_TTL_SECONDS: int = 300
+    SOUND_CACHE_MISSING_TTL_SECONDS: float = 2  # how long an unknown id is remembered as such
+    
+    # Live grooves (/api/generate/live)
+    LIVE_BLOCK_CYCLES: int = 4  # cycles rendered at a time
+    LIVE_BUFFER_BLOCKS: int = 2  # blocks rendered ahead of the listener
+    LIVE_TOKEN_HISTORY: int = 16  # blocks of tokens kept for /api/generate/live/{id}
+    LIVE_MAX_SESSIONS: int = 8
+    
+    @validator("GENERATION_BACKEND")
+    def validate_generation_backend(cls, v):
+        if v not in ("thread", "process"):
+            raise ValueError("GENERATION_BACKEND must be 'thread' or 'process'")
+        return v
+
+    @validator("METADATA_STORE")
+    def validate_metadata_store(cls, v):
+        if v not in ("postgres", "sqlite"):
+            raise ValueError("METADATA_STORE must be 'postgres' or 'sqlite'")
+        return v
+
+    @validator("OBJECT_STORE")
+    def validate_object_store(cls, v):
+        if v not in ("s3", "filesystem"):
+            raise ValueError("OBJECT_STORE must be 's3' or 'filesystem'")
+        return v
+
+    @model_validator(mode="after")
+    def validate_backend_credentials(self):
+        required = []
+        if self.METADATA_STORE == "postgres":
+            required += ["POSTGRES_USER", "POSTGRES_DB", "POSTGRES_HOST"]
+        if self.OBJECT_STORE == "s3":
+            required += ["S3_BUCKET", "S3_REGION", "AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"]
+        missing = [name for name in required if not getattr(self, name)]
+        if missing:
+            raise ValueError(f"{', '.join(missing)} must be set for METADATA_STORE={self.METADATA_STORE}, "
+                             f"OBJECT_STORE={self.OBJECT_STORE}")
+        return self
+
     @validator("AUDIO_TEMP_DIR")
     def validate_temp_dir(cls, v):
         os.makedirs(v, exist_ok=True)
@@ -0,0 +1,153 @@
+# singleflight.py
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+from exceptions import AudioGenerationError
+
+logger = logging.getLogger(__name__)
+
+
+class SpillWriter:
+    """Plain temporary file with the CacheWriter interface, for renders the cache will not take"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "wb")
+
+    def write(self, samples: npt.NDArray):
+        self._file.write(memoryview(np.ascontiguousarray(samples, dtype=np.float32)).cast("B"))
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        # readers keep their descriptor, the data goes away with the last of them
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class Flight:
+    """
+    One generation shared by every identical request that arrives while it runs.
+
+    The producer appends float32 samples to a file; each subscriber reads it back
+    from the start, at its own pace, while it is still being written. A slow or
+    disconnected client never holds the others back. File access runs on `executor`,
+    apart from the threads rendering.
+    """
+
+    def __init__(self, key: str, executor: Optional[ThreadPoolExecutor] = None):
+        self.key = key
+        self.executor = executor
+        self.info: Optional[dict] = None  # tokens, num_hits, generation_time, num_samples
+        self.error: Optional[BaseException] = None
+        self.available = 0  # samples readable so far
+        self.done = False
+        self.subscribers = 0
+        self._fd: Optional[int] = None
+        self._ready = asyncio.Event()
+        self._changed = asyncio.Condition()
+
+    async def run_io(self, func: Callable[..., Any], *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    # producer side
+
+    def open(self, path: str, **info):
+        """The render is planned: publish its metadata and the file samples will land in"""
+        self._fd = os.open(path, os.O_RDONLY)
+        self.info = info
+        self._ready.set()
+
+    async def advance(self, num_samples: int):
+        async with self._changed:
+            self.available += num_samples
+            self._changed.notify_all()
+
+    async def finish(self, error: Optional[BaseException] = None):
+        self.error = error
+        self.done = True
+        self._ready.set()
+        async with self._changed:
+            self._changed.notify_all()
+        self._close_if_unused()
+
+    # subscriber side
+
+    async def wait_ready(self) -> dict:
+        await self._ready.wait()
+        if self.info is None:
+            raise AudioGenerationError(f"Failed to generate audio: {self.error}")
+        return self.info
+
+    async def read(self, chunk_samples: int) -> AsyncIterator[bytes]:
+        offset = 0
+        total = self.info["num_samples"]
+        while offset < total:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self.available > offset or self.done)
+            if self.available <= offset:
+                raise AudioGenerationError(f"Render stopped after {offset} of {total} samples: {self.error}")
+            count = min(self.available - offset, chunk_samples)
+            yield await self.run_io(os.pread, self._fd, count * 4, offset * 4)
+            offset += count
+
+    def release(self):
+        self.subscribers -= 1
+        self._close_if_unused()
+
+    def _close_if_unused(self):
+        if self.done and self.subscribers == 0 and self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class SingleFlight:
+    """In-progress flights by key, only used from the event loop. Their file access shares `io_threads` threads"""
+
+    def __init__(self, io_threads: int = 4):
+        self.executor = ThreadPoolExecutor(io_threads, thread_name_prefix="flight-io")
+        self._flights: Dict[str, Flight] = {}
+        self._tasks = set()
+
+    def join(self, key: str, produce: Callable[[Flight], Awaitable[None]]) -> Tuple[Flight, bool]:
+        """
+        Subscribe to the flight for `key`, starting it with `produce` if there is none.
+        Returns the flight and whether this call started it. Callers must `release()` it.
+        """
+        flight = self._flights.get(key)
+        started = flight is None
+        if started:
+            flight = Flight(key, self.executor)
+            self._flights[key] = flight
+            task = asyncio.create_task(self._run(flight, produce))
+            # keep a reference, the loop only holds weak ones
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        flight.subscribers += 1
+        return flight, started
+
+    async def _run(self, flight: Flight, produce: Callable[[Flight], Awaitable[None]]):
+        try:
+            await produce(flight)
+            await flight.finish()
+        except Exception as e:
+            logger.error(f"Shared generation {flight.key} failed: {e}", exc_info=True)
+            await flight.finish(e)
+        finally:
+            self._flights.pop(flight.key, None)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._flights
+
+    def __len__(self):
+        return len(self._flights)
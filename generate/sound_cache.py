@@ -0,0 +1,62 @@
+# sound_cache.py
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, Tuple
+
+import metrics
+
+
+@dataclass
+class CachedSound:
+    """A published sound as served: its JSON body and the ETag of that body"""
+    body: bytes
+    etag: str
+
+
+class SoundCache:
+    """
+    Read-through LRU cache of published sounds, at most `max_entries` kept for `ttl`
+    seconds. Sounds `load` does not find are cached for `missing_ttl` seconds, so an id
+    that is polled until its publish completes costs few queries; invalidate() drops the
+    entry once this process saves it, rows saved elsewhere show within `missing_ttl`.
+    Only used from the event loop.
+    """
+
+    def __init__(self, load: Callable[[str], Awaitable[Optional[dict]]], max_entries: int, ttl: float,
+                 missing_ttl: float):
+        self.load = load
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self._entries: "OrderedDict[str, Tuple[float, Optional[CachedSound]]]" = OrderedDict()  # oldest use first
+        self._invalidations = 0
+
+    async def get(self, sound_id: str) -> Optional[CachedSound]:
+        """The sound, from the cache or loaded, None if there is no such sound"""
+        entry = self._entries.get(sound_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(sound_id)
+            metrics.SOUND_CACHE_LOOKUPS.inc(result="hit")
+            return entry[1]
+        metrics.SOUND_CACHE_LOOKUPS.inc(result="miss")
+        invalidations = self._invalidations
+        sound = await self.load(sound_id)
+        cached = None
+        if sound is not None:
+            body = json.dumps(sound, sort_keys=True, separators=(",", ":")).encode()
+            cached = CachedSound(body=body, etag='"' + hashlib.sha1(body).hexdigest() + '"')
+        # a publish saved while loading may have made this stale
+        if invalidations == self._invalidations and self.max_entries > 0:
+            ttl = self.ttl if cached is not None else self.missing_ttl
+            self._entries[sound_id] = (time.monotonic() + ttl, cached)
+            self._entries.move_to_end(sound_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return cached
+
+    def invalidate(self, sound_id: str):
+        self._invalidations += 1
+        self._entries.pop(sound_id, None)
@@ -0,0 +1,177 @@
+# staging.py
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import numpy.typing as npt
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StagedGeneration:
+    """What publish needs from a generation: its metadata and .derbake, plus the event plan edits use"""
+    metadata: dict
+    derbake: bytes
+    events: Optional[npt.NDArray] = None
+
+
+@dataclass
+class _Entry:
+    expires: float
+    size: int
+    staged: Optional[StagedGeneration]  # None once spilled to disk
+
+
+class StagingStore:
+    """
+    Unpublished generations, kept until published or `ttl` seconds old.
+
+    Entries live in memory; once they take more than `max_bytes` the oldest are
+    spilled to `directory` as `{id}.json`, `{id}.derbake` and `{id}.events.npy`.
+    A sweeper drops expired entries, on disk too, including files left by an
+    earlier run. Only used from the event loop, disk access goes to threads.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl: float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.memory_bytes = 0
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()  # oldest first
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        # files of an earlier run expire by their age
+        now = time.time()
+        found = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                path = os.path.join(self.directory, name)
+                found.append((os.path.getmtime(path), name[:-len(".json")]))
+        for mtime, audio_id in sorted(found):
+            self._entries[audio_id] = _Entry(expires=mtime + self.ttl, size=0, staged=None)
+        self._update_metrics()
+        self._sweeper = asyncio.create_task(self._sweep_forever())
+        logger.info(f"Staging store: {len(found)} generations on disk in {self.directory}, expiring after {self.ttl}s")
+        self.sweep(now)
+
+    async def close(self):
+        """Stop sweeping; entries still in memory are spilled so a restart can publish them"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+        for audio_id, entry in list(self._entries.items()):
+            if entry.staged is not None:
+                await self._spill(audio_id, entry)
+
+    def __contains__(self, audio_id: str) -> bool:
+        return audio_id in self._entries
+
+    async def put(self, audio_id: str, staged: StagedGeneration):
+        size = len(staged.derbake) + (staged.events.nbytes if staged.events is not None else 0) + 1024
+        self._entries[audio_id] = _Entry(expires=time.time() + self.ttl, size=size, staged=staged)
+        self.memory_bytes += size
+        # spill the oldest while over the cap, the newest stays in memory for its publish
+        for spill_id, entry in list(self._entries.items()):
+            if self.memory_bytes <= self.max_bytes or spill_id == audio_id:
+                break
+            if entry.staged is not None:
+                await self._spill(spill_id, entry)
+        self._update_metrics()
+
+    async def get(self, audio_id: str) -> Optional[StagedGeneration]:
+        entry = self._entries.get(audio_id)
+        if entry is None or entry.expires < time.time():
+            return None
+        if entry.staged is not None:
+            return entry.staged
+        try:
+            return await asyncio.to_thread(self._read, audio_id)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Staged generation {audio_id} unreadable: {e}")
+            self.discard(audio_id)
+            return None
+
+    def discard(self, audio_id: str):
+        """Forget a generation, e.g. once published"""
+        entry = self._entries.pop(audio_id, None)
+        if entry is None:
+            return
+        if entry.staged is not None:
+            self.memory_bytes -= entry.size
+        else:
+            self._remove_files(audio_id)
+        self._update_metrics()
+
+    def sweep(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        expired = [audio_id for audio_id, entry in self._entries.items() if entry.expires < now]
+        for audio_id in expired:
+            self.discard(audio_id)
+        if expired:
+            logger.info(f"Expired {len(expired)} unpublished generations")
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(min(60, self.ttl))
+            self.sweep()
+
+    async def _spill(self, audio_id: str, entry: _Entry):
+        staged = entry.staged
+        try:
+            await asyncio.to_thread(self._write, audio_id, staged)
+        except OSError as e:
+            logger.warning(f"Could not spill staged generation {audio_id}: {e}")
+            return
+        if self._entries.get(audio_id) is not entry:
+            # discarded while being written
+            self._remove_files(audio_id)
+            return
+        entry.staged = None
+        self.memory_bytes -= entry.size
+        metrics.STAGING_SPILLS.inc()
+
+    def _path(self, audio_id: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{audio_id}{extension}")
+
+    def _write(self, audio_id: str, staged: StagedGeneration):
+        with open(self._path(audio_id, ".derbake"), "wb") as f:
+            f.write(staged.derbake)
+        if staged.events is not None:
+            np.save(self._path(audio_id, ".events.npy"), staged.events)
+        # the .json last: it is what marks a complete entry on disk
+        with open(self._path(audio_id, ".json"), "w", encoding="utf-8") as f:
+            json.dump(staged.metadata, f, indent=2)
+
+    def _read(self, audio_id: str) -> StagedGeneration:
+        with open(self._path(audio_id, ".json"), encoding="utf-8") as f:
+            metadata = json.load(f)
+        with open(self._path(audio_id, ".derbake"), "rb") as f:
+            derbake = f.read()
+        events_path = self._path(audio_id, ".events.npy")
+        events = np.load(events_path) if os.path.exists(events_path) else None
+        return StagedGeneration(metadata=metadata, derbake=derbake, events=events)
+
+    def _remove_files(self, audio_id: str):
+        for extension in (".json", ".derbake", ".events.npy"):
+            try:
+                os.remove(self._path(audio_id, extension))
+            except FileNotFoundError:
+                pass
+
+    def _update_metrics(self):
+        in_memory = sum(1 for entry in self._entries.values() if entry.staged is not None)
+        metrics.STAGED_GENERATIONS.set(in_memory, location="memory")
+        metrics.STAGED_GENERATIONS.set(len(self._entries) - in_memory, location="disk")
+        metrics.STAGING_MEMORY_BYTES.set(self.memory_bytes)
@@ -3,19 +3,70 @@ import aioboto3
 import aiofiles
 import json
 import asyncio
-from typing import Optional, Dict, Any
+import os
+import shutil
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List
 import logging
 from botocore.config import Config
 from botocore.exceptions import ClientError
 from settings import settings
-from db.schema import AsyncSessionLocal, Sound
+from db.schema import Sound, init_models
 from exceptions import StorageError
+from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+import metrics
 
 logger = logging.getLogger(__name__)
 
-class S3Manager:
+class ObjectStore:
+    """
+    Where published files go. Uploads return the URL the object is served from.
+    """
+    
+    async def upload_file(self, local_path: str, key: str, content_type: str = None) -> str:
+        raise NotImplementedError
+    
+    async def upload_bytes(self, data: bytes, key: str, content_type: str = "application/octet-stream") -> str:
+        raise NotImplementedError
+    
+    async def exists(self, key: str) -> bool:
+        raise NotImplementedError
+    
+    def url(self, key: str) -> str:
+        raise NotImplementedError
+    
+    async def upload_files_batch(self, file_mappings: Dict[str, str]) -> Dict[str, str]:
+        """
+        Upload multiple files in parallel.
+        file_mappings: {local_path: key}
+        Returns: {local_path: url}
+        """
+        tasks = []
+        for local_path, key in file_mappings.items():
+            content_type = "audio/wav" if key.endswith('.wav') else "application/octet-stream"
+            tasks.append(self.upload_file(local_path, key, content_type))
+        
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        
+        urls = {}
+        for (local_path, _), result in zip(file_mappings.items(), results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to upload {local_path}: {result}")
+                urls[local_path] = None
+            else:
+                urls[local_path] = result
+        
+        return urls
+    
+    async def close(self):
+        pass
+
+class S3Manager(ObjectStore):
     """
     Manages S3 operations with connection pooling and retries.
     """
@@ -67,7 +118,7 @@ class S3Manager:
                     ExtraArgs=extra_args if extra_args else None
                 )
             
-            url = f"https://{settings.S3_BUCKET}.s3.{settings.S3_REGION}.amazonaws.com/{s3_key}"
+            url = self.url(s3_key)
             logger.info(f"Uploaded {s3_key} to S3")
             return url
             
@@ -75,28 +126,49 @@ class S3Manager:
             logger.error(f"S3 upload failed for {s3_key}: {e}")
             raise StorageError(f"Failed to upload to S3: {e}") from e
     
-    async def upload_files_batch(self, file_mappings: Dict[str, str]) -> Dict[str, str]:
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=2, max=10),
+        retry=retry_if_exception_type((ClientError, ConnectionError))
+    )
+    async def upload_bytes(self, data: bytes, s3_key: str, content_type: str = "application/octet-stream") -> str:
         """
-        Upload multiple files in parallel.
-        file_mappings: {local_path: s3_key}
-        Returns: {local_path: s3_url}
+        Upload an in-memory buffer to S3 with retries.
+        Returns the S3 URL.
         """
-        tasks = []
-        for local_path, s3_key in file_mappings.items():
-            content_type = "audio/wav" if s3_key.endswith('.wav') else "application/octet-stream"
-            tasks.append(self.upload_file(local_path, s3_key, content_type))
-        
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        urls = {}
-        for (local_path, _), result in zip(file_mappings.items(), results):
-            if isinstance(result, Exception):
-                logger.error(f"Failed to upload {local_path}: {result}")
-                urls[local_path] = None
-            else:
-                urls[local_path] = result
-        
-        return urls
+        try:
+            client = await self._get_client()
+            await client.put_object(Bucket=settings.S3_BUCKET, Key=s3_key, Body=data, ContentType=content_type)
+            
+            url = self.url(s3_key)
+            logger.info(f"Uploaded {s3_key} to S3")
+            return url
+            
+        except ClientError as e:
+            logger.error(f"S3 upload failed for {s3_key}: {e}")
+            raise StorageError(f"Failed to upload to S3: {e}") from e
+    
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=2, max=10),
+        retry=retry_if_exception_type((ClientError, ConnectionError))
+    )
+    async def exists(self, s3_key: str) -> bool:
+        """
+        Whether the object is in the bucket, a HEAD request.
+        """
+        try:
+            client = await self._get_client()
+            await client.head_object(Bucket=settings.S3_BUCKET, Key=s3_key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            logger.error(f"S3 HEAD failed for {s3_key}: {e}")
+            raise StorageError(f"Failed to check S3: {e}") from e
+    
+    def url(self, s3_key: str) -> str:
+        return f"https://{settings.S3_BUCKET}.s3.{settings.S3_REGION}.amazonaws.com/{s3_key}"
     
     async def close(self):
         """Close S3 client"""
@@ -104,17 +176,109 @@ class S3Manager:
             await self._client.__aexit__(None, None, None)
             self._client = None
 
+class FilesystemObjectStore(ObjectStore):
+    """
+    Objects as files under `directory`, served from `base_url`.
+    Stands in for S3 on a single machine or offline.
+    """
+    
+    def __init__(self, directory: str, base_url: str):
+        self.directory = os.path.abspath(directory)
+        self.base_url = base_url.rstrip("/")
+        os.makedirs(self.directory, exist_ok=True)
+    
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.directory, key))
+        if os.path.commonpath([path, self.directory]) != self.directory:
+            raise StorageError(f"Object key {key} is outside the object store")
+        return path
+    
+    def _write(self, key: str, write):
+        # written aside then renamed, readers never see half an object
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            write(path + ".tmp")
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.error(f"Object store write failed for {key}: {e}")
+            raise StorageError(f"Failed to store {key}: {e}") from e
+    
+    @staticmethod
+    def _write_bytes(data: bytes):
+        def write(path: str):
+            with open(path, "wb") as f:
+                f.write(data)
+        return write
+    
+    async def upload_file(self, local_path: str, key: str, content_type: str = None) -> str:
+        await asyncio.to_thread(self._write, key, lambda path: shutil.copyfile(local_path, path))
+        logger.info(f"Stored {key} in {self.directory}")
+        return self.url(key)
+    
+    async def upload_bytes(self, data: bytes, key: str, content_type: str = "application/octet-stream") -> str:
+        await asyncio.to_thread(self._write, key, self._write_bytes(data))
+        logger.info(f"Stored {key} in {self.directory}")
+        return self.url(key)
+    
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread(os.path.exists, self._path(key))
+    
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
 class DatabaseManager:
     """
-    Manages database operations with connection pooling.
+    Sound metadata in Postgres, with connection pooling.
+    The engine is created by start(), or by the first query.
     """
     
+    def __init__(self, url: str, **engine_options):
+        self.url = url
+        self.engine_options = engine_options
+        self.engine: Optional[AsyncEngine] = None
+        self._sessions: Optional[async_sessionmaker] = None
+    
+    def _create_engine(self):
+        if self._sessions is None:
+            self.engine = create_async_engine(self.url, **self.engine_options)
+            self._sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+    
+    @asynccontextmanager
+    async def _session(self):
+        """Session with its connection already checked out, the wait for it is timed"""
+        self._create_engine()
+        async with self._sessions() as session:
+            with metrics.DB_CONNECTION_WAIT_SECONDS.time():
+                await session.connection()
+            yield session
+    
+    def _insert(self):
+        return postgresql.insert(Sound)
+    
+    def pool_status(self) -> Dict[str, int]:
+        """Pooled connections: checked out, idle, and opened beyond the pool size"""
+        pool = self.engine.pool if self.engine is not None else None
+        if not isinstance(pool, QueuePool):
+            return {"checked_out": 0, "idle": 0, "overflow": 0}
+        return {"checked_out": pool.checkedout(), "idle": pool.checkedin(), "overflow": max(0, pool.overflow())}
+    
+    async def start(self):
+        self._create_engine()
+    
+    async def close(self):
+        """Close pooled connections"""
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+            self._sessions = None
+    
     async def save_sound(self, sound_id: str, user_id: str, settings_dict: Dict[str, Any], url: str) -> Sound:
         """
         Save sound metadata to database.
         """
         try:
-            async with AsyncSessionLocal() as session:
+            async with self._session() as session:
                 sound = Sound(
                     id=sound_id,
                     generated_by=user_id,
@@ -123,20 +287,34 @@ class DatabaseManager:
                 )
                 session.add(sound)
                 await session.commit()
-                await session.refresh(sound)
                 logger.info(f"Saved sound {sound_id} to database")
                 return sound
         except SQLAlchemyError as e:
             logger.error(f"Database error saving sound {sound_id}: {e}")
             raise StorageError(f"Failed to save to database: {e}") from e
     
+    async def save_sounds(self, rows: List[Dict[str, Any]]):
+        """
+        Insert sounds in a single multi-row statement. Rows already saved are skipped,
+        so a batch can be retried after a partial failure.
+        """
+        if not rows:
+            return
+        try:
+            async with self._session() as session:
+                await session.execute(self._insert().values(rows).on_conflict_do_nothing(index_elements=[Sound.id]))
+                await session.commit()
+                logger.info(f"Saved {len(rows)} sounds to database")
+        except SQLAlchemyError as e:
+            logger.error(f"Database error saving {len(rows)} sounds: {e}")
+            raise StorageError(f"Failed to save to database: {e}") from e
+    
     async def get_sound(self, sound_id: str) -> Optional[Sound]:
         """
         Get sound by ID.
         """
         try:
-            async with AsyncSessionLocal() as session:
-                from sqlalchemy import select
+            async with self._session() as session:
                 result = await session.execute(
                     select(Sound).where(Sound.id == sound_id)
                 )
@@ -145,6 +323,44 @@ class DatabaseManager:
             logger.error(f"Database error getting sound {sound_id}: {e}")
             raise StorageError(f"Failed to get sound: {e}") from e
 
-# Global instances
-s3_manager = S3Manager()
-db_manager = DatabaseManager()
\ No newline at end of file
+class SQLiteDatabaseManager(DatabaseManager):
+    """
+    Sound metadata in a SQLite file through aiosqlite, tables created at start.
+    Stands in for Postgres on a single machine or offline.
+    """
+    
+    def __init__(self, path: str, **engine_options):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        super().__init__(f"sqlite+aiosqlite:///{path}", **engine_options)
+    
+    def _insert(self):
+        return sqlite.insert(Sound)
+    
+    async def start(self):
+        self._create_engine()
+        await init_models(self.engine)
+        logger.info(f"SQLite metadata store at {self.url}")
+
+def create_object_store() -> ObjectStore:
+    if settings.OBJECT_STORE == "filesystem":
+        return FilesystemObjectStore(settings.OBJECT_STORE_DIR, settings.OBJECT_STORE_URL)
+    return S3Manager()
+
+def create_metadata_store() -> DatabaseManager:
+    if settings.METADATA_STORE == "sqlite":
+        return SQLiteDatabaseManager(settings.SQLITE_PATH, echo=settings.DATABASE_ECHO)
+    return DatabaseManager(
+        f"postgresql+asyncpg://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}"
+        f"@{settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}",
+        echo=settings.DATABASE_ECHO,
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT_SECONDS,
+        pool_recycle=settings.DATABASE_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=True,
+        connect_args={"prepared_statement_cache_size": settings.DATABASE_STATEMENT_CACHE_SIZE},
+    )
+
+# Global instances, backends chosen by OBJECT_STORE and METADATA_STORE
+object_store = create_object_store()
+db_manager = create_metadata_store()
@@ -0,0 +1,86 @@
+# test_admission.py
+import asyncio
+
+import pytest
+
+import server
+from admission import AdmissionController
+from algorithm import CostEstimate
+from exceptions import ServiceBusyError, ValidationError
+
+BODY = {"skeleton": [[1, "D"], [1, "OTA"]], "matrix": [[1, 1], [10, 10], [10, 10], [10, 10], [10, 10], [0, 0]],
+        "numOfCycles": 2, "maxSubd": 2, "tempo": 120}
+
+
+def controller(timeout: float = 1.0) -> AdmissionController:
+    return AdmissionController(max_request_samples=100, max_request_hits=10, budget_samples=100,
+                               per_client_samples=60, timeout=timeout)
+
+
+def test_requests_over_the_caps_are_refused_outright():
+    admission = controller()
+    for cost in (CostEstimate(samples=101, hits=1), CostEstimate(samples=1, hits=11)):
+        with pytest.raises(ValidationError):
+            asyncio.run(admission.acquire(cost, "a"))
+    assert admission.in_flight == 0
+
+
+def test_a_request_waits_for_budget_then_is_admitted():
+    async def main():
+        admission = controller()
+        first = CostEstimate(samples=60, hits=1)
+        await admission.acquire(first, "a")
+        waiting = asyncio.create_task(admission.acquire(CostEstimate(samples=50, hits=1), "b"))
+        await asyncio.sleep(0.05)
+        assert not waiting.done() and admission.in_flight == 60
+        admission.release(first, "a")
+        await asyncio.wait_for(waiting, 1)
+        return admission.in_flight
+
+    assert asyncio.run(main()) == 50
+
+
+def test_one_client_cannot_hold_the_whole_budget():
+    async def main():
+        admission = controller(timeout=0.05)
+        await admission.acquire(CostEstimate(samples=40, hits=1), "a")
+        with pytest.raises(ServiceBusyError):
+            await admission.acquire(CostEstimate(samples=40, hits=1), "a")
+        await admission.acquire(CostEstimate(samples=40, hits=1), "b")
+        return admission.in_flight
+
+    assert asyncio.run(main()) == 80
+
+
+def test_a_request_alone_always_fits():
+    async def main():
+        admission = AdmissionController(max_request_samples=100, max_request_hits=10, budget_samples=10,
+                                        per_client_samples=10, timeout=0)
+        await admission.acquire(CostEstimate(samples=100, hits=1), "a")
+        return admission.in_flight
+
+    assert asyncio.run(main()) == 100
+
+
+def test_a_busy_service_answers_429_with_retry_after(serve, monkeypatch):
+    async def main(client):
+        monkeypatch.setattr(server.admission, "budget_samples", 1)
+        monkeypatch.setattr(server.admission, "timeout", 0.2)
+        held = CostEstimate(samples=1, hits=0)
+        await server.admission.acquire(held, "someone else")
+        try:
+            busy = await client.post("/api/generate/", json=BODY)
+        finally:
+            server.admission.release(held, "someone else")
+        admitted = await client.post("/api/generate/", json=BODY)
+        # a shared render gives its admission back just after its last tile went out
+        for _ in range(200):
+            if not server.admission.in_flight:
+                break
+            await asyncio.sleep(0.01)
+        return busy, admitted, server.admission.in_flight
+
+    busy, admitted, in_flight = serve(main)
+    assert busy.status_code == 429
+    assert busy.headers["retry-after"] == "1" and busy.json()["retry_after"] == 1
+    assert admitted.status_code == 200 and in_flight == 0
@@ -0,0 +1,34 @@
+# test_benchmarks.py
+import json
+import subprocess
+import sys
+
+from benchmarks.bench_generate import compare
+
+CASE = {"numOfCycles": 2, "maxSubd": 2, "tempo": 120, "tempoVariation": 0, "skeleton": "sparse"}
+
+
+def test_a_saved_baseline_compares_against_itself(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    run = [sys.executable, "-m", "benchmarks.bench_generate", "--cycles", "2", "--maxsubd", "2", "--tempo", "120",
+           "--tempo-variation", "0", "--skeleton", "sparse", "--repeats", "1"]
+    subprocess.run(run + ["--save", str(baseline)], check=True, capture_output=True)
+
+    report = json.loads(baseline.read_text())
+    [result] = report["results"]
+    assert {key: result[key] for key in CASE} == CASE
+    assert result["samples"] > 0 and result["hits"] > 0 and result["peak_rss_mb"] > 0
+    assert result["samples_per_sec"] == result["samples"] / result["wall_time"]
+
+    # the same case again is no regression, whatever the noise, past a generous threshold
+    compared = subprocess.run(run + ["--compare", str(baseline), "--threshold", "100"], capture_output=True, text=True)
+    assert compared.returncode == 0, compared.stdout + compared.stderr
+    assert "Compared to" in compared.stdout
+
+
+def test_only_cases_slower_than_the_threshold_regress():
+    baseline = {"results": [{**CASE, "wall_time": 1.0}, {**CASE, "skeleton": "dense", "wall_time": 1.0}]}
+    results = [{**CASE, "wall_time": 1.05}, {**CASE, "skeleton": "dense", "wall_time": 1.5},
+               {**CASE, "maxSubd": 8, "wall_time": 9.0}]  # not in the baseline
+    assert compare(results, baseline, threshold=0.10) == 1
+    assert compare(results, baseline, threshold=0.60) == 0
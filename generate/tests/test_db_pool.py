@@ -0,0 +1,64 @@
+# test_db_pool.py
+import asyncio
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+import metrics
+import storage
+from storage import DatabaseManager, SQLiteDatabaseManager
+
+
+def test_postgres_engine_is_built_from_settings(monkeypatch):
+    for name, value in {"METADATA_STORE": "postgres", "DATABASE_POOL_SIZE": 7, "DATABASE_MAX_OVERFLOW": 3,
+                        "DATABASE_POOL_TIMEOUT_SECONDS": 4.0, "DATABASE_POOL_RECYCLE_SECONDS": 600,
+                        "DATABASE_STATEMENT_CACHE_SIZE": 50, "DATABASE_ECHO": False}.items():
+        monkeypatch.setattr(storage.settings, name, value)
+    db = storage.create_metadata_store()
+    assert type(db) is DatabaseManager and db.url.startswith("postgresql+asyncpg://")
+    # building the engine does not connect
+    db._create_engine()
+    pool = db.engine.pool
+    assert (pool.size(), pool._max_overflow, pool._timeout, pool._recycle, pool._pre_ping) == (7, 3, 4.0, 600, True)
+    assert db.engine.echo is False
+    assert db.engine_options["connect_args"] == {"prepared_statement_cache_size": 50}
+    assert db.pool_status() == {"checked_out": 0, "idle": 0, "overflow": 0}
+    asyncio.run(db.close())
+
+
+def test_pool_status_follows_checked_out_connections_and_waits_are_timed(tmp_path):
+    db = SQLiteDatabaseManager(str(tmp_path / "sounds.db"), poolclass=AsyncAdaptedQueuePool, pool_size=1,
+                               max_overflow=1)
+
+    def waits() -> int:
+        counts, _ = metrics.DB_CONNECTION_WAIT_SECONDS._values.get((), ([0], 0.0))
+        return sum(counts)
+
+    async def main():
+        await db.start()
+        before = waits()
+        statuses = []
+        async with db._session():
+            statuses.append(db.pool_status())
+            async with db._session():
+                statuses.append(db.pool_status())
+        statuses.append(db.pool_status())
+        await db.close()
+        return statuses, waits() - before
+
+    statuses, timed = asyncio.run(main())
+    assert statuses == [
+        {"checked_out": 1, "idle": 0, "overflow": 0},
+        {"checked_out": 2, "idle": 0, "overflow": 1},
+        {"checked_out": 0, "idle": 1, "overflow": 0},
+    ]
+    assert timed == 2
+
+
+def test_pool_gauges_are_exposed(serve):
+    async def main(client):
+        return await client.get("/api/generate/metrics")
+
+    body = serve(main).text
+    for state in ("checked_out", "idle", "overflow"):
+        assert f"derbouka_db_pool_{state} " in body
+    assert "derbouka_db_connection_wait_seconds_count" in body
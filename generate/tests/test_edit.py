@@ -0,0 +1,100 @@
+# test_edit.py
+import asyncio
+import io
+import os
+
+from dataclasses import replace
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import server
+from algorithm import generator
+from renderer import changed_ranges, make_events
+from sample_manager import sample_manager
+
+SKELETON = [[1, "D"], [1, "OTA"], [0.5, "D"], [1.5, "OTA"]]
+MATRIX = [[1, 2, 1, 0], [10, 20, 10, 10], [10, 10, 30, 10], [10, 10, 10, 10], [10, 5, 10, 10], [0, 0, 0, 0]]
+# the OTI row only changes the hits that drew OTI
+EDITED_MATRIX = [row if note != 3 else [30, 10, 10, 10] for note, row in enumerate(MATRIX)]
+BODY = {"skeleton": SKELETON, "matrix": MATRIX, "numOfCycles": 4, "maxSubd": 4, "tempo": 120}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def samples():
+    if sample_manager.BANK is None:
+        sample_manager.preload_samples(amplitudes=generator.get_amplitudes())
+
+
+def read_wav(body: bytes) -> np.ndarray:
+    audio, _ = sf.read(io.BytesIO(body), dtype="float32")
+    return audio
+
+
+async def wait_cached(key: str):
+    # the shared render commits its cache entry just after its last tile went out
+    for _ in range(200):
+        if key not in server.flights:
+            return
+        await asyncio.sleep(0.01)
+
+
+def test_first_edit_of_an_unseeded_generation_is_patched(serve):
+    async def main(client):
+        response = await client.post("/api/generate/", json=BODY)
+        assert response.status_code == 200
+        audio_id = response.headers["x-audio-id"]
+        original = (await server.staging.get(audio_id)).metadata
+        await wait_cached(server.GenerateRequest.parse({**BODY, "seed": original["seed"]}).cache_key())
+
+        edited = await client.post(f"/api/generate/edit/{audio_id}", json={"matrix": EDITED_MATRIX})
+        assert edited.status_code == 200
+        old_events = (await server.staging.get(audio_id)).events
+        new_events = (await server.staging.get(edited.headers["x-audio-id"])).events
+        return response.content, edited, old_events, new_events, original["seed"]
+
+    original, edited, old_events, new_events, seed = serve(main)
+    audio = read_wav(edited.content)
+    ranges = changed_ranges(old_events, new_events, len(read_wav(original)), len(audio))
+    rerendered = int(edited.headers["x-rerendered-samples"])
+    # the seed is drawn, the hits that drew OTI may well be none
+    assert rerendered == sum(end - start for start, end in ranges) < len(audio)
+
+    # patching gives the audio a full render of the edited request gives
+    req = server.GenerateRequest.parse({**BODY, "matrix": EDITED_MATRIX, "seed": seed})
+    full = server.generator.generate(*req.generate_args("test-edit-reference"))
+    try:
+        np.testing.assert_array_equal(audio, np.asarray(full.audio))
+    finally:
+        os.remove("./tmp/test-edit-reference.dat")
+
+
+def test_changed_ranges_cover_removed_added_and_appended_hits():
+    old = make_events([(0, 10, 0, 1, 1.0, 0), (20, 10, 1, 1, 1.0, 0), (50, 10, 2, 1, 1.0, 0), (50, 10, 2, 1, 1.0, 0)])
+    # one of the two identical hits at 50 dropped, the one at 20 now louder, a hit across the old end
+    new = make_events([(0, 10, 0, 1, 1.0, 0), (20, 10, 1, 1, 1.0, 2), (50, 10, 2, 1, 1.0, 0), (95, 20, 3, 1, 1.0, 0)])
+    assert changed_ranges(old, new, 100, 110) == [(20, 30), (50, 60), (95, 110)]
+    assert changed_ranges(old, old, 100, 100) == []
+    # nothing reaches past the new end, touching ranges merge
+    assert changed_ranges(old[:1], new[1:], 100, 90) == [(0, 10), (20, 30), (50, 60)]
+    assert changed_ranges(make_events([]), make_events([(5, 10, 0, 1, 1.0, 0), (15, 10, 0, 1, 1.0, 0)]), 30, 30) == [(5, 25)]
+
+
+def test_a_patched_render_equals_a_full_render_of_the_edited_plan():
+    plan = generator.plan_generation("test", 2, 4, 120, 4, 0.2, 0.1, SKELETON, MATRIX, 0.5, 18)
+    base = generator.render("test-patch-base", plan)
+    events = plan.events.copy()
+    variations = np.flatnonzero(events["variant"] < sample_manager.skeleton_variant)
+    events["variant"][variations[::3]] = (events["variant"][variations[::3]] + 1) % len(generator.get_amplitudes())
+    edited = replace(plan, events=np.delete(events, variations[1::5]), total_length=plan.total_length + 5000)
+
+    ranges = changed_ranges(plan.events, edited.events, plan.total_length, edited.total_length)
+    assert 0 < sum(end - start for start, end in ranges) < edited.total_length
+    try:
+        patched = generator.render_patch("test-patch", edited, base, ranges)
+        full = generator.render("test-patch-full", edited)
+        np.testing.assert_array_equal(patched, full)
+    finally:
+        for name in ("test-patch-base", "test-patch", "test-patch-full"):
+            os.remove(f"./tmp/{name}.dat")
@@ -0,0 +1,95 @@
+# test_encoding.py
+import io
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from encoding import ENCODINGS, StreamEncoder, negotiate
+from exceptions import ValidationError
+
+SAMPLE_RATE = 48000
+TILE = 4800
+
+
+def tone(num_samples: int) -> np.ndarray:
+    t = np.arange(num_samples) / SAMPLE_RATE
+    audio = 0.5 * np.sin(2 * np.pi * 440 * t).astype(np.float32)
+    audio[:10] = [1.5, -1.5] * 5  # past full scale
+    return audio
+
+
+def encode(name: str, audio: np.ndarray, num_samples=-1) -> bytes:
+    encoder = StreamEncoder(ENCODINGS[name], SAMPLE_RATE, len(audio) if num_samples == -1 else num_samples)
+    chunks = [encoder.header()]
+    chunks += [encoder.encode(audio[start:start + TILE]) for start in range(0, len(audio), TILE)]
+    chunks.append(encoder.finish())
+    return b"".join(chunks)
+
+
+def test_format_parameter_wins_over_accept():
+    assert negotiate("FLAC", "audio/ogg", SAMPLE_RATE).name == "flac"
+    with pytest.raises(ValidationError):
+        negotiate("mp3", None, SAMPLE_RATE)
+    with pytest.raises(ValidationError):
+        negotiate("opus", None, 44100)
+
+
+@pytest.mark.parametrize("accept, rate, expected", [
+    (None, 48000, "wav"),
+    ("audio/flac;q=0.5, audio/ogg; codecs=opus", 48000, "opus"),
+    ("audio/flac;q=0.5, audio/ogg; codecs=opus", 44100, "flac"),  # opus cannot carry 44.1 kHz
+    ('audio/wav; codecs="1"', 48000, "pcm16"),
+    ("audio/flac;q=0, text/html", 48000, "wav"),
+    ("*/*", 48000, "wav"),
+])
+def test_accept_picks_the_preferred_known_type(accept, rate, expected):
+    assert negotiate(None, accept, rate).name == expected
+
+
+@pytest.mark.parametrize("name, tolerance", [("wav", 0), ("pcm16", 2 / 32768), ("flac", 2 / 32768)])
+def test_lossless_formats_decode_to_the_clipped_input(name, tolerance):
+    audio = tone(SAMPLE_RATE + 123)
+    decoded, rate = sf.read(io.BytesIO(encode(name, audio)), dtype="float32")
+    assert rate == SAMPLE_RATE and len(decoded) == len(audio)
+    expected = audio if name == "wav" else np.clip(audio, -1, 1)
+    np.testing.assert_allclose(decoded, expected, atol=tolerance)
+
+
+def test_flac_announces_its_length_up_front():
+    data = encode("flac", tone(SAMPLE_RATE + 123))
+    assert sf.info(io.BytesIO(data)).frames == SAMPLE_RATE + 123
+
+
+def test_opus_is_smaller_and_sounds_alike():
+    audio = tone(SAMPLE_RATE * 2)
+    data = encode("opus", audio)
+    decoded, rate = sf.read(io.BytesIO(data), dtype="float32")
+    assert rate == SAMPLE_RATE and abs(len(decoded) - len(audio)) < TILE
+    assert len(data) * 10 < len(encode("wav", audio))
+    middle = slice(SAMPLE_RATE // 2, SAMPLE_RATE)
+    assert np.corrcoef(decoded[middle], audio[middle])[0, 1] > 0.9
+
+
+def test_endless_wav_streams_announce_the_largest_size():
+    header = StreamEncoder(ENCODINGS["pcm16"], SAMPLE_RATE, None).header()
+    assert int.from_bytes(header[40:44], "little") == (0xFFFFFFFF - 36) // 2 * 2
+
+
+def test_generations_stream_in_the_negotiated_format(serve):
+    body = {"skeleton": [[1, "D"], [1, "OTA"]], "matrix": [[1, 1], [10, 10], [10, 10], [10, 10], [10, 10], [0, 0]],
+            "numOfCycles": 2, "maxSubd": 2, "tempo": 120, "seed": 15}
+
+    async def main(client):
+        wav = await client.post("/api/generate/", json=body)
+        flac = await client.post("/api/generate/", json=body, headers={"accept": "audio/flac"})
+        pcm16 = await client.post("/api/generate/?format=pcm16", json=body, headers={"accept": "audio/flac"})
+        return wav, flac, pcm16
+
+    wav, flac, pcm16 = serve(main)
+    assert flac.headers["content-type"] == "audio/flac" and pcm16.headers["content-type"] == "audio/wav"
+    audio, _ = sf.read(io.BytesIO(wav.content), dtype="float32")
+    for response in (flac, pcm16):
+        decoded, _ = sf.read(io.BytesIO(response.content), dtype="float32")
+        np.testing.assert_allclose(decoded, np.clip(audio, -1, 1), atol=2 / 32768)
+        assert len(response.content) < len(wav.content)
@@ -0,0 +1,31 @@
+# test_intervals.py
+import numpy as np
+
+from intervals import IntervalIndex
+
+
+def brute_force(intervals, position: int) -> bool:
+    return any(start <= position < end for start, end in intervals)
+
+
+def test_matches_a_linear_scan():
+    rng = np.random.default_rng(3)
+    starts = rng.integers(0, 1000, 200)
+    # overlapping, nested, empty and unsorted intervals
+    intervals = list(zip(starts.tolist(), (starts + rng.integers(0, 60, 200)).tolist()))
+    index = IntervalIndex(intervals)
+    positions = np.arange(-5, 1100)
+    expected = [brute_force(intervals, p) for p in positions.tolist()]
+    assert index.contains(positions).tolist() == expected
+    assert [p in index for p in positions.tolist()] == expected
+
+
+def test_bounds_are_half_open():
+    index = IntervalIndex([(10, 20), (12, 15)])
+    assert [p in index for p in (9, 10, 14, 19, 20)] == [False, True, True, True, False]
+
+
+def test_empty_index_contains_nothing():
+    index = IntervalIndex([])
+    assert len(index) == 0 and 0 not in index
+    assert not index.contains(np.array([0, 5])).any()
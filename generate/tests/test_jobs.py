@@ -0,0 +1,44 @@
+# test_jobs.py
+import asyncio
+import threading
+import time
+
+import metrics
+from jobs import JobManager
+
+
+def test_jobs_render_on_their_own_threads():
+    async def run(job):
+        return await manager.run_blocking(lambda: threading.current_thread().name)
+
+    async def main():
+        manager.start()
+        job = manager.submit("request")
+        await asyncio.wait_for(job.done.wait(), timeout=5)
+        await manager.close()
+        return job
+
+    manager = JobManager(run, workers=1, max_queued=4, result_ttl=60)
+    job = asyncio.run(main())
+    assert job.status == "done" and job.result.startswith("job")
+
+
+def test_close_fails_unfinished_jobs():
+    async def run(job):
+        return await manager.run_blocking(time.sleep, 0.2)
+
+    async def main():
+        manager.start()
+        jobs = [manager.submit("request") for _ in range(3)]
+        await asyncio.sleep(0.05)
+        running = [job.status for job in jobs]
+        depth = metrics.GENERATION_QUEUE_DEPTH._values[("jobs",)]
+        await manager.close()
+        return running, depth, jobs
+
+    manager = JobManager(run, workers=1, max_queued=4, result_ttl=60)
+    running, depth, jobs = asyncio.run(main())
+    assert running == ["running", "queued", "queued"] and depth == 2
+    assert metrics.GENERATION_QUEUE_DEPTH._values[("jobs",)] == 0
+    assert all(job.status == "failed" and job.done.is_set() for job in jobs)
+    assert not manager.jobs
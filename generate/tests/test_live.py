@@ -0,0 +1,70 @@
+# test_live.py
+import asyncio
+import json
+import threading
+import time
+
+import metrics
+import server
+from live import LiveGroove
+
+BODY = {"skeleton": [[1, "D"], [1, "OTA"]], "matrix": [[1, 1], [1, 1], [1, 1], [1, 1], [1, 1], [1, 1]],
+        "maxSubd": 2, "blockCycles": 1}
+
+
+async def listen(body: dict, messages: int) -> list:
+    """POST /api/generate/live straight to the app, hang up after `messages` body messages"""
+    sent = []
+    hung_up = asyncio.Event()
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": json.dumps(body).encode(), "more_body": False}
+        await hung_up.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+        if sum(m["type"] == "http.response.body" for m in sent) >= messages:
+            hung_up.set()
+
+    scope = {
+        "type": "http", "http_version": "1.1", "method": "POST", "scheme": "http", "path": "/api/generate/live",
+        "raw_path": b"/api/generate/live", "root_path": "", "query_string": b"", "server": ("test", 80),
+        "client": ("127.0.0.1", 5000), "headers": [(b"content-type", b"application/json")],
+    }
+    await server.app(scope, receive, send)
+    return sent
+
+
+def test_live_sessions_are_capped_and_let_go_once_their_blocks_are_done(serve, monkeypatch):
+    rendering = []
+    next_block = LiveGroove.next_block
+
+    def slow_block(groove):
+        rendering.append(threading.current_thread().name)
+        try:
+            time.sleep(0.05)
+            return next_block(groove)
+        finally:
+            rendering.pop()
+
+    async def main(client):
+        monkeypatch.setattr(server.settings, "LIVE_MAX_SESSIONS", 1)
+        monkeypatch.setattr(LiveGroove, "next_block", slow_block)
+        first = asyncio.create_task(listen(BODY, 3))
+        while not server.live_sessions:
+            await asyncio.sleep(0.01)
+        refused = await client.post("/api/generate/live", json=BODY)
+        streamed = await first
+        return refused, streamed, len(server.live_sessions), server.admission.in_flight, list(rendering)
+
+    refused, streamed, sessions, in_flight, still_rendering = serve(main)
+    assert refused.status_code == 429 and refused.headers["retry-after"] == "30"
+    assert streamed[0]["status"] == 200
+    assert sessions == 0 and in_flight == 0 and metrics.LIVE_SESSIONS._values.get((), 0) == 0
+    # hung up mid-block: that block finished before the session was let go
+    assert still_rendering == []
@@ -0,0 +1,54 @@
+# test_packed_samples.py
+import numpy as np
+import soundfile as sf
+
+from sample_manager import SampleManager
+from samplebank import load_packed_samples, pack_samples
+
+
+def write_samples(directory, lengths):
+    directory.mkdir()
+    rng = np.random.default_rng(len(lengths))
+    for i, length in enumerate(lengths):
+        sf.write(str(directory / f"{i}.wav"), rng.uniform(-0.5, 0.5, length), 48000, subtype="FLOAT")
+    return str(directory)
+
+
+def test_packed_samples_load_as_the_decoded_ones(tmp_path):
+    manager = SampleManager()
+    manager.PATHS = {
+        "D": write_samples(tmp_path / "doums", [1200, 800]),
+        "OTA": write_samples(tmp_path / "taks", [500]),
+        "OTI": write_samples(tmp_path / "tiks", [300, 700, 100]),
+    }
+    # PA2 and S share a directory, and so share their entries in the bank
+    manager.PATHS["PA2"] = manager.PATHS["S"] = write_samples(tmp_path / "pa2s", [256])
+    manager.PACKED_SAMPLES = str(tmp_path / "samples")
+    manager.decode_samples()
+    decoded = manager.AUDIO_SOUNDS
+
+    index = pack_samples(manager.PATHS, manager.PACKED_SAMPLES, sr=manager.SAMPLE_RATE)
+    data, loaded_index = load_packed_samples(manager.PACKED_SAMPLES)
+    assert loaded_index == index and len(data) == 1200 + 800 + 500 + 300 + 700 + 100 + 256
+    assert index["symbols"]["PA2"] == index["symbols"]["S"]
+
+    manager.AUDIO_SOUNDS = {}
+    assert manager.load_packed_samples()
+    assert manager.AUDIO_SOUNDS.keys() == decoded.keys()
+    for note, sounds in decoded.items():
+        assert manager.AUDIO_SOUNDS[note].keys() == sounds.keys()
+        for num, (length, y) in sounds.items():
+            packed_length, packed = manager.AUDIO_SOUNDS[note][num]
+            assert packed_length == length
+            np.testing.assert_array_equal(packed, y)
+            assert not packed.flags.writeable  # a view into the read-only memory map
+
+
+def test_a_missing_or_mismatched_bank_falls_back_to_decoding(tmp_path):
+    manager = SampleManager()
+    manager.PACKED_SAMPLES = str(tmp_path / "missing")
+    assert not manager.load_packed_samples()
+
+    pack_samples({"D": write_samples(tmp_path / "doums", [100])}, str(tmp_path / "samples"), sr=44100)
+    manager.PACKED_SAMPLES = str(tmp_path / "samples")
+    assert not manager.load_packed_samples() and manager.AUDIO_SOUNDS == {}
@@ -0,0 +1,76 @@
+# test_pipeline.py
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from pipeline import stream_tiles
+
+
+def tiles(count: int, size: int = 256):
+    for i in range(count):
+        time.sleep(0.002)  # rendering
+        yield i * size, np.full(size, i, dtype=np.float32)
+
+
+def test_stream_tiles_yields_every_tile_in_order():
+    async def main():
+        return [tile[0] async for tile in stream_tiles(tiles(10))]
+
+    assert asyncio.run(main()) == list(range(10))
+
+
+def test_stream_tiles_raises_renderer_errors():
+    def failing():
+        yield from tiles(2)
+        raise RuntimeError("render failed")
+
+    async def main():
+        received = []
+        try:
+            async for tile in stream_tiles(failing()):
+                received.append(tile[0])
+        except RuntimeError as e:
+            return received, str(e)
+
+    assert asyncio.run(main()) == ([0, 1], "render failed")
+
+
+def test_slow_clients_do_not_hold_the_executor():
+    """More slow streams than executor threads, each encoding on the executor like encode_chunk"""
+    async def slow_client():
+        count = 0
+        async for tile in stream_tiles(tiles(20), max_pending=2):
+            await asyncio.to_thread(tile.tobytes)
+            await asyncio.sleep(0.02)
+            count += 1
+        return count
+
+    async def main():
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(2))
+        streams = [asyncio.create_task(slow_client()) for _ in range(4)]
+        await asyncio.sleep(0.1)  # every stream has filled its queue and waits for its client
+        other = await asyncio.wait_for(asyncio.to_thread(lambda: "ran"), timeout=2)
+        return other, await asyncio.wait_for(asyncio.gather(*streams), timeout=10)
+
+    assert asyncio.run(main()) == ("ran", [20, 20, 20, 20])
+
+
+def test_closing_the_stream_stops_rendering():
+    rendered = []
+
+    def counted():
+        for offset, tile in tiles(100):
+            rendered.append(offset)
+            yield offset, tile
+
+    async def main():
+        stream = stream_tiles(counted(), max_pending=2)
+        async for _ in stream:
+            break
+        await stream.aclose()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(main())
+    assert len(rendered) < 10
@@ -0,0 +1,74 @@
+# test_preview.py
+import io
+
+import numpy as np
+import pytest
+import soundfile as sf
+import soxr
+
+import server
+from algorithm import generator
+from sample_manager import sample_manager
+
+SKELETON = [[1, "D"], [1, "OTA"], [0.5, "D"], [1.5, "OTA"]]
+MATRIX = [[1, 2, 1, 0], [10, 20, 10, 10], [10, 10, 30, 10], [10, 10, 10, 10], [10, 5, 10, 10], [0, 0, 0, 0]]
+PREVIEW_RATE = 16000
+
+
+@pytest.fixture(scope="module", autouse=True)
+def samples():
+    if sample_manager.BANK is None:
+        sample_manager.preload_samples(amplitudes=generator.get_amplitudes())
+    if PREVIEW_RATE not in sample_manager.PREVIEW_BANKS:
+        sample_manager.build_preview_bank(PREVIEW_RATE)
+
+
+def plan(sample_rate=None):
+    # uuid, num_cycles, cycle_length, bpm, maxsubd, shift_proba, tempo deviation, skeleton, matrix, amplitude variation, seed
+    return generator.plan_generation("test", 2, 4, 120, 4, 0.2, 0.1, SKELETON, MATRIX, 0.5, 16,
+                                     sample_rate=sample_rate)
+
+
+def render(plan) -> np.ndarray:
+    audio = np.zeros(plan.total_length, dtype=np.float32)
+    for offset, tile in generator.iter_tiles(plan):
+        audio[offset:offset + len(tile)] = tile
+    return audio
+
+
+def test_a_preview_plays_the_same_hits_at_the_lower_rate():
+    full, preview = plan(), plan(PREVIEW_RATE)
+    assert preview.tokens == full.tokens and preview.num_hits == full.num_hits
+    assert preview.sample_rate == PREVIEW_RATE
+    assert preview.total_length == -(-full.total_length * PREVIEW_RATE // sample_manager.SAMPLE_RATE)
+    for field in ("note", "sample", "variant", "amplitude"):
+        np.testing.assert_array_equal(preview.events[field], full.events[field])
+    np.testing.assert_array_equal(preview.events["start"], full.events["start"] * PREVIEW_RATE // 48000)
+
+
+def test_a_preview_sounds_like_the_full_render_downsampled():
+    full, preview = render(plan()), render(plan(PREVIEW_RATE))
+    downsampled = soxr.resample(full, sample_manager.SAMPLE_RATE, PREVIEW_RATE)[:len(preview)]
+    assert len(downsampled) == len(preview)
+    # hits may land a sample apart after rounding their positions
+    assert np.corrcoef(preview, downsampled)[0, 1] > 0.9
+
+
+def test_preview_requests_stream_at_the_preview_rate_with_the_same_tokens(serve):
+    body = {"skeleton": SKELETON, "matrix": MATRIX, "numOfCycles": 2, "maxSubd": 4, "tempo": 120, "seed": 16}
+
+    async def main(client):
+        full = await client.post("/api/generate/", json=body)
+        preview = await client.post("/api/generate/", json={**body, "preview": True})
+        invalid = await client.post("/api/generate/", json={**body, "preview": 11025})
+        derbakes = [(await server.staging.get(r.headers["x-audio-id"])).derbake for r in (full, preview)]
+        return full, preview, invalid, derbakes
+
+    full, preview, invalid, (full_derbake, preview_derbake) = serve(main)
+    assert preview_derbake == full_derbake
+    full_audio, full_rate = sf.read(io.BytesIO(full.content), dtype="float32")
+    preview_audio, preview_rate = sf.read(io.BytesIO(preview.content), dtype="float32")
+    assert (full_rate, preview_rate) == (48000, 22050)
+    assert len(preview_audio) == -(-len(full_audio) * 22050 // 48000)
+    assert len(preview.content) < len(full.content) / 2
+    assert invalid.status_code == 400
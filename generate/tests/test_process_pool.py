@@ -0,0 +1,49 @@
+# test_process_pool.py
+import asyncio
+import os
+
+import numpy as np
+
+from algorithm import GenerationPlan, generator
+from process_pool import ProcessGenerationBackend, open_audio
+from renderer import make_events
+from sample_manager import sample_manager
+
+SKELETON = [[1, "D"], [1, "OTA"], [0.5, "D"], [1.5, "OTA"]]
+MATRIX = [[1, 2, 1, 0], [10, 20, 10, 10], [10, 10, 30, 10], [10, 10, 10, 10], [10, 5, 10, 10], [0, 0, 0, 0]]
+
+
+def args(audio_id: str) -> tuple:
+    # uuid, num_cycles, cycle_length, bpm, maxsubd, shift_proba, tempo deviation, skeleton, matrix, amplitude variation, seed
+    return audio_id, 2, 4, 120, 4, 0.2, 0.1, SKELETON, MATRIX, 0.5, 11
+
+
+def test_workers_render_what_a_thread_renders():
+    if sample_manager.BANK is None:
+        sample_manager.preload_samples(amplitudes=generator.get_amplitudes())
+    expected = generator.generate(*args("test-process-pool-thread"))
+    backend = ProcessGenerationBackend(1)
+
+    async def main():
+        backend.start()
+        try:
+            return await backend.generate(*args("test-process-pool"))
+        finally:
+            backend.close()
+
+    try:
+        result = asyncio.run(main())
+        assert result.tokens == expected.tokens
+        np.testing.assert_array_equal(result.audio, expected.audio)
+    finally:
+        # closing the backend let the shared bank go
+        sample_manager.preload_samples(amplitudes=generator.get_amplitudes())
+        for name in ("test-process-pool", "test-process-pool-thread"):
+            os.remove(f"./tmp/{name}.dat")
+
+
+def test_empty_renders_have_no_file():
+    plan = GenerationPlan(total_length=0, events=make_events([]), tokens="", num_hits=0, planning_time=0)
+    assert len(generator.render("test-empty", plan)) == 0
+    assert not os.path.exists("./tmp/test-empty.dat")
+    assert open_audio("test-empty", 0).dtype == np.float32
@@ -0,0 +1,48 @@
+# test_publish.py
+import asyncio
+
+import server
+
+BODY = {"skeleton": [[1, "D"], [1, "OTA"]], "matrix": [[1, 1], [1, 1], [1, 1], [1, 1], [1, 1], [1, 1]],
+        "numOfCycles": 1, "maxSubd": 2}
+
+
+async def wait_finished(client, audio_id: str) -> dict:
+    for _ in range(200):
+        status = (await client.get(f"/api/generate/publish/{audio_id}")).json()
+        if status["status"] in ("done", "failed"):
+            return status
+        await asyncio.sleep(0.01)
+    return status
+
+
+def test_publish_again_after_a_dead_letter(serve, token, monkeypatch):
+    async def main(client):
+        client.cookies.update(token)
+        upload = server.publisher.upload
+
+        async def unavailable(data: bytes, key: str) -> str:
+            raise ConnectionError("store down")
+
+        monkeypatch.setattr(server.publisher, "max_attempts", 1)
+        monkeypatch.setattr(server.publisher, "upload", unavailable)
+        audio_id = (await client.post("/api/generate/", json=BODY)).headers["x-audio-id"]
+        await client.get(f"/api/generate/publish/?id={audio_id}")
+        failed = await wait_finished(client, audio_id)
+
+        monkeypatch.setattr(server.publisher, "upload", upload)
+        again = await client.get(f"/api/generate/publish/?id={audio_id}")
+        done = await wait_finished(client, audio_id)
+        sound = await client.get(f"/api/generate/sounds/{audio_id}")
+        revalidated = await client.get(
+            f"/api/generate/sounds/{audio_id}", headers={"if-none-match": sound.headers["etag"]}
+        )
+        return failed, again, done, sound, revalidated
+
+    failed, again, done, sound, revalidated = serve(main)
+    assert failed["status"] == "failed" and "store down" in failed["error"]
+    assert again.status_code == 202 and again.json()["status"] == "queued"
+    assert done["status"] == "done"
+    assert sound.status_code == 200 and sound.json()["url"] == done["url"]
+    assert "generated_by" not in sound.json()
+    assert revalidated.status_code == 304 and not revalidated.content
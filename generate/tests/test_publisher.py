@@ -0,0 +1,163 @@
+# test_publisher.py
+import asyncio
+import os
+
+import metrics
+from publisher import ContentIndex, Publisher
+
+
+class FakeStore:
+    def __init__(self, fail_uploads: int = 0):
+        self.objects = {}
+        self.uploads = 0
+        self.rows = []
+        self.fail_uploads = fail_uploads
+
+    async def upload(self, data: bytes, key: str) -> str:
+        await asyncio.sleep(0.01)
+        if self.fail_uploads > 0:
+            self.fail_uploads -= 1
+            raise ConnectionError("store down")
+        self.uploads += 1
+        self.objects[key] = data
+        return self.url(key)
+
+    async def exists(self, key: str) -> bool:
+        return key in self.objects
+
+    def url(self, key: str) -> str:
+        return f"https://store/{key}"
+
+    async def save(self, rows):
+        self.rows.extend(rows)
+
+
+def make_publisher(directory, store: FakeStore, max_attempts: int = 5) -> Publisher:
+    return Publisher(
+        str(directory), upload=store.upload, exists=store.exists, url=store.url, save=store.save,
+        max_uploads=4, batch_size=50, batch_delay=0.02, max_attempts=max_attempts, status_ttl=60,
+        index_size=100,
+    )
+
+
+async def wait_finished(publisher: Publisher, audio_id: str):
+    for _ in range(200):
+        if publisher.get(audio_id).status in ("done", "failed"):
+            return
+        await asyncio.sleep(0.01)
+
+
+def test_concurrent_submits_publish_once(tmp_path):
+    store = FakeStore()
+
+    async def main():
+        publisher = make_publisher(tmp_path, store)
+        publisher.start()
+        pending = metrics.PUBLISH_PENDING._values.get((), 0)
+        results = await asyncio.gather(*(
+            publisher.submit("a1", "u1", {"bpm": 120}, b"DRBK tokens") for _ in range(10)
+        ))
+        await wait_finished(publisher, "a1")
+        await publisher.close()
+        return publisher, results, metrics.PUBLISH_PENDING._values.get((), 0) - pending
+
+    publisher, results, pending = asyncio.run(main())
+    assert [queued for _, queued in results].count(True) == 1
+    assert all(task is results[0][0] for task, _ in results)
+    assert publisher.get("a1").status == "done"
+    assert store.uploads == 1 and [row["id"] for row in store.rows] == ["a1"]
+    assert pending == 0
+    assert not [name for name in os.listdir(tmp_path) if name.startswith("a1")]
+
+
+def test_identical_content_is_uploaded_once(tmp_path):
+    store = FakeStore()
+
+    async def main():
+        publisher = make_publisher(tmp_path, store)
+        publisher.start()
+        for audio_id in ("a1", "a2"):
+            await publisher.submit(audio_id, "u1", {}, b"same tokens")
+            await wait_finished(publisher, audio_id)
+        await publisher.submit("a3", "u1", {}, b"other tokens")
+        await wait_finished(publisher, "a3")
+        await publisher.close()
+
+    asyncio.run(main())
+    urls = {row["id"]: row["url"] for row in store.rows}
+    assert store.uploads == 2
+    assert urls["a1"] == urls["a2"] != urls["a3"]
+
+
+def test_objects_the_store_has_are_not_uploaded_again_after_a_restart(tmp_path):
+    store = FakeStore()
+
+    async def publish(audio_id: str):
+        publisher = make_publisher(tmp_path, store)
+        publisher.start()
+        await publisher.submit(audio_id, "u1", {}, b"same tokens")
+        await wait_finished(publisher, audio_id)
+        await publisher.close()
+
+    asyncio.run(publish("a1"))
+    os.remove(tmp_path / "objects.index")  # only the store knows it now
+    asyncio.run(publish("a2"))
+    assert store.uploads == 1 and len(store.rows) == 2
+    # and the index learned it from the store
+    assert (tmp_path / "objects.index").read_text().split() == list(store.objects)
+
+
+def test_content_index_keeps_the_newest_keys_across_restarts(tmp_path):
+    path = str(tmp_path / "objects.index")
+    index = ContentIndex(path, max_entries=3)
+    index.load()
+    for key in ("k1", "k2", "k2", "k3", "k4"):
+        index.add(key)
+    assert [key in index for key in ("k1", "k2", "k3", "k4")] == [False, True, True, True]
+
+    reloaded = ContentIndex(path, max_entries=3)
+    reloaded.load()
+    assert [key in reloaded for key in ("k1", "k2", "k3", "k4")] == [False, True, True, True]
+    # compacted on load
+    with open(path) as f:
+        assert f.read().split() == ["k2", "k3", "k4"]
+
+
+def test_failed_publish_is_dead_lettered_and_can_be_resubmitted(tmp_path):
+    store = FakeStore(fail_uploads=1)
+
+    async def main():
+        publisher = make_publisher(tmp_path, store, max_attempts=1)
+        publisher.start()
+        await publisher.submit("a1", "u1", {}, b"tokens")
+        await wait_finished(publisher, "a1")
+        failed = publisher.get("a1").status
+        dead = sorted(os.listdir(tmp_path / "dead"))
+        task, queued = await publisher.submit("a1", "u1", {}, b"tokens")
+        await wait_finished(publisher, "a1")
+        await publisher.close()
+        return failed, dead, queued, task.status
+
+    failed, dead, queued, status = asyncio.run(main())
+    assert failed == "failed" and dead == ["a1.derbake", "a1.task.json"]
+    assert queued and status == "done"
+    assert not os.listdir(tmp_path / "dead")
+
+
+def test_concurrent_resubmits_of_a_dead_letter_publish_once(tmp_path):
+    store = FakeStore(fail_uploads=1)
+
+    async def main():
+        publisher = make_publisher(tmp_path, store, max_attempts=1)
+        publisher.start()
+        await publisher.submit("a1", "u1", {}, b"tokens")
+        await wait_finished(publisher, "a1")
+        results = await asyncio.gather(*(publisher.resubmit("a1") for _ in range(5)))
+        await wait_finished(publisher, "a1")
+        await publisher.close()
+        return publisher, results
+
+    publisher, results = asyncio.run(main())
+    assert [queued for _, queued in results].count(True) == 1
+    assert publisher.get("a1").status == "done"
+    assert store.objects and list(store.objects.values()) == [b"tokens"]
@@ -0,0 +1,90 @@
+# test_render_cache.py
+import asyncio
+import os
+
+import numpy as np
+
+import metrics
+import server
+from render_cache import RenderCache
+
+BODY = {"skeleton": [[1, "D"], [1, "OTA"]], "matrix": [[1, 1], [10, 10], [10, 10], [10, 10], [10, 10], [0, 0]],
+        "numOfCycles": 2, "maxSubd": 2, "tempo": 120, "seed": 1234}
+
+
+def put(cache: RenderCache, key: str, audio: np.ndarray, chunk: int = 3):
+    writer = cache.writer(key, num_samples=len(audio), tokens=f"tokens of {key}", num_hits=7, generation_time=0.5)
+    for start in range(0, len(audio), chunk):
+        writer.write(audio[start:start + chunk])
+    writer.close()
+
+
+def test_entries_round_trip_and_survive_a_restart(tmp_path):
+    cache = RenderCache(str(tmp_path), max_bytes=1000)
+    cache.load()
+    audio = np.arange(10, dtype=np.float32)
+    put(cache, "a", audio)
+    put(cache, "empty", np.zeros(0, dtype=np.float32))
+
+    reopened = RenderCache(str(tmp_path), max_bytes=1000)
+    reopened.load()
+    for c in (cache, reopened):
+        entry = c.get("a")
+        np.testing.assert_array_equal(entry.audio, audio)
+        assert (entry.tokens, entry.num_hits, entry.generation_time, entry.events) == ("tokens of a", 7, 0.5, None)
+        assert len(c.get("empty").audio) == 0
+    assert cache.get("b") is None
+
+
+def test_least_recently_used_entries_are_evicted_past_max_bytes(tmp_path):
+    cache = RenderCache(str(tmp_path), max_bytes=100)  # 25 samples
+    cache.load()
+    for key in "abc":
+        put(cache, key, np.ones(10, dtype=np.float32))
+    assert cache.get("a") is None  # evicted to fit c
+    assert cache.get("b") is not None  # b is now more recent than c
+    put(cache, "d", np.ones(10, dtype=np.float32))
+    assert cache.get("c") is None and cache.get("b") is not None and cache.get("d") is not None
+    assert sorted(os.listdir(tmp_path)) == ["b.f32", "b.json", "d.f32", "d.json"]
+    assert cache.writer("e", num_samples=26, tokens="", num_hits=0, generation_time=0) is None
+
+
+def test_an_incomplete_render_is_not_kept(tmp_path):
+    cache = RenderCache(str(tmp_path), max_bytes=1000)
+    cache.load()
+    writer = cache.writer("a", num_samples=10, tokens="", num_hits=0, generation_time=0)
+    writer.write(np.ones(4, dtype=np.float32))
+    writer.close()
+    assert cache.get("a") is None and os.listdir(tmp_path) == []
+
+
+def test_keys_change_with_the_seed_the_params_and_the_salt():
+    cache = RenderCache("unused", max_bytes=0)
+    key = cache.make_key({"tempo": 120, "maxSubd": 2}, 1)
+    assert key == cache.make_key({"maxSubd": 2, "tempo": 120}, 1)
+    assert key != cache.make_key({"tempo": 120, "maxSubd": 2}, 2)
+    assert key != cache.make_key({"tempo": 121, "maxSubd": 2}, 1)
+    cache.load(salt="another sample bank")
+    assert key != cache.make_key({"tempo": 120, "maxSubd": 2}, 1)
+
+
+def test_a_repeated_seeded_request_streams_the_same_audio_from_the_cache(serve):
+    def hits():
+        return metrics.RENDER_CACHE_LOOKUPS._values.get(("hit",), 0)
+
+    async def main(client):
+        first = await client.post("/api/generate/", json=BODY)
+        key = server.GenerateRequest.parse(BODY).cache_key()
+        for _ in range(200):
+            if key not in server.flights:
+                break
+            await asyncio.sleep(0.01)
+        before = hits()
+        second = await client.post("/api/generate/", json=BODY)
+        return first, second, hits() - before
+
+    first, second, new_hits = serve(main)
+    assert first.status_code == second.status_code == 200
+    assert new_hits == 1
+    assert first.content == second.content
+    assert first.headers["x-audio-id"] != second.headers["x-audio-id"]
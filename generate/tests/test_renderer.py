@@ -0,0 +1,47 @@
+# test_renderer.py
+import numpy as np
+
+from renderer import TiledRenderer, make_events
+
+
+def sample_source(note: int, sample: int, length: int, variant: int) -> np.ndarray:
+    # a distinct ramp per hit, so a hit mixed at the wrong offset shows
+    return (np.arange(length, dtype=np.float32) + 1) * (note + 1) / (sample + 1) / (variant + 1)
+
+
+def naive_mix(events, total_length: int) -> np.ndarray:
+    out = np.zeros(total_length, dtype=np.float32)
+    for start, length, note, sample, _, variant in events.tolist():
+        end = min(start + length, total_length)
+        out[start:end] += sample_source(note, sample, length, variant)[:end - start]
+    return out
+
+
+# overlapping hits, hits across tile edges, one running past the end
+EVENTS = make_events([
+    (0, 40, 0, 0, 1.0, 0), (5, 10, 1, 2, 1.0, 1), (95, 30, 2, 1, 1.0, 0),
+    (99, 3, 0, 3, 1.0, 2), (150, 120, 3, 0, 1.0, 0), (240, 50, 4, 1, 1.0, 1),
+])
+
+
+def test_tiles_match_a_naive_mix():
+    renderer = TiledRenderer(sample_source, tile_size=32)
+    out = renderer.render(np.full(260, np.nan, dtype=np.float32), EVENTS)
+    np.testing.assert_allclose(out, naive_mix(EVENTS, 260), rtol=1e-6)
+    offsets = [offset for offset, _ in renderer.iter_tiles(EVENTS, 260)]
+    assert offsets == list(range(0, 260, 32))
+
+
+def test_tiles_from_an_offset_include_hits_started_before_it():
+    renderer = TiledRenderer(sample_source, tile_size=32)
+    tiles = list(renderer.iter_tiles(EVENTS, 260, start=100))
+    assert tiles[0][0] == 100
+    np.testing.assert_allclose(np.concatenate([tile for _, tile in tiles]), naive_mix(EVENTS, 260)[100:], rtol=1e-6)
+
+
+def test_render_range_only_touches_the_range():
+    renderer = TiledRenderer(sample_source, tile_size=32)
+    out = np.full(260, -1.0, dtype=np.float32)
+    renderer.render_range(out, EVENTS, 90, 160)
+    np.testing.assert_allclose(out[90:160], naive_mix(EVENTS, 260)[90:160], rtol=1e-6)
+    assert (out[:90] == -1).all() and (out[160:] == -1).all()
@@ -0,0 +1,45 @@
+# test_replay.py
+import io
+
+import numpy as np
+import soundfile as sf
+
+import derbake
+import server
+
+SKELETON = [[1, "D"], [1, "OTA"], [0.5, "D"], [1.5, "OTA"]]
+MATRIX = [[1, 2, 1, 0], [10, 20, 10, 10], [10, 10, 30, 10], [10, 10, 10, 10], [10, 5, 10, 10], [0, 0, 0, 0]]
+
+
+def test_replay_streams_the_original_audio(serve):
+    async def main(client):
+        response = await client.post("/api/generate/", json={"skeleton": SKELETON, "matrix": MATRIX, "seed": 5})
+        staged = await server.staging.get(response.headers["x-audio-id"])
+        replayed = await client.post("/api/generate/replay", content=staged.derbake)
+        return response.content, staged.derbake, replayed
+
+    original, data, replayed = serve(main)
+    assert data[:4] == derbake.MAGIC and derbake.loads(data).samples is not None
+    assert replayed.status_code == 200
+    np.testing.assert_array_equal(
+        sf.read(io.BytesIO(replayed.content), dtype="float32")[0], sf.read(io.BytesIO(original), dtype="float32")[0]
+    )
+
+
+def test_oversized_replay_is_refused_before_planning(serve, monkeypatch):
+    def replay_plan(*args):
+        raise AssertionError("planned")
+
+    async def main(client):
+        monkeypatch.setattr(server.generator, "replay_plan", replay_plan)
+        monkeypatch.setattr(server.admission, "max_request_hits", 100)
+        # one beat of a tempo this slow lasts for days
+        slow = await client.post("/api/generate/replay", content=b"120.0\n0.001\nDELAY_1 HIT_D DEV_0\n")
+        hits = " ".join(["SUBD_1"] + ["HIT_D AMP_0.5"] * 101)
+        crowded = await client.post("/api/generate/replay", content=f"120.0\n120.0\nDELAY_1 HIT_D DEV_0\n{hits}".encode())
+        return slow, crowded, server.admission.in_flight
+
+    slow, crowded, in_flight = serve(main)
+    assert slow.status_code == 400 and "samples" in slow.text
+    assert crowded.status_code == 400 and "hits" in crowded.text
+    assert in_flight == 0
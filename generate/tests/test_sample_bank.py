@@ -0,0 +1,39 @@
+# test_sample_bank.py
+import numpy as np
+import pytest
+
+from sample_manager import SampleManager, cross_fade
+
+AMPLITUDES = [0.1, 0.5, 1.0]
+
+
+def make_manager() -> SampleManager:
+    manager = SampleManager()
+    rng = np.random.default_rng(0)
+    manager.AUDIO_SOUNDS = {
+        "D": {1: (3000, rng.uniform(-1, 1, 3000)), 2: (40, rng.uniform(-1, 1, 40))},
+        "OTA": {1: (1500, rng.uniform(-1, 1, 1500))},
+    }
+    return manager
+
+
+def test_every_variant_is_precomputed_once():
+    manager = make_manager()
+    raw = {(note, num): np.asarray(y, dtype=np.float32)
+           for note, sounds in manager.AUDIO_SOUNDS.items() for num, (_, y) in sounds.items()}
+    manager.build_bank(AMPLITUDES)
+
+    for (note, num), y in raw.items():
+        for variant, amplitude in enumerate(AMPLITUDES):
+            np.testing.assert_allclose(manager.get_hit(note, num, variant), amplitude * cross_fade(y), rtol=1e-6)
+        np.testing.assert_allclose(manager.get_hit(note, num, manager.skeleton_variant), AMPLITUDES[-1] * y)
+        np.testing.assert_array_equal(manager.get_hit(note, num, manager.raw_variant), y)
+        # raw samples are views into the bank, not a second copy
+        assert np.shares_memory(manager.AUDIO_SOUNDS[note][num][1], manager.BANK)
+
+
+def test_the_bank_is_read_only():
+    manager = make_manager()
+    manager.build_bank(AMPLITUDES)
+    with pytest.raises(ValueError):
+        manager.get_hit("D", 1, 0)[0] = 1
@@ -0,0 +1,45 @@
+# test_singleflight.py
+import asyncio
+
+import numpy as np
+
+from singleflight import SingleFlight, SpillWriter
+
+
+def test_subscribers_read_a_render_in_progress(tmp_path):
+    audio = np.arange(1000, dtype=np.float32)
+    done = []
+
+    async def produce(flight):
+        writer = SpillWriter(str(tmp_path / "flight.f32"))
+        flight.open(writer.path, num_samples=len(audio))
+        try:
+            for start in range(0, len(audio), 100):
+                await flight.run_io(writer.write, audio[start:start + 100])
+                await flight.run_io(writer.flush)
+                await flight.advance(100)
+                await asyncio.sleep(0.001)
+        finally:
+            writer.close()
+            done.append(True)
+
+    async def listen(flights):
+        flight, started = flights.join("key", produce)
+        try:
+            await flight.wait_ready()
+            chunks = [chunk async for chunk in flight.read(64)]
+        finally:
+            flight.release()
+        return started, np.frombuffer(b"".join(chunks), dtype=np.float32)
+
+    async def main():
+        flights = SingleFlight(io_threads=1)
+        results = await asyncio.gather(*(listen(flights) for _ in range(3)))
+        await asyncio.sleep(0.05)  # the producer task winds down after its last advance
+        return results, len(flights)
+
+    results, in_progress = asyncio.run(main())
+    assert [started for started, _ in results] == [True, False, False]
+    for _, samples in results:
+        np.testing.assert_array_equal(samples, audio)
+    assert done == [True] and in_progress == 0
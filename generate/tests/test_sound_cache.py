@@ -0,0 +1,55 @@
+# test_sound_cache.py
+import asyncio
+
+from sound_cache import SoundCache
+
+
+def make_cache(rows: dict, loads: list, missing_ttl: float = 60) -> SoundCache:
+    async def load(sound_id: str):
+        loads.append(sound_id)
+        return rows.get(sound_id)
+
+    return SoundCache(load, max_entries=2, ttl=60, missing_ttl=missing_ttl)
+
+
+def test_sounds_are_loaded_once_until_invalidated():
+    rows, loads = {"s1": {"id": "s1", "url": "u1"}}, []
+    cache = make_cache(rows, loads)
+
+    async def main():
+        first, again = await cache.get("s1"), await cache.get("s1")
+        rows["s1"] = {"id": "s1", "url": "u2"}
+        cache.invalidate("s1")
+        return first, again, await cache.get("s1")
+
+    first, again, changed = asyncio.run(main())
+    assert first is again and loads == ["s1", "s1"]
+    assert changed.etag != first.etag and b'"u2"' in changed.body
+
+
+def test_missing_sounds_are_remembered_briefly():
+    rows, loads = {}, []
+    cache = make_cache(rows, loads, missing_ttl=0.05)
+
+    async def main():
+        missing = [await cache.get("s1"), await cache.get("s1")]
+        # saved by another worker, this one never invalidates it
+        rows["s1"] = {"id": "s1", "url": "u1"}
+        await asyncio.sleep(0.06)
+        return missing, await cache.get("s1")
+
+    missing, found = asyncio.run(main())
+    assert missing == [None, None] and loads == ["s1", "s1"]
+    assert found is not None
+
+
+def test_least_recently_used_sounds_are_dropped():
+    rows, loads = {name: {"id": name} for name in ("s1", "s2", "s3")}, []
+    cache = make_cache(rows, loads)
+
+    async def main():
+        for name in ("s1", "s2", "s1", "s3", "s1", "s2"):
+            await cache.get(name)
+
+    asyncio.run(main())
+    assert loads == ["s1", "s2", "s3", "s2"]
@@ -0,0 +1,80 @@
+# test_staging.py
+import asyncio
+import os
+import time
+
+import numpy as np
+
+from renderer import make_events
+from staging import StagedGeneration, StagingStore
+
+
+def staged(n: int) -> StagedGeneration:
+    return StagedGeneration(metadata={"id": n, "tempo": 120}, derbake=bytes([n]) * 100,
+                            events=make_events([(n, 10, 0, 1, 1.0, 0)]))
+
+
+def assert_same(a: StagedGeneration, b: StagedGeneration):
+    assert a.metadata == b.metadata and a.derbake == b.derbake
+    np.testing.assert_array_equal(a.events, b.events)
+
+
+def test_the_oldest_entries_spill_to_disk_and_read_back(tmp_path):
+    async def main():
+        store = StagingStore(str(tmp_path), max_bytes=2500, ttl=60)
+        store.start()
+        for n in range(3):
+            await store.put(f"g{n}", staged(n))
+        spilled = sorted(os.listdir(tmp_path))
+        got = [await store.get(f"g{n}") for n in range(3)]
+        await store.close()
+        return store.memory_bytes, spilled, got
+
+    memory_bytes, spilled, got = asyncio.run(main())
+    # each entry takes about 1.2 kB, so only the newest two fit
+    assert spilled == ["g0.derbake", "g0.events.npy", "g0.json"]
+    assert memory_bytes == 0  # all spilled on close
+    for n, entry in enumerate(got):
+        assert_same(entry, staged(n))
+
+
+def test_spilled_entries_survive_a_restart_until_they_expire(tmp_path):
+    async def first_run():
+        store = StagingStore(str(tmp_path), max_bytes=10 ** 6, ttl=60)
+        store.start()
+        await store.put("kept", staged(1))
+        await store.put("old", staged(2))
+        await store.close()
+
+    async def second_run():
+        store = StagingStore(str(tmp_path), max_bytes=10 ** 6, ttl=60)
+        store.start()
+        got = await store.get("kept"), "old" in store
+        await store.close()
+        return got
+
+    asyncio.run(first_run())
+    old = time.time() - 120
+    for extension in (".json", ".derbake", ".events.npy"):
+        os.utime(tmp_path / f"old{extension}", (old, old))
+    kept, old_known = asyncio.run(second_run())
+    assert_same(kept, staged(1))
+    assert not old_known
+    assert sorted(os.listdir(tmp_path)) == ["kept.derbake", "kept.events.npy", "kept.json"]
+
+
+def test_expired_and_discarded_entries_are_gone(tmp_path):
+    async def main():
+        store = StagingStore(str(tmp_path), max_bytes=1500, ttl=60)
+        store.start()
+        await store.put("spilled", staged(1))
+        await store.put("memory", staged(2))
+        assert len(os.listdir(tmp_path)) == 3
+        store.discard("spilled")
+        assert os.listdir(tmp_path) == []
+        store.sweep(time.time() + 61)
+        got = await store.get("memory")
+        await store.close()
+        return got, store.memory_bytes
+
+    assert asyncio.run(main()) == (None, 0)
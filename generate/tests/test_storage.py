@@ -0,0 +1,60 @@
+# test_storage.py
+import asyncio
+import os
+
+import pytest
+
+from exceptions import StorageError
+from storage import FilesystemObjectStore, SQLiteDatabaseManager
+
+
+def test_filesystem_objects_are_written_whole_and_served_from_the_base_url(tmp_path):
+    store = FilesystemObjectStore(str(tmp_path / "objects"), "http://localhost:3001/objects/")
+    source = tmp_path / "source.wav"
+    source.write_bytes(b"RIFF")
+
+    async def main():
+        file_url = await store.upload_file(str(source), "sounds/a.wav", "audio/wav")
+        bytes_url = await store.upload_bytes(b"derbake", "sounds/a.derbake")
+        batch = await store.upload_files_batch({str(source): "sounds/b.wav", str(tmp_path / "missing"): "sounds/c.wav"})
+        return file_url, bytes_url, batch, await store.exists("sounds/a.wav"), await store.exists("sounds/c.wav")
+
+    file_url, bytes_url, batch, a_exists, c_exists = asyncio.run(main())
+    assert file_url == "http://localhost:3001/objects/sounds/a.wav"
+    assert bytes_url == "http://localhost:3001/objects/sounds/a.derbake"
+    assert batch == {str(source): "http://localhost:3001/objects/sounds/b.wav", str(tmp_path / "missing"): None}
+    assert a_exists and not c_exists
+    assert (tmp_path / "objects" / "sounds" / "a.derbake").read_bytes() == b"derbake"
+    # the failed copy left no half-written object behind
+    assert sorted(os.listdir(tmp_path / "objects" / "sounds")) == ["a.derbake", "a.wav", "b.wav"]
+
+
+@pytest.mark.parametrize("key", ["../outside.wav", "/etc/passwd", "sounds/../../outside.wav"])
+def test_keys_cannot_escape_the_object_store(tmp_path, key):
+    store = FilesystemObjectStore(str(tmp_path / "objects"), "http://localhost")
+    with pytest.raises(StorageError):
+        asyncio.run(store.upload_bytes(b"x", key))
+    assert not (tmp_path / "outside.wav").exists()
+
+
+def test_sqlite_sounds_round_trip(tmp_path):
+    db = SQLiteDatabaseManager(str(tmp_path / "db" / "sounds.db"))
+
+    async def main():
+        await db.start()
+        try:
+            await db.save_sound("s1", "user-1", {"tempo": 120, "skeleton": [[1, "D"]]}, "http://x/s1.wav")
+            rows = [{"id": f"s{n}", "generated_by": "user-2", "settings": {"n": n}, "url": f"http://x/s{n}.wav"}
+                    for n in (1, 2, 3)]
+            await db.save_sounds(rows)
+            await db.save_sounds(rows)  # a retried batch
+            with pytest.raises(StorageError):
+                await db.save_sound("s2", "user-1", {}, "http://x/again.wav")
+            return [await db.get_sound(sound_id) for sound_id in ("s1", "s2", "s3", "s4")]
+        finally:
+            await db.close()
+
+    s1, s2, s3, s4 = asyncio.run(main())
+    assert (s1.generated_by, s1.settings, s1.url) == ("user-1", {"tempo": 120, "skeleton": [[1, "D"]]}, "http://x/s1.wav")
+    assert (s2.generated_by, s2.settings) == ("user-2", {"n": 2}) and s3.url == "http://x/s3.wav"
+    assert s4 is None
@@ -0,0 +1,93 @@
+# test_subdivisions.py
+import bisect
+
+import numpy as np
+import pytest
+
+from algorithm import generator
+from sample_manager import sample_manager
+
+NOTES = generator.SUPPORTED_NOTES
+AMPLITUDES = generator.get_amplitudes()
+AMPLITUDES_PROBA = [0.25, 0.5, 0.25]
+
+
+@pytest.fixture(scope="module", autouse=True)
+def samples():
+    if sample_manager.BANK is None:
+        sample_manager.preload_samples(amplitudes=generator.get_amplitudes())
+
+
+def pick(weights, draw: float) -> int:
+    # random.choices: the first cumulative weight above draw * total
+    cumulative = np.cumsum(weights).tolist()
+    return min(bisect.bisect_right(cumulative, draw * cumulative[-1]), len(weights) - 1)
+
+
+def loop_subdivisions(total_length, maxsubd, skeleton, hit_probabilities, subdiv_proba, tempos, draws, sr=48000):
+    """
+    The subdivision walk as it was written before planning was vectorized, one beat and
+    one step at a time, with every random.* call replaced by the draw plan_subdivisions uses.
+    """
+    slot_width = len(NOTES) + 3
+    events, tokens = [], []
+    curr_sample = beat = 0
+    while curr_sample < total_length:
+        tempo = tempos[min(beat, len(tempos) - 1)]
+        beat_length = int(60 * sr / tempo)
+        subd_index = pick(subdiv_proba, draws[beat, 0])
+        div = maxsubd - subd_index
+        step_lengths = [beat_length // div] * (div - 1)
+        step_lengths.append(beat_length - sum(step_lengths))
+        tokens.append(f"SUBD_{div}")
+        weights = [hit_probabilities[subd_index][note] for note in NOTES]
+        for step in range(div):
+            if curr_sample >= total_length:
+                break
+            slot = draws[beat, 1 + step * slot_width:1 + (step + 1) * slot_width]
+            hit = NOTES[pick([d * w for d, w in zip(slot[:len(NOTES)], weights)], slot[len(NOTES)])]
+            amplitude = pick(AMPLITUDES_PROBA, slot[len(NOTES) + 1])
+            on_skeleton = any(start <= curr_sample < end for start, end in skeleton)
+            if hit != "S" and not on_skeleton:
+                nums = list(sample_manager.AUDIO_SOUNDS[hit])
+                sample = nums[min(int(slot[len(NOTES) + 2] * len(nums)), len(nums) - 1)]
+                events.append((curr_sample, NOTES.index(hit), sample, amplitude))
+            tokens += [f"HIT_{hit if not on_skeleton else 'S'}", f"AMP_{AMPLITUDES[amplitude]}"]
+            curr_sample += step_lengths[step]
+        beat += 1
+    return events, " ".join(tokens)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 7])
+def test_vectorized_plan_matches_the_loop(seed):
+    maxsubd = 4
+    subdiv_proba = [1, 2, 3, 1]
+    hit_probabilities = [dict(zip(NOTES, weights)) for weights in
+                         ([4, 3, 2, 1, 2], [1, 1, 1, 1, 1], [0, 5, 5, 0, 1], [2, 0, 1, 3, 0])]
+    tempos = [120, 118.5, 121.25, 119, 122, 120]
+    total_length = 48000 * 3 + 1234
+    skeleton = [(0, 9000), (24000, 30000), (70000, 96000)]
+
+    events, _, tokens = generator.plan_subdivisions(
+        total_length=total_length, maxsubd=maxsubd, added_hits_intervals=skeleton,
+        hit_probabilities=hit_probabilities, subdiv_proba=subdiv_proba, amplitudes=AMPLITUDES,
+        amplitudes_proba_list=AMPLITUDES_PROBA, tempos=tempos, rng=np.random.default_rng(seed),
+    )
+    num_beats = len(generator.beat_grid(total_length, tempos)[0])
+    draws = np.random.default_rng(seed).random((num_beats, 1 + maxsubd * (len(NOTES) + 3)))
+    expected_events, expected_tokens = loop_subdivisions(
+        total_length, maxsubd, skeleton, hit_probabilities, subdiv_proba, tempos, draws
+    )
+
+    assert tokens == expected_tokens
+    assert list(zip(events["start"].tolist(), events["note"].tolist(), events["sample"].tolist(),
+                    events["variant"].tolist())) == expected_events
+    np.testing.assert_array_equal(events["amplitude"], np.asarray(AMPLITUDES, dtype=np.float32)[events["variant"]])
+
+
+def test_no_subdivision_weights_plan_nothing():
+    events, intervals, tokens = generator.plan_subdivisions(
+        total_length=48000, maxsubd=2, added_hits_intervals=[(0, 10)], hit_probabilities=[{"D": 1}] * 2,
+        subdiv_proba=[0, 0], amplitudes=AMPLITUDES, amplitudes_proba_list=AMPLITUDES_PROBA, tempos=[120],
+    )
+    assert len(events) == 0 and intervals == [] and tokens == ""
@@ -1,6 +1,6 @@
-import librosa
 import os
 import random
+from samplebank import load_packed_samples
 # this file contains configuration for generator
 paths = {
     "D": "./sounds/doums",
@@ -14,13 +14,18 @@ paths = {
     "S": "./sounds/silence",
 }
 
+SYMBOLS = ["D", "OTA", "OTI", "PAA", "PA2", "S"]
+
 AUDIO_SOUNDS = {}
 
 
 def save_audio_data(symbol, sr=48000):
+    # slow path, only used when pack_samples.py has not been run
+    import librosa
+
     print("[FETCHING AUDIO] for", symbol)
     directory = paths.get(symbol)
-    files = os.listdir(directory)
+    files = sorted(os.listdir(directory))
     ys = []
     for file in files:
         full_path = os.path.join(directory, file)
@@ -28,9 +33,27 @@ def save_audio_data(symbol, sr=48000):
         ys.append(y)
     return ys
 
-def get_audio_data(symbol, sr=None):
-    return random.choice(AUDIO_SOUNDS[symbol])
+def load_audio_sounds(sr=48000):
+    # the packed bank is memory-mapped read-only, so every worker shares the same pages
+    try:
+        data, index = load_packed_samples()
+    except FileNotFoundError:
+        index = None
+    if index is not None and index["sample_rate"] == sr:
+        print("[LOADING PACKED AUDIO]")
+        for sym in SYMBOLS:
+            AUDIO_SOUNDS[sym] = [
+                data[entry["offset"]:entry["offset"] + entry["length"]]
+                for entry in index["symbols"][sym]
+            ]
+        return
+    for sym in SYMBOLS:
+        AUDIO_SOUNDS[sym] = save_audio_data(sym, sr)
 
-
-for sym in ["D", "OTA", "OTI", "PAA", "PA2", "S"]:
-    AUDIO_SOUNDS[sym] = save_audio_data(sym)
\ No newline at end of file
+def get_audio_data(symbol, sr=None, sample=None):
+    # sample numbers count from 1 in file order, as in the generate service
+    if not AUDIO_SOUNDS:
+        load_audio_sounds()
+    if sample is not None and 1 <= sample <= len(AUDIO_SOUNDS[symbol]):
+        return AUDIO_SOUNDS[symbol][sample - 1]
+    return random.choice(AUDIO_SOUNDS[symbol])
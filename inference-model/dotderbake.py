@@ -1,6 +1,7 @@
 import numpy as np
 from config import get_audio_data
 import soundfile as sf
+import derbake
 
 def apply_cross_fade(hit_audio, fade_samples=500, attack_preserve=0):
     if len(hit_audio) <= fade_samples * 2:
@@ -21,43 +22,50 @@ def apply_cross_fade(hit_audio, fade_samples=500, attack_preserve=0):
 
 
 def play_from_dotderbake(file_path, uuid):
-    with open(file_path, "r") as f:
-        data = f.read()
-
-    lines = data.split("\n")
-
-    if len(lines) < 4:
+    try:
+        record = derbake.read(file_path)
+    except ValueError:
         print("Wrong format")
         return
 
-    initial_tempo = float(lines[0])
-    tempos = [float(i) for i in lines[1].split(" ")]
-    skeleton_tokens = lines[2].split(" ")
-    var_tokens = lines[3].split(" ")
-
-    regenerate(uuid, initial_tempo, tempos, skeleton_tokens, var_tokens)
+    regenerate(uuid, record)
     
     
+def recorded_samples(record):
+    """Sample numbers of the skeleton and variation rows, or Nones when the file has none"""
+    if record.samples is None:
+        return [None] * len(record.skeleton), [None] * len(record.variations)
+    try:
+        skeleton_samples, variation_samples = record.hit_samples()
+    except ValueError:
+        return [None] * len(record.skeleton), [None] * len(record.variations)
+    return skeleton_samples.tolist(), variation_samples.tolist()
+
+
 def subdivisions_regenerator(
-    tokens,
-    tempos,
+    record,
     y,
     added_hits_intervals,
     sr=48000,
 ):
+    tempos = record.tempos
+    variations = record.variations
     # Initialize tempo tracking
     current_tempo = tempos[0]
-    if len(tokens) < 3:
+    if len(variations) < 1:
         return y
         
     added_hits_intervals = sorted(added_hits_intervals, key=lambda x: x[0])
     subdivisions_y = np.zeros(len(y))
+    subds = variations["subd"].tolist()
+    hits = [record.symbols[h] for h in variations["hit"].tolist()]
+    amplitudes = record.amplitudes[variations["amp"]].tolist()
+    _, samples = recorded_samples(record)
 
     curr_sample = 0
     beat_index = 0
-    curr_token = 0
-    chosen_div = int(tokens[curr_token].split("_")[1])
-    curr_token+=1
+    curr_row = 0
+    chosen_div = subds[curr_row]
     # Calculate beat length for current tempo
     beat_length_in_samples = int(60 * sr / current_tempo)
     maxsubd_length_arr = [int(beat_length_in_samples / chosen_div) for _ in range(chosen_div - 1)]
@@ -66,57 +74,53 @@ def subdivisions_regenerator(
     new_added_hits_intervals = []
     
     index_of_curr_subd_in_beat = 0
-    while curr_sample < len(subdivisions_y) and curr_token < len(tokens):
-        try:
-            # Check if we need to update tempo (new beat)
-            if index_of_curr_subd_in_beat == chosen_div:
-                
-                beat_index += 1
-                index_of_curr_subd_in_beat = 0
-                
-                # Update tempo if available
-                if beat_index < len(tempos):
-                    new_tempo = tempos[beat_index]
-                    if new_tempo != current_tempo:
-                        current_tempo = new_tempo
-                    
-                    beat_length_in_samples = int(60 * sr / current_tempo)
-                
-                # Get new random subdivision for the new beat
-                chosen_div = int(tokens[curr_token].split("_")[1])
-                maxsubd_length_arr = [int(beat_length_in_samples / chosen_div) for _ in range(chosen_div - 1)]
-                maxsubd_length_arr.append(beat_length_in_samples - sum(maxsubd_length_arr))
-                curr_token+=1
-
-                
-            remaining = len(subdivisions_y) - curr_sample
-            chosen_hit = tokens[curr_token].split("_")[1]
-            curr_token+=1
-            chosen_amplitude = float(tokens[curr_token].split("_")[1])
-            if chosen_hit == "S":
-                curr_sample += maxsubd_length_arr[index_of_curr_subd_in_beat]
-            else:
-                hit_y_raw = np.asarray(get_audio_data(chosen_hit, sr), dtype=np.float32)
-                add_len = min(len(hit_y_raw), remaining)
-                hit_y = apply_cross_fade(hit_y_raw[:add_len])
-
-                subdivisions_y[curr_sample:curr_sample + add_len] += (
-                    chosen_amplitude * hit_y[:add_len]
-                )
-                new_added_hits_intervals.append(
-                    (curr_sample, curr_sample + add_len)
-                )
-                curr_sample += maxsubd_length_arr[index_of_curr_subd_in_beat]
+    while curr_sample < len(subdivisions_y) and curr_row < len(variations):
+        # Check if we need to update tempo (new beat)
+        if index_of_curr_subd_in_beat == chosen_div:
+            
+            beat_index += 1
+            index_of_curr_subd_in_beat = 0
+            
+            # Update tempo if available
+            if beat_index < len(tempos):
+                new_tempo = tempos[beat_index]
+                if new_tempo != current_tempo:
+                    current_tempo = new_tempo
                 
-            index_of_curr_subd_in_beat += 1
-            curr_token+=1
-        except IndexError:
-            continue
+                beat_length_in_samples = int(60 * sr / current_tempo)
+            
+            # Subdivision of the new beat
+            chosen_div = subds[curr_row]
+            maxsubd_length_arr = [int(beat_length_in_samples / chosen_div) for _ in range(chosen_div - 1)]
+            maxsubd_length_arr.append(beat_length_in_samples - sum(maxsubd_length_arr))
+
+            
+        remaining = len(subdivisions_y) - curr_sample
+        chosen_hit = hits[curr_row]
+        chosen_amplitude = amplitudes[curr_row]
+        if chosen_hit == "S":
+            curr_sample += maxsubd_length_arr[index_of_curr_subd_in_beat]
+        else:
+            hit_y_raw = np.asarray(get_audio_data(chosen_hit, sr, samples[curr_row]), dtype=np.float32)
+            add_len = min(len(hit_y_raw), remaining)
+            hit_y = apply_cross_fade(hit_y_raw[:add_len])
+
+            subdivisions_y[curr_sample:curr_sample + add_len] += (
+                chosen_amplitude * hit_y[:add_len]
+            )
+            new_added_hits_intervals.append(
+                (curr_sample, curr_sample + add_len)
+            )
+            curr_sample += maxsubd_length_arr[index_of_curr_subd_in_beat]
+            
+        index_of_curr_subd_in_beat += 1
+        curr_row += 1
     
     y += subdivisions_y
     return y
 
-def skeleton_regenerator(amplitude, tempos, tokens, sr = 48000):
+def skeleton_regenerator(amplitude, record, sr = 48000):
+    tempos = record.tempos
     # Initialize with first tempo
     current_tempo = tempos[0]
     beat_length_in_samples = int((60 / current_tempo) * sr)
@@ -128,9 +132,10 @@ def skeleton_regenerator(amplitude, tempos, tokens, sr = 48000):
     curr_beat = 0
     tempo_index = 0  # Track which tempo we're using
 
-    curr_token = 0
-    while curr_beat < num_of_beats_in_audio and curr_token < len(tokens):
-        beat_duration = float(tokens[curr_token].split("_")[1]) # delay in beats
+    samples, _ = recorded_samples(record)
+    for (beat_duration, hit, deviation), sample in zip(record.skeleton.tolist(), samples):
+        if curr_beat >= num_of_beats_in_audio:
+            break
         curr_beat += beat_duration
         
         # Update tempo if we've moved to a new beat index
@@ -140,16 +145,14 @@ def skeleton_regenerator(amplitude, tempos, tokens, sr = 48000):
             current_tempo = new_tempo
             beat_length_in_samples = int((60 / current_tempo) * sr)
 
-        curr_token+=1
-        curr_hit = tokens[curr_token].split("_")[1]
+        curr_hit = record.symbols[hit]
         
-        y_hit_raw = np.asarray(get_audio_data(curr_hit, sr), dtype=np.float32)
+        y_hit_raw = np.asarray(get_audio_data(curr_hit, sr, sample), dtype=np.float32)
         y_hit = apply_cross_fade(y_hit_raw)
         
         expected_hit_timestamp += int(beat_duration * beat_length_in_samples)
         
-        curr_token+=1
-        adjusted_hit_timestamp = expected_hit_timestamp + int(tokens[curr_token].split("_")[1])
+        adjusted_hit_timestamp = expected_hit_timestamp + deviation
         end_of_hit_timestamp = adjusted_hit_timestamp + len(y_hit)
         
         # Padding and adding the hit
@@ -159,7 +162,6 @@ def skeleton_regenerator(amplitude, tempos, tokens, sr = 48000):
         
         y[adjusted_hit_timestamp:end_of_hit_timestamp] += amplitude * y_hit
         skeleton_hits_intervals.append((adjusted_hit_timestamp, end_of_hit_timestamp))
-        curr_token+=1
         
     # Return from first hit timestamp
     start_time = skeleton_hits_intervals[0][0] if skeleton_hits_intervals else 0
@@ -169,10 +171,10 @@ def skeleton_regenerator(amplitude, tempos, tokens, sr = 48000):
         skeleton_hits_intervals,
     )
 
-def regenerate(uuid, initial_tempo, tempos, skeleton_tokens, var_tokens, sr=48000):
+def regenerate(uuid, record, sr=48000):
 
     VOLUME = 3
     
-    y_sk, _, skeleton_hits_intervals  = skeleton_regenerator(amplitude=VOLUME, tokens=skeleton_tokens, tempos=tempos)
-    y = subdivisions_regenerator(var_tokens, tempos, y_sk, skeleton_hits_intervals)
-    sf.write(f"tmp/{uuid}.wav", data=y, samplerate=48000)
\ No newline at end of file
+    y_sk, _, skeleton_hits_intervals  = skeleton_regenerator(amplitude=VOLUME, record=record)
+    y = subdivisions_regenerator(record, y_sk, skeleton_hits_intervals)
+    sf.write(f"tmp/{uuid}.wav", data=y, samplerate=48000)
@@ -1,6 +1,7 @@
 from pathlib import Path
 from typing import List, Optional, Tuple
 import json
+import derbake
 
 TEMPO = 120.0
 AMP = 1.5
@@ -250,9 +251,10 @@ def tokens_to_derbake(
     amp: float = AMP,
     skeleton_hit: str = SKELETON_HIT,
     skeleton_dev: int = SKELETON_DEV,
+    version: int = derbake.VERSION,
 ):
     """
-    Convert a list of GPT-generated tokens into a .derbake file.
+    Convert a list of GPT-generated tokens into a .derbake file (binary v2 unless version=1).
     """
     last_idx, tokens = trim_to_last_eoc(tokens)
 
@@ -270,11 +272,7 @@ def tokens_to_derbake(
 
     variations_line = build_variations_line(normalized_beats, amp)
 
-    output_path = Path(output_path)
-    with output_path.open("w", encoding="utf-8") as f:
-        f.write(line1 + "\n")
-        f.write(line2 + "\n")
-        f.write(skeleton_line + "\n")
-        f.write(variations_line)
+    record = derbake.Derbake.from_text("\n".join([line1, line2, skeleton_line, variations_line]))
+    derbake.write(output_path, record, version)
 
     print(f"[tokens_to_derbake] Wrote {len(normalized_beats)} beats to {output_path}")
\ No newline at end of file
@@ -0,0 +1,12 @@
+# pack_samples.py
+"""
+Build step: pack this service's samples into a memory-mappable bank, see samplebank.py.
+
+    python pack_samples.py [--out ./sounds/samples] [--sr 48000]
+"""
+from samplebank import main
+
+if __name__ == "__main__":
+    from config import paths
+
+    main(paths, 48000)
@@ -4,6 +4,7 @@ from dotenv import load_dotenv
 from model import load_model, generate
 from generate_sound import tokens_to_derbake
 from dotderbake import play_from_dotderbake
+from config import load_audio_sounds
 import uuid
 from pathlib import Path
 import re
@@ -225,6 +226,8 @@ if __name__ == "__main__":
     print("[INFER] Loading model...")
     model, tok2id, id2tok, CTX_SIZE = load_model("params.pt", device="cpu")
     print("[INFER] Model loaded")
+    load_audio_sounds()
+    print("[INFER] Samples loaded")
 
     # Create necessary directories
     Path("sessions").mkdir(exist_ok=True)
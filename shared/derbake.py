@@ -0,0 +1,272 @@
+# derbake.py
+"""
+Reader/writer for .derbake files, shared by the generate and inference services.
+
+v1 is the original text format, four lines:
+    <initial tempo>
+    <tempo per beat, space separated>
+    DELAY_<beats> HIT_<symbol> DEV_<samples> ...        (skeleton)
+    SUBD_<n> HIT_<symbol> AMP_<amplitude> ...           (variations)
+
+v2 is binary and mmap-able, every section is padded to 8 bytes:
+    header          HEADER_DTYPE
+    symbols         S8[n_symbols]        hit ids index this table
+    amplitudes      f8[n_amplitudes]     amplitude ids index this table
+    tempos          f8[n_tempos]
+    skeleton        SKELETON_DTYPE[n_skeleton]
+    variations      VARIATION_DTYPE[n_variations], one row per subdivision
+    samples         i4[n_samples]        only with FLAG_SAMPLES, see below
+
+Tempos and delays stay float64 so replays compute exactly the same sample positions.
+
+The tokens say which hit played, not which recording of it. v2 files written with
+FLAG_SAMPLES also carry the sample number of every hit that played: one per skeleton
+row, then one per variation row that is not silent, in order. With those a replay
+picks the same samples and renders the exact same audio. v1 cannot carry them.
+"""
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+
+MAGIC = b"DRBK"
+VERSION = 2
+FLAG_SAMPLES = 1  # the samples section is present
+SILENT = "S"  # the hit symbol that plays nothing
+MAX_SUBD = 255  # subdivisions are stored in one byte
+MAX_IDS = 255  # distinct hits, and distinct amplitudes, ids are stored in one byte
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "S4"),
+    ("version", "<u2"),
+    ("flags", "<u2"),
+    ("initial_tempo", "<f8"),
+    ("n_tempos", "<u8"),
+    ("n_skeleton", "<u8"),
+    ("n_variations", "<u8"),
+    ("n_symbols", "<u2"),
+    ("n_amplitudes", "<u2"),
+    ("n_samples", "<u4"),  # was reserved, 0 in files without samples
+])
+SKELETON_DTYPE = np.dtype([("delay", "<f8"), ("hit", "u1"), ("dev", "<i4")])
+VARIATION_DTYPE = np.dtype([("subd", "u1"), ("hit", "u1"), ("amp", "u1")])
+
+
+def _padded(size: int) -> int:
+    return -(-size // 8) * 8
+
+
+def _number(x: float) -> str:
+    return str(int(x)) if float(x).is_integer() else repr(float(x))
+
+
+@dataclass
+class Derbake:
+    """A parsed .derbake, hits and amplitudes are ids into `symbols`/`amplitudes`"""
+    initial_tempo: float
+    tempos: np.ndarray
+    skeleton: np.ndarray
+    variations: np.ndarray
+    symbols: List[str]
+    amplitudes: np.ndarray
+    samples: Optional[np.ndarray] = None  # sample number of every hit that played, or None
+
+    def hit_samples(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Sample numbers of the skeleton rows, and of the variation rows (-1 where silent)"""
+        if self.samples is None:
+            raise ValueError("No sample numbers recorded")
+        silent = self.symbols.index(SILENT) if SILENT in self.symbols else -1
+        played = self.variations["hit"] != silent
+        if len(self.samples) != len(self.skeleton) + int(played.sum()):
+            raise ValueError("Sample numbers do not match the hits")
+        variation_samples = np.full(len(self.variations), -1, dtype=np.int32)
+        variation_samples[played] = self.samples[len(self.skeleton):]
+        return np.asarray(self.samples[:len(self.skeleton)]), variation_samples
+
+    @classmethod
+    def from_text(cls, text: str) -> "Derbake":
+        lines = text.split("\n")
+        if len(lines) < 4:
+            raise ValueError("Wrong format: expected 4 lines")
+
+        symbols: List[str] = []
+        symbol_ids = {}
+        amplitude_ids = {}
+
+        # limited as ids are handed out, a larger id would not fit its byte
+        def symbol_id(token: str) -> int:
+            symbol = token.split("_", 1)[1]
+            if symbol not in symbol_ids:
+                if len(symbols) == MAX_IDS:
+                    raise ValueError(f"More than {MAX_IDS} distinct hits do not fit a .derbake")
+                symbol_ids[symbol] = len(symbols)
+                symbols.append(symbol)
+            return symbol_ids[symbol]
+
+        def amplitude_id(token: str) -> int:
+            amplitude = float(token.split("_", 1)[1])
+            if amplitude not in amplitude_ids:
+                if len(amplitude_ids) == MAX_IDS:
+                    raise ValueError(f"More than {MAX_IDS} distinct amplitudes do not fit a .derbake")
+                amplitude_ids[amplitude] = len(amplitude_ids)
+            return amplitude_ids[amplitude]
+
+        tempos = np.array([float(t) for t in lines[1].split()], dtype=np.float64)
+
+        skeleton_tokens = lines[2].split()
+        skeleton = np.empty(len(skeleton_tokens) // 3, dtype=SKELETON_DTYPE)
+        skeleton["delay"] = [float(t.split("_", 1)[1]) for t in skeleton_tokens[0::3]][:len(skeleton)]
+        skeleton["hit"] = [symbol_id(t) for t in skeleton_tokens[1::3]][:len(skeleton)]
+        skeleton["dev"] = [int(t.split("_", 1)[1]) for t in skeleton_tokens[2::3]][:len(skeleton)]
+
+        rows = []
+        subd = 0
+        var_tokens = lines[3].split()
+        i = 0
+        while i < len(var_tokens):
+            token = var_tokens[i]
+            if token.startswith("SUBD_"):
+                subd = int(token.split("_", 1)[1])
+                if not 0 <= subd <= MAX_SUBD:
+                    raise ValueError(f"SUBD_{subd} does not fit a .derbake, at most {MAX_SUBD} subdivisions")
+                i += 1
+                continue
+            if i + 1 >= len(var_tokens):
+                break
+            rows.append((subd, symbol_id(token), amplitude_id(var_tokens[i + 1])))
+            i += 2
+        variations = np.array(rows, dtype=VARIATION_DTYPE)
+        return cls(
+            initial_tempo=float(lines[0]),
+            tempos=tempos,
+            skeleton=skeleton,
+            variations=variations,
+            symbols=symbols,
+            amplitudes=np.array(list(amplitude_ids), dtype=np.float64),
+        )
+
+    def to_text(self) -> str:
+        symbols = [f"HIT_{symbol}" for symbol in self.symbols]
+        amplitudes = [f"AMP_{float(a)!r}" for a in self.amplitudes]
+
+        skeleton_tokens = []
+        for delay, hit, dev in self.skeleton.tolist():
+            skeleton_tokens += [f"DELAY_{_number(delay)}", symbols[hit], f"DEV_{dev}"]
+
+        var_tokens = []
+        remaining = 0
+        for subd, hit, amp in self.variations.tolist():
+            if remaining == 0:
+                var_tokens.append(f"SUBD_{subd}")
+                remaining = subd
+            var_tokens += [symbols[hit], amplitudes[amp]]
+            remaining -= 1
+
+        return "\n".join([
+            repr(float(self.initial_tempo)),
+            " ".join(repr(float(t)) for t in self.tempos.tolist()),
+            " ".join(skeleton_tokens),
+            " ".join(var_tokens),
+        ])
+
+    @classmethod
+    def from_buffer(cls, buffer) -> "Derbake":
+        """Parse v2 bytes; every array is a zero-copy view into `buffer`"""
+        header = np.frombuffer(buffer, dtype=HEADER_DTYPE, count=1)[0]
+        if header["magic"] != MAGIC or header["version"] != VERSION:
+            raise ValueError("Not a v2 .derbake")
+
+        offset = _padded(HEADER_DTYPE.itemsize)
+
+        def section(dtype, count):
+            nonlocal offset
+            array = np.frombuffer(buffer, dtype=dtype, count=int(count), offset=offset)
+            offset += _padded(array.nbytes)
+            return array
+
+        symbols = section("S8", header["n_symbols"])
+        amplitudes = section("<f8", header["n_amplitudes"])
+        tempos = section("<f8", header["n_tempos"])
+        skeleton = section(SKELETON_DTYPE, header["n_skeleton"])
+        variations = section(VARIATION_DTYPE, header["n_variations"])
+        samples = section("<i4", header["n_samples"]) if header["flags"] & FLAG_SAMPLES else None
+        return cls(
+            initial_tempo=float(header["initial_tempo"]),
+            tempos=tempos,
+            skeleton=skeleton,
+            variations=variations,
+            symbols=[s.decode("ascii") for s in symbols.tolist()],
+            amplitudes=amplitudes,
+            samples=samples,
+        )
+
+    def to_bytes(self) -> bytes:
+        if any(len(s) > 8 for s in self.symbols):
+            raise ValueError("Hit symbols must be at most 8 characters")
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header["magic"] = MAGIC
+        header["version"] = VERSION
+        header["initial_tempo"] = self.initial_tempo
+        header["n_tempos"] = len(self.tempos)
+        header["n_skeleton"] = len(self.skeleton)
+        header["n_variations"] = len(self.variations)
+        header["n_symbols"] = len(self.symbols)
+        header["n_amplitudes"] = len(self.amplitudes)
+        sections = [
+            header,
+            np.array([s.encode("ascii") for s in self.symbols], dtype="S8"),
+            np.asarray(self.amplitudes, dtype="<f8"),
+            np.asarray(self.tempos, dtype="<f8"),
+            np.asarray(self.skeleton, dtype=SKELETON_DTYPE),
+            np.asarray(self.variations, dtype=VARIATION_DTYPE),
+        ]
+        if self.samples is not None:
+            header["flags"] |= FLAG_SAMPLES
+            header["n_samples"] = len(self.samples)
+            sections.append(np.asarray(self.samples, dtype="<i4"))
+
+        parts = []
+        for array in sections:
+            data = array.tobytes()
+            parts.append(data + b"\0" * (_padded(len(data)) - len(data)))
+        return b"".join(parts)
+
+
+def loads(data: Union[bytes, str]) -> Derbake:
+    """Parse either version from memory"""
+    if isinstance(data, (bytes, bytearray, memoryview)) and bytes(data[:4]) == MAGIC:
+        return Derbake.from_buffer(data)
+    if not isinstance(data, str):
+        data = bytes(data).decode("utf-8")
+    return Derbake.from_text(data)
+
+
+def dumps(record: Derbake, version: int = VERSION) -> bytes:
+    if version == 1:
+        return record.to_text().encode("utf-8")
+    return record.to_bytes()
+
+
+def convert(tokens: str, version: int = VERSION, samples: Optional[np.ndarray] = None) -> bytes:
+    """Encode a v1 token string as `version`, v2 with the sample number of every played hit if given"""
+    if version == 1:
+        return tokens.encode("utf-8")
+    record = Derbake.from_text(tokens)
+    record.samples = samples
+    return record.to_bytes()
+
+
+def read(path: Union[str, os.PathLike]) -> Derbake:
+    """Read either version; v2 files are memory-mapped rather than read"""
+    with open(path, "rb") as f:
+        magic = f.read(len(MAGIC))
+    if magic == MAGIC:
+        return Derbake.from_buffer(np.memmap(path, dtype=np.uint8, mode="r"))
+    with open(path, "r", encoding="utf-8") as f:
+        return Derbake.from_text(f.read())
+
+
+def write(path: Union[str, os.PathLike], record: Derbake, version: int = VERSION):
+    with open(path, "wb") as f:
+        f.write(dumps(record, version))
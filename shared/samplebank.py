@@ -0,0 +1,69 @@
+# samplebank.py
+"""
+Build step: decode and resample every sample once, then pack all of them into a
+single contiguous float32 .npy plus a JSON index of offsets/lengths per symbol.
+Services np.load(..., mmap_mode="r") the result at startup instead of running
+librosa, and every worker process shares the same page-cache pages.
+
+Each service's pack_samples.py runs main() with its own sample paths:
+
+    python pack_samples.py [--out ./sounds/samples] [--sr 48000]
+"""
+import argparse
+import json
+import os
+from typing import Dict, Tuple
+
+import numpy as np
+
+DEFAULT_PREFIX = "./sounds/samples"
+
+
+def pack_samples(paths: Dict[str, str], out_prefix: str = DEFAULT_PREFIX, sr: int = 48000) -> dict:
+    """
+    Write `<out_prefix>.npy` and `<out_prefix>.json`. Symbols sharing a directory share their samples.
+    """
+    import librosa
+
+    chunks = []
+    offset = 0
+    by_directory = {}
+    symbols = {}
+    for symbol, directory in paths.items():
+        if directory not in by_directory:
+            entries = []
+            for file in sorted(os.listdir(directory)):
+                y, _ = librosa.load(os.path.join(directory, file), sr=sr)
+                y = np.asarray(y, dtype=np.float32)
+                entries.append({"file": file, "offset": offset, "length": len(y)})
+                chunks.append(y)
+                offset += len(y)
+            by_directory[directory] = entries
+        symbols[symbol] = by_directory[directory]
+
+    data = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+    np.save(f"{out_prefix}.npy", data)
+    index = {"sample_rate": sr, "symbols": symbols}
+    with open(f"{out_prefix}.json", "w") as f:
+        json.dump(index, f)
+    return index
+
+
+def load_packed_samples(prefix: str = DEFAULT_PREFIX) -> Tuple[np.ndarray, dict]:
+    """Memory-map a packed bank. Raises FileNotFoundError when it was never built."""
+    with open(f"{prefix}.json") as f:
+        index = json.load(f)
+    data = np.load(f"{prefix}.npy", mmap_mode="r")
+    return data, index
+
+
+def main(paths: Dict[str, str], sr: int = 48000):
+    """Command line of the services' pack_samples.py"""
+    parser = argparse.ArgumentParser(description="Pack the sample library into a memory-mappable bank")
+    parser.add_argument("--out", default=DEFAULT_PREFIX)
+    parser.add_argument("--sr", type=int, default=sr)
+    args = parser.parse_args()
+
+    index = pack_samples(paths, args.out, args.sr)
+    counts = {symbol: len(entries) for symbol, entries in index["symbols"].items()}
+    print(f"Packed {counts} at {args.sr} Hz into {args.out}.npy")